@@ -3,6 +3,7 @@ from .core import (
     PLAYER_SIZE,
     ROTATOR_SIZE,
     DEFAULT_SPEED,
+    MAX_PLAYERS,
 
     Team,
     color_names,
@@ -16,8 +17,10 @@ from .core import (
     VerticalLine,
     HorizontalLine,
     Sphere,
+    SpherePool,
     PlayerSphere,
     RotatorSphere,
     Burst,
 )
-from .game import Game
\ No newline at end of file
+from .game import Game
+from .snapshot import GameSnapshot
\ No newline at end of file
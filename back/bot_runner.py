@@ -0,0 +1,180 @@
+'''Asking the bots for their actions, timed and with a deadline
+
+Game.update hands every frame to a BotRunner, which asks every bot for its
+action and measures how long get_action took. BotStats of every player
+(the bots themselves are recreated every round) give the mean and the
+99th percentile of these times, the latter rounded up to a bucket bound.
+
+With a deadline every bot has that many seconds per frame to answer, a
+later answer counts as no press. In the game's process a bot can't be
+interrupted, so a slow bot still holds up the frame, only its answer is
+dropped. With workers > 0 the bots live in worker processes: each frame the
+game sends them a GameSnapshot, the workers restore it on a copy of the
+game without bots of its own and ask their bots concurrently, and the game
+waits at most until the deadline. The answers are applied in player order
+whatever order they arrive in. This only pays off for bots that take longer
+than a snapshot (about a millisecond), and bots drawing from the global
+random get the worker's draws, not the ones they would get in the game's
+process.
+
+Deadlines make a game depend on how fast the machine is. Replays record
+the presses, so a recorded game still replays the same.
+'''
+from multiprocessing.connection import wait
+from typing import Optional
+import multiprocessing
+import random
+import time
+
+from .profiler import Histogram, TIME_BUCKETS
+from .snapshot import GameSnapshot
+
+import typing
+if typing.TYPE_CHECKING:
+    from .game import Game
+
+
+class BotStats:
+    '''get_action times of the bots of one player, in seconds
+
+    The times go into a fixed-bucket Histogram (see profiler.py) in
+    microseconds, so memory doesn't grow with the length of the game and
+    percentiles are the upper bound of their bucket.
+    '''
+    def __init__(self):
+        self.times = Histogram(TIME_BUCKETS)
+        # answers that came after the deadline
+        self.timeouts = 0
+
+    def add(self, seconds: float):
+        self.times.add(seconds * 1e6)
+
+    @property
+    def calls(self):
+        return self.times.samples
+
+    @property
+    def mean(self):
+        return self.times.mean / 1e6
+
+    def percentile(self, q: float):
+        return self.times.percentile(q) / 1e6
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def summary(self):
+        '''(calls, mean, p99, timeouts), small enough to send back from a worker process'''
+        return self.calls, self.mean, self.p99, self.timeouts
+
+
+def run_worker(connection, colors, indices, seed):
+    from .game import Game
+    # the same roster, but every player is driven by the snapshots
+    game = Game({key: (team, name, None) for key, (team, name, _) in colors.items()}, seed)
+    classes = [bot_class for _, _, bot_class in colors.values()]
+    random.seed(f'{seed} {indices[0]}')
+    bots = []
+    while True:
+        command, data = connection.recv()
+        if command == 'frame':
+            frame, new_round, time_delta, snapshot = data
+            game.restore(GameSnapshot.from_bytes(snapshot))
+            if new_round:
+                bots = [classes[index](game.player_spheres[index]) for index in indices]
+            state = game.get_state()
+            for index, bot in zip(indices, bots):
+                start = time.perf_counter()
+                action = bot.get_action(state, time_delta)
+                connection.send((frame, index, bool(action), time.perf_counter() - start))
+        elif command == 'close':
+            connection.close()
+            return
+
+
+class BotRunner:
+    def __init__(self, game: 'Game', deadline: Optional[float] = None, workers: int = 0):
+        self.game = game
+        self.deadline = deadline
+        self.stats = [BotStats() for _ in range(game.num_players)]
+        self.frame = 0
+        self.connections = []
+        self.processes = []
+        # bot_player_spheres of the round the workers' bots were made for
+        self.round_players = None
+        if workers > 0:
+            bot_indices = [index for index, (_, _, bot_class) in enumerate(game.colors.values()) if bot_class is not None]
+            workers = min(workers, len(bot_indices))
+            for worker in range(workers):
+                connection, worker_connection = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=run_worker, daemon=True,
+                                                  args=(worker_connection, game.colors, bot_indices[worker::workers], game.seed))
+                process.start()
+                worker_connection.close()
+                self.connections.append(connection)
+                self.processes.append(process)
+
+    def get_actions(self, time_delta: float) -> list:
+        '''Keys of the bots that pressed this frame, in player order'''
+        if self.connections:
+            pressed = self.ask_workers(time_delta)
+        else:
+            pressed = self.ask_bots(time_delta)
+        self.frame += 1
+        keys = self.game.keys_list
+        return [keys[index] for index in sorted(pressed)]
+
+    def ask_bots(self, time_delta: float) -> list[int]:
+        game = self.game
+        state = game.get_state()
+        deadline = self.deadline
+        pressed = []
+        for index, player in enumerate(game.player_spheres):
+            if player.bot is None:
+                continue
+            start = time.perf_counter()
+            action = player.bot.get_action(state, time_delta)
+            seconds = time.perf_counter() - start
+            self.stats[index].add(seconds)
+            if deadline is not None and seconds > deadline:
+                self.stats[index].timeouts += 1
+            elif action:
+                pressed.append(index)
+        return pressed
+
+    def ask_workers(self, time_delta: float) -> list[int]:
+        game = self.game
+        new_round = self.round_players is not game.bot_player_spheres
+        self.round_players = game.bot_player_spheres
+        snapshot = game.snapshot().to_bytes()
+        for connection in self.connections:
+            connection.send(('frame', (self.frame, new_round, time_delta, snapshot)))
+        waiting = {index for index, player in enumerate(game.player_spheres) if player.bot is not None}
+        end = None if self.deadline is None else time.perf_counter() + self.deadline
+        pressed = []
+        while waiting:
+            timeout = None if end is None else max(0.0, end - time.perf_counter())
+            ready = wait(self.connections, timeout)
+            if not ready:
+                break
+            for connection in ready:
+                frame, index, action, seconds = connection.recv()
+                # late answers of earlier frames only count for the stats
+                self.stats[index].add(seconds)
+                if frame == self.frame:
+                    waiting.discard(index)
+                    if action:
+                        pressed.append(index)
+        for index in waiting:
+            self.stats[index].timeouts += 1
+        return pressed
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
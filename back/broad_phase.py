@@ -0,0 +1,301 @@
+'''Uniform grid broad-phase for Game
+
+Without it every player is tested against every trail, attacking, active and
+inactive sphere each frame, and every active burst scans all of them too.
+BroadPhase puts those spheres into a SpatialHash once per frame (after they
+moved) and only looks at the cells around a player or a burst.
+
+The grid only decides whether something is close enough to matter. When it
+finds a real overlap, Game's own loop for that list runs unchanged, so the
+order in which spheres are taken and the RNG use stay exactly the same.
+With many players the players themselves go into a grid too, for the
+player/player collisions (see collide_players). The active bursts look at
+their cells all at once, with one array test for all their candidates (see
+burst_candidates).
+'''
+import itertools
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+from pygame import Vector2
+
+from .core import PLAYER_SIZE, SPHERE_SIZE, Sphere, Burst
+
+import typing
+if typing.TYPE_CHECKING:
+    from .game import Game
+
+# a player query covers at most 3x3 cells
+CELL_SIZE = PLAYER_SIZE + SPHERE_SIZE
+
+TRAIL = 0
+ATTACKING = 1
+ACTIVE = 2
+INACTIVE = 3
+
+# with fewer players alive testing every pair is cheaper than putting them into cells
+PLAYER_GRID_MIN = 16
+
+class SpatialHash:
+    '''(kind, owner, sphere) items bucketed by the grid cell the sphere's center is in'''
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells: defaultdict[tuple[int, int], list] = defaultdict(list)
+        self.max_radius = 0
+
+    def clear(self):
+        self.cells.clear()
+        self.max_radius = 0
+
+    def insert(self, item: tuple[int, int, Sphere]):
+        self.insert_many((item,))
+
+    def insert_many(self, items):
+        cells = self.cells
+        cell_size = self.cell_size
+        max_radius = self.max_radius
+        for item in items:
+            sphere = item[2]
+            x, y = sphere.center
+            # whole floats, equal to the ints query() looks up and hashed the same
+            cells[x // cell_size, y // cell_size].append(item)
+            if sphere.radius > max_radius:
+                max_radius = sphere.radius
+        self.max_radius = max_radius
+
+    def keys_around(self, center: Vector2, radius: float) -> list[tuple[int, int]]:
+        '''The cells with items that can intersect a sphere of that center and radius'''
+        reach = radius + self.max_radius
+        x, y = center
+        cell_size = self.cell_size
+        left, top = int((x - reach) // cell_size), int((y - reach) // cell_size)
+        right, bottom = int((x + reach) // cell_size), int((y + reach) // cell_size)
+        cells = self.cells
+        if (right - left + 1) * (bottom - top + 1) > len(cells):
+            # a growing burst covers more cells than there are items in
+            return [key for key in cells if left <= key[0] <= right and top <= key[1] <= bottom]
+        return [key for key in itertools.product(range(left, right + 1), range(top, bottom + 1)) if key in cells]
+
+    def query(self, sphere: Sphere) -> list[tuple[int, int, Sphere]]:
+        '''Items of every sphere that can intersect the given one (and some that can't)'''
+        cells = self.cells
+        items = []
+        for key in self.keys_around(sphere.center, sphere.radius):
+            items += cells[key]
+        return items
+
+
+class BroadPhase:
+    def __init__(self, game: 'Game'):
+        self.game = game
+        self.grid = SpatialHash()
+
+    def rebuild(self):
+        grid = self.grid
+        grid.clear()
+        game = self.game
+        items = []
+        for owner, player in enumerate(game.player_spheres):
+            if player.trail:
+                items += [(TRAIL, owner, sphere) for sphere in player.trail]
+            if len(player.attacking_spheres):
+                items += [(ATTACKING, owner, sphere) for sphere in player.attacking_spheres]
+        items += [(ACTIVE, -1, sphere) for sphere in game.active_spheres]
+        items += [(INACTIVE, -1, sphere) for sphere in game.inactive_spheres]
+        grid.insert_many(items)
+
+    def add_active_sphere(self, sphere: Sphere):
+        self.grid.insert((ACTIVE, -1, sphere))
+
+    def touching(self, sphere: Sphere) -> list[tuple[int, int, Sphere]]:
+        '''(kind, owner, sphere) of indexed spheres that intersect the given one
+
+        Spheres only leave their lists after the grid was built and never move,
+        so entries can be stale but never missing. A stale hit just means
+        Game's loop runs and finds nothing to do.
+        '''
+        items = self.grid.query(sphere)
+        profiler = self.game.profiler
+        if profiler is not None:
+            profiler.count('pairs_tested', len(items))
+        return [item for item in items if sphere.intersects(item[2])]
+
+    def process_bursts(self):
+        '''Game.process_bursts with what every active burst may touch found in one pass
+
+        The bursts are still handled in pool order, and Game's absorb loops
+        test every candidate exactly, so the transfers and the spheres
+        spawned are the same. A burst set off by an earlier one this frame
+        was not in the pass and looks around on its own.
+        '''
+        game = self.game
+        # the bursts are the first to look at the spheres after they moved this frame,
+        # process_collisions reuses the same grid
+        self.rebuild()
+        found = self.burst_candidates([burst for burst in game.bursts if burst.active])
+        # spheres spawned from here on are not in found, but in the grid
+        spawned_from = len(game.active_spheres.slots)
+        for i in game.bursts:
+            if not i.alive: game.bursts.remove(i)
+            i.update()
+            if not i.active: continue
+            if i not in found:
+                self.absorb(i)
+                continue
+            touching, around = found[i]
+            spawned = [(ACTIVE, -1, s) for s in game.active_spheres.slots[spawned_from:] if s is not None]
+            self.absorb(i, touching + spawned, around)
+
+    def burst_candidates(self, bursts: list[Burst]) -> dict[Burst, tuple[list[tuple[int, int, Sphere]], list[Burst]]]:
+        '''The items and the inactive bursts every burst may touch this frame
+
+        The items in the cells around the bursts go into arrays of centers and
+        radii, each sphere once, and every burst is tested against its
+        candidates with the radius it has after growing this frame, all
+        pairs in one array operation. The result can hold a few spheres that
+        end up not touching, never misses one.
+        '''
+        if not bursts:
+            return {}
+        grid = self.grid
+        cells = grid.cells
+        # Burst.update grows the radius before the burst looks around
+        radii = [burst.radius + (burst.grow_rate if burst.frames_from_burst < 40 else 0) for burst in bursts]
+        items = []
+        spans = {}
+        pair_bursts = []
+        pair_items = []
+        for number, (burst, radius) in enumerate(zip(bursts, radii)):
+            for key in grid.keys_around(burst.center, radius):
+                span = spans.get(key)
+                if span is None:
+                    span = spans[key] = range(len(items), len(items) + len(cells[key]))
+                    items += cells[key]
+                pair_items += span
+                pair_bursts += [number] * len(span)
+        profiler = self.game.profiler
+        if profiler is not None:
+            profiler.count('pairs_tested', len(pair_items))
+
+        x = np.array([[burst.center.x for burst in bursts], [burst.center.y for burst in bursts], radii])
+        touching = [[] for _ in bursts]
+        if items:
+            spheres = [item[2] for item in items]
+            y = np.array([[sphere.center.x for sphere in spheres], [sphere.center.y for sphere in spheres],
+                          [sphere.radius for sphere in spheres]])
+            pair_bursts = np.array(pair_bursts)
+            pair_items = np.array(pair_items)
+            hits = self.within(x[:, pair_bursts], y[:, pair_items])
+            for number, index in zip(pair_bursts[hits].tolist(), pair_items[hits].tolist()):
+                touching[number].append(items[index])
+
+        inactive = [burst for burst in self.game.bursts if not burst.active]
+        around = [[] for _ in bursts]
+        if inactive:
+            y = np.array([[burst.center.x for burst in inactive], [burst.center.y for burst in inactive],
+                          [burst.radius for burst in inactive]])
+            hits = self.within(x[:, :, None], y[:, None, :])
+            for number, index in zip(*np.nonzero(hits)):
+                around[number].append(inactive[index])
+        return {burst: (touching[number], around[number]) for number, burst in enumerate(bursts)}
+
+    @staticmethod
+    def within(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        '''Whether the (x, y, radius) circles first and second may intersect, a little generous for rounding'''
+        dx = first[0] - second[0]
+        dy = first[1] - second[1]
+        reach = (first[2] + second[2]) * 1.001
+        return dx * dx + dy * dy <= reach * reach
+
+    def absorb(self, burst: Burst, touching: Optional[list[tuple[int, int, Sphere]]] = None,
+               around: Optional[list[Burst]] = None):
+        '''The absorb loops of Game.process_bursts for one burst, over the candidates given or found in the grid'''
+        game = self.game
+        if touching is None:
+            touching = self.touching(burst)
+        if touching:
+            players = game.player_spheres
+            active = [s for kind, _, s in touching if kind == ACTIVE]
+            if active:
+                game.absorb_active_spheres(burst, active)
+            inactive = [s for kind, _, s in touching if kind == INACTIVE]
+            if inactive:
+                game.absorb_inactive_spheres(burst, inactive)
+            trails = [s for kind, owner, s in touching if kind == TRAIL and players[owner] is not burst.active_player]
+            if trails:
+                game.absorb_trails(burst, trails)
+            attacking = [s for kind, _, s in touching if kind == ATTACKING]
+            if attacking:
+                game.absorb_attacking_spheres(burst, attacking)
+        if around is None or around:
+            game.activate_bursts_around(burst, around)
+
+    def collide_players(self):
+        '''Game.collide_players for every alive player in order, against the players in the cells around it
+
+        Pushing two players apart moves both, so their cells are updated right
+        away, and the player whose turn it is looks again from where it is now
+        for the players after the one it was pushed by. The pairs tested that
+        can touch are the same, in the same order, as in Game's loop over all
+        of them.
+        '''
+        game = self.game
+        players = game.player_spheres
+        alive = [index for index, sphere in enumerate(players) if sphere.alive]
+        if len(alive) < PLAYER_GRID_MIN:
+            for index in alive:
+                game.collide_players(index, players[index])
+            return
+        # a little more than the largest distance two touching players can be apart, for rounding
+        reach = 2 * max(players[index].radius for index in alive) * 1.001
+        cells: defaultdict[tuple[int, int], list[int]] = defaultdict(list)
+        where = {}
+        for index in alive:
+            x, y = players[index].center
+            where[index] = int(x // reach), int(y // reach)
+            cells[where[index]].append(index)
+
+        def move(index):
+            x, y = players[index].center
+            cell = int(x // reach), int(y // reach)
+            if cell != where[index]:
+                cells[where[index]].remove(index)
+                cells[cell].append(index)
+                where[index] = cell
+
+        profiler = game.profiler
+        for index in alive:
+            sphere = players[index]
+            after = index
+            while after is not None:
+                cx, cy = where[index]
+                candidates = [other for x in (cx - 1, cx, cx + 1) for y in (cy - 1, cy, cy + 1)
+                              for other in cells.get((x, y), ()) if other > after]
+                candidates.sort()
+                if profiler is not None:
+                    profiler.count('pairs_tested', len(candidates))
+                after = None
+                for other in candidates:
+                    if game.collide_pair(sphere, players[other]):
+                        move(index)
+                        move(other)
+                        after = other
+                        break
+
+    def process_collisions(self):
+        game = self.game
+        game.collide_all_players()
+        for index, sphere in enumerate(game.player_spheres):
+            if not sphere.alive: continue
+            touching = self.touching(sphere)
+            if touching and not sphere.is_dodging():
+                if any(kind in (TRAIL, ATTACKING) and owner != index for kind, owner, _ in touching):
+                    game.check_trail_collisions(index, sphere)
+                active = [s for kind, _, s in touching if kind == ACTIVE]
+                if active:
+                    game.collect_active_spheres(sphere, active)
+                inactive = [s for kind, _, s in touching if kind == INACTIVE]
+                if inactive:
+                    game.collect_inactive_spheres(sphere, inactive)
+            game.activate_bursts(sphere)
@@ -1,7 +1,9 @@
 from dataclasses import dataclass
-from enum import Enum, auto
-from typing import Union, Optional
-from collections import deque
+from enum import Enum
+from functools import cached_property
+from typing import Union, Optional, Iterable
+from array import array
+import colorsys
 import math
 
 import pygame
@@ -31,27 +33,56 @@ BURST_INNER_RATIO = REFERENCE_BURST_INNER_SIZE / REFERENCE_BURST_OUTER_SIZE
 
 DEFAULT_SPEED = 2 / 400
 
-class Team(Enum):
-    RED = (255, 90, 40)
-    GREEN = (40, 255, 40)
-    BLUE = (63, 80, 255)
-    DARKRED = (190, 0, 0)
-    DARKGREEN = (25, 93, 42)
+# how many players a game can have, there are as many teams and bot keys
+MAX_PLAYERS = 256
 
-    YELLOW = (255, 255, 40)
-    PINK = (255, 40, 255)
-    SKY = (40, 255, 255)
-    PURPLE = (142, 70, 172)
+# the teams of the original game, replays refer to teams by their index so these stay first
+NAMED_TEAMS = [
+    ('RED', (255, 90, 40), 'Red'),
+    ('GREEN', (40, 255, 40), 'Green'),
+    ('BLUE', (63, 80, 255), 'Blue'),
+    ('DARKRED', (190, 0, 0), 'Dark red'),
+    ('DARKGREEN', (25, 93, 42), 'Dark green'),
 
-    ORANGE = (255, 130, 1)
-    BROWN = (128, 64, 64)
-    INDIGO = (70, 0, 148)
+    ('YELLOW', (255, 255, 40), 'Yellow'),
+    ('PINK', (255, 40, 255), 'Pink'),
+    ('SKY', (40, 255, 255), 'Sky'),
+    ('PURPLE', (142, 70, 172), 'Purple'),
 
-color_names = {
-    team.value: name for team, name in zip(Team, [
-        'Red', 'Green', 'Blue', 'Dark red', 'Dark green', 'Yellow', 'Pink', 'Sky', 'Purple', 'Orange', 'Brown', 'Indigo'
-    ])
-}
+    ('ORANGE', (255, 130, 1), 'Orange'),
+    ('BROWN', (128, 64, 64), 'Brown'),
+    ('INDIGO', (70, 0, 148), 'Indigo'),
+]
+
+def generate_colors(count: int, taken: Iterable[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
+    '''count colors spread around the hue circle, none of them white or in taken
+
+    Hues step by the golden ratio so that neighbours in the list differ a lot,
+    saturation and value take turns between a vivid and a darker variant.
+    '''
+    taken = set(taken)
+    taken.add((255, 255, 255))
+    colors = []
+    hue = 0.0
+    step = 0
+    while len(colors) < count:
+        hue = (hue + 0.6180339887498949) % 1
+        saturation, value = ((0.8, 1.0), (0.65, 0.75))[step % 2]
+        step += 1
+        color = tuple(round(c * 255) for c in colorsys.hsv_to_rgb(hue, saturation, value))
+        if color not in taken:
+            taken.add(color)
+            colors.append(color)
+    return colors
+
+_team_colors = [color for _, color, _ in NAMED_TEAMS]
+_team_colors += generate_colors(MAX_PLAYERS - len(NAMED_TEAMS), _team_colors)
+_team_names = [(name, title) for name, _, title in NAMED_TEAMS]
+_team_names += [(f'TEAM_{i + 1}', f'Team {i + 1}') for i in range(len(NAMED_TEAMS), MAX_PLAYERS)]
+
+Team = Enum('Team', [(name, color) for (name, _), color in zip(_team_names, _team_colors)], module=__name__, qualname='Team')
+
+color_names = {team.value: title for team, (_, title) in zip(Team, _team_names)}
 
 @dataclass
 class VerticalLine:
@@ -61,7 +92,8 @@ class HorizontalLine:
     y: float
 
 
-@dataclass
+# spheres are compared by identity, two of them can easily sit at the same place
+@dataclass(eq=False)
 class Sphere:
     center: Vector2
     velocity: Vector2
@@ -69,6 +101,8 @@ class Sphere:
     color: tuple[int, int, int] = (255, 255, 255)
     mass: float = 1
     damping_factor: float = 1
+    # index in the SpherePool this sphere is in, -1 when it is in none
+    slot = -1
 
     def get_rect(self):
         return self.center.x-self.radius, self.center.y-self.radius, self.radius*2, self.radius*2
@@ -101,6 +135,88 @@ class Sphere:
         self.center += self.velocity
         self.velocity *= self.damping_factor
 
+class SpherePool:
+    '''Spheres in insertion order with O(1) removal
+
+    Every sphere remembers its slot and remove() leaves a hole there instead
+    of shifting the rest, so spheres can be removed while the pool is being
+    iterated: nothing gets skipped, and spheres appended meanwhile are
+    visited too. compact() closes the holes, Game calls it at the end of
+    every frame, never while something iterates the pool.
+
+    A sphere has one slot, so it can be in one pool at a time: remove it
+    from a pool before appending it to another.
+    '''
+    def __init__(self, spheres: Iterable[Sphere] = ()):
+        self.slots: list[Optional[Sphere]] = []
+        self.holes = 0
+        self.extend(spheres)
+
+    def append(self, sphere: Sphere):
+        sphere.slot = len(self.slots)
+        self.slots.append(sphere)
+
+    def extend(self, spheres: Iterable[Sphere]):
+        for sphere in spheres:
+            self.append(sphere)
+
+    def contains_at_slot(self, sphere: Sphere):
+        return 0 <= sphere.slot < len(self.slots) and self.slots[sphere.slot] is sphere
+
+    def remove(self, sphere: Sphere):
+        if not self.contains_at_slot(sphere):
+            raise ValueError('sphere is not in the pool')
+        self.slots[sphere.slot] = None
+        sphere.slot = -1
+        self.holes += 1
+
+    def compact(self):
+        if not self.holes: return
+        self.slots = [sphere for sphere in self.slots if sphere is not None]
+        for slot, sphere in enumerate(self.slots):
+            sphere.slot = slot
+        self.holes = 0
+
+    def clear(self):
+        for sphere in self:
+            sphere.slot = -1
+        self.slots = []
+        self.holes = 0
+
+    def iterate(self, only: Optional[Iterable[Sphere]] = None):
+        '''Like iter(pool), but of the spheres already in the pool only visits the given ones
+
+        Spheres appended after the call are visited as usual. Used to walk
+        just the candidates a broad-phase found, in the same order as a
+        full iteration would.
+        '''
+        if only is None:
+            yield from self
+            return
+        slots = self.slots
+        start = len(slots)
+        for sphere in sorted((s for s in only if s.slot < start and self.contains_at_slot(s)), key=lambda s: s.slot):
+            if slots[sphere.slot] is sphere:
+                yield sphere
+        index = start
+        while index < len(slots):
+            sphere = slots[index]
+            if sphere is not None:
+                yield sphere
+            index += 1
+
+    def __iter__(self):
+        # spheres are always true, this skips the holes like a loop over the slots
+        # would: a list iterator sees what is appended and removed meanwhile
+        return filter(None, self.slots)
+
+    def __len__(self):
+        return len(self.slots) - self.holes
+
+    def __repr__(self):
+        return f'SpherePool({list(self)!r})'
+
+
 class RotatorSphere(Sphere):
     def __init__(self, center, radius):
         super().__init__(center, Vector2(0,0), radius, (51, 51, 51))
@@ -134,6 +250,109 @@ class Burst(Sphere):
         self.frames_from_spawn += 1
 
 
+class PathBuffer:
+    '''Last positions of a player, newest first
+
+    Behaves like the deque(maxlen=n) it replaces: appendleft() drops the
+    oldest position when full, and lowering maxlen keeps the oldest ones.
+    Coordinates live in a growable ring of two float arrays, so changing
+    maxlen only moves indices and appendleft() does not allocate.
+    '''
+    def __init__(self, maxlen: int, capacity: int = 64):
+        capacity = max(capacity, maxlen)
+        self.xs = array('d', bytes(8 * capacity))
+        self.ys = array('d', bytes(8 * capacity))
+        self.head = 0 # physical index of path[0]
+        self.length = 0
+        self._maxlen = maxlen
+
+    @property
+    def maxlen(self):
+        return self._maxlen
+
+    @maxlen.setter
+    def maxlen(self, maxlen: int):
+        if self.length > maxlen:
+            # same as deque(path, maxlen=maxlen): the newest positions are dropped
+            self.head = (self.head + self.length - maxlen) % len(self.xs)
+            self.length = maxlen
+        self._maxlen = maxlen
+
+    def copy(self) -> 'PathBuffer':
+        path = PathBuffer.__new__(PathBuffer)
+        path.xs = self.xs[:]
+        path.ys = self.ys[:]
+        path.head = self.head
+        path.length = self.length
+        path._maxlen = self._maxlen
+        return path
+
+    def grow(self):
+        capacity = len(self.xs)
+        end = self.head + self.length
+        xs, ys = self.xs, self.ys
+        # unwrap to [0, length) and double the capacity
+        self.xs = xs[self.head:end] + xs[:max(0, end - capacity)] + array('d', bytes(8 * capacity))
+        self.ys = ys[self.head:end] + ys[:max(0, end - capacity)] + array('d', bytes(8 * capacity))
+        self.head = 0
+
+    def appendleft(self, point):
+        if self.length == self._maxlen:
+            self.length -= 1
+        elif self.length == len(self.xs):
+            self.grow()
+        self.head = (self.head - 1) % len(self.xs)
+        self.xs[self.head] = point[0]
+        self.ys[self.head] = point[1]
+        self.length += 1
+
+    def append(self, point):
+        if self.length == self._maxlen:
+            self.head = (self.head + 1) % len(self.xs)
+            self.length -= 1
+        elif self.length == len(self.xs):
+            self.grow()
+        tail = (self.head + self.length) % len(self.xs)
+        self.xs[tail] = point[0]
+        self.ys[tail] = point[1]
+        self.length += 1
+
+    def physical_index(self, index: int) -> int:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('path index out of range')
+        return (self.head + index) % len(self.xs)
+
+    def __getitem__(self, index: int) -> Vector2:
+        index = self.physical_index(index)
+        return Vector2(self.xs[index], self.ys[index])
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def every(self, step: int, first: int, count: int) -> list[tuple[float, float]]:
+        '''[self[step * i - 1] for i in range(first, first + count)] as tuples
+
+        Like PlayerSphere.get_sphere_position, an index past the end (or -1)
+        gives the oldest position.
+        '''
+        xs, ys = self.xs, self.ys
+        return [(xs[index], ys[index]) for index in self.indices(step, first, count)]
+
+    def indices(self, step: int, first: int, count: int, offset: int = 0) -> list[int]:
+        '''Where the points of every(step, first, count) are in xs and ys, plus offset'''
+        capacity = len(self.xs)
+        head = self.head
+        last = self.length - 1
+        return [offset + (head + (index if 0 <= index <= last else last)) % capacity
+                for index in range(step * first - 1, step * (first + count) - 1, step)]
+
+
 class PlayerSphere(Sphere):
     '''
     These fields are available in PlayerSphere
@@ -152,12 +371,12 @@ class PlayerSphere(Sphere):
         can_dodge: frames_from_dodge == 0
 
 
-    self.path : deque[Vector2]
-        list of last n coordinates,
+    self.path : PathBuffer
+        last n coordinates, newest first,
         where n depends on the length of your trail
 
-    self.queue_to_trail : list[Sphere]
-        list of spheres to be added to your trail
+    self.queue_to_trail : SpherePool
+        spheres to be added to your trail
         this is needed because when you kill another snake,
         their tail flies to you. This list acts as your spheres
         which cannot kill other snakes
@@ -165,8 +384,8 @@ class PlayerSphere(Sphere):
     self.trail : list[Sphere]
         list of spheres in your trail which can kill other snakes
 
-    self.attacking_spheres: list[Sphere]
-        list of your attacking spheres. These fly straight after a dodge
+    self.attacking_spheres: SpherePool
+        your attacking spheres. These fly straight after a dodge
 
     self.alive : bool
         whether you are alive or killed
@@ -184,11 +403,11 @@ class PlayerSphere(Sphere):
         self.rotating_around : Optional[RotatorSphere] = None
         self.dodge_initiated = False
         self.frames_from_dodge = 0
-        self.path : deque[Vector2] = deque(maxlen=self.path_size_per_trail_sphere)
+        self.path = PathBuffer(maxlen=self.path_size_per_trail_sphere)
         self.path.append(center)
-        self.queue_to_trail : list[Sphere] = []
+        self.queue_to_trail = SpherePool()
         self.trail : list[Sphere] = []
-        self.attacking_spheres: list[Sphere] = []
+        self.attacking_spheres = SpherePool()
         self.alive = True
         self.bot : Optional['Bot'] = None
 
@@ -210,7 +429,7 @@ class PlayerSphere(Sphere):
 
     def add_sphere_to_queue(self, sphere: Sphere):
         self.queue_to_trail.append(sphere)
-        self.path = deque(self.path, maxlen=(len(self.trail)+len(self.queue_to_trail)+1) * self.path_size_per_trail_sphere) # type: ignore
+        self.path.maxlen = (len(self.trail)+len(self.queue_to_trail)+1) * self.path_size_per_trail_sphere
 
     def add_sphere_to_trail(self, sphere: Sphere):
         self.trail.append(sphere)
@@ -218,16 +437,18 @@ class PlayerSphere(Sphere):
 
     def remove_sphere(self, index=0):
         sphere = self.trail.pop(index)
-        self.path = deque(self.path, maxlen=(len(self.trail)+1) * self.path_size_per_trail_sphere) # type: ignore
+        self.path.maxlen = (len(self.trail)+1) * self.path_size_per_trail_sphere
         return sphere
 
     def get_sphere_position(self, i) -> Vector2:
-        try:
-            return self.path[self.path_size_per_trail_sphere * i - 1]
-        except IndexError:
-            return self.path[-1]
-
-    def update(self):
+        path = self.path
+        index = self.path_size_per_trail_sphere * i - 1
+        if not -path.length <= index < path.length:
+            index = -1
+        return path[index]
+
+    def update(self, move_tail: bool = True):
+        # move_tail=False leaves the trail and the queue where they are, see Game.skip_cutscenes
         if not self.alive: return
         if self.rotating_around is None:
             if self.dodge_initiated:
@@ -258,14 +479,33 @@ class PlayerSphere(Sphere):
             self.center = self.rotating_around.center + new_rotator_me_vector
             self.velocity = new_rotator_me_vector.rotate(velocity_rotate_angle)
             self.velocity.scale_to_length(DEFAULT_SPEED)
-        for i, sphere in enumerate(self.trail, 1):
-            sphere.center = sphere.center.move_towards(self.get_sphere_position(i), DEFAULT_SPEED*3)
-        for i, sphere in enumerate(self.queue_to_trail, len(self.trail)):
-            sphere.center = sphere.center.move_towards(self.get_sphere_position(i), DEFAULT_SPEED*3)
-            if sphere.center == self.get_sphere_position(i):
-                self.add_sphere_to_trail(sphere)
-                self.queue_to_trail.remove(sphere)
-        self.path.appendleft(Vector2(self.center))
+        if move_tail:
+            self.follow_path()
+        self.path.appendleft(self.center)
+
+    def follow_path(self):
+        '''Moves the trail and then the queue towards their spots on the path
+
+        Trail sphere i (from 1) heads for get_sphere_position(i), the queue
+        continues from len(trail), so its first sphere shares the spot of
+        the last trail sphere. Queue spheres that arrive join the trail in
+        queue order.
+        '''
+        step = self.path_size_per_trail_sphere
+        speed = DEFAULT_SPEED*3
+        trail = self.trail
+        for sphere, target in zip(trail, self.path.every(step, 1, len(trail))):
+            sphere.center = sphere.center.move_towards(target, speed)
+        queue = self.queue_to_trail
+        if not len(queue): return
+        arrived = []
+        for sphere, target in zip(queue, self.path.every(step, len(trail), len(queue))):
+            sphere.center = sphere.center.move_towards(target, speed)
+            if sphere.center == target:
+                arrived.append(sphere)
+        for sphere in arrived:
+            self.add_sphere_to_trail(sphere)
+            queue.remove(sphere)
 
     def draw_debug(self, debug_surface: pygame.Surface):
         size = debug_surface.get_rect().size
@@ -315,18 +555,23 @@ class GameState:
     player_spheres: list[PlayerSphere]
     list of PlayerSpheres, these are humans and bots
 
-    active_spheres: list[Sphere]
-    list of Spheres which will spawn new spheres after being collected
+    active_spheres: SpherePool
+    Spheres which will spawn new spheres after being collected
 
-    inactive_spheres: list[Sphere]
-    list of Spheres which will NOT spawn new spheres after being collected
+    inactive_spheres: SpherePool
+    Spheres which will NOT spawn new spheres after being collected
 
-    bursts: list[Burst]
-    list of Bursts which will collect spheres nearby
+    bursts: SpherePool
+    Bursts which will collect spheres nearby
+
+    SpherePool can be iterated and len()-ed like a list, list(pool) to index it
 
     rotators: list[RotatorSphere]
     list of rotators on this map
 
+    size: tuple[float, float]
+    width and height of the arena, (2, 1) for up to 12 players, see game.arena_scale
+
     timer: float
     time from the start of round
 
@@ -338,27 +583,39 @@ class GameState:
 
     total_uniforms: int
     number of times random.uniform() was called
+
+    features: FrameFeatures
+    distances, nearest spheres, rotator membership, time to collision and more
+    for all players, computed once per frame for all bots. See features.py
     '''
     player_spheres: list[PlayerSphere]
-    active_spheres: list[Sphere]
-    inactive_spheres: list[Sphere]
-    bursts: list[Burst]
+    active_spheres: SpherePool
+    inactive_spheres: SpherePool
+    bursts: SpherePool
     rotators: list[RotatorSphere]
+    size: tuple[float, float]
     timer: float
     death_order: list[int]
     seed: int
     total_uniforms: int
+
+    @cached_property
+    def features(self):
+        # numpy is only needed by bots that use the features
+        from .features import FrameFeatures
+        return FrameFeatures(self)
+
     def update_to_front(self, player_scores: list[PlayerScore], how_to_win_text: str, stage: GameStage, someone_won: Optional[tuple[int, int, int]]):
         return GameStateFront(self.player_spheres,
                               self.active_spheres,
                               self.inactive_spheres,
                               self.bursts,
                               self.rotators,
+                              self.size,
                               self.timer,
                               self.death_order,
                               self.seed,
                               self.total_uniforms,
-                              # self.random_,
                               player_scores, how_to_win_text, stage, someone_won)
 
 @dataclass
@@ -372,16 +629,4 @@ class GameStateFront(GameState):
 class Map:
     rotators_coords: list[tuple[float, float, float]]
 
-class BotKeys(Enum):
-    IS_BOT_1 = auto()
-    IS_BOT_2 = auto()
-    IS_BOT_3 = auto()
-    IS_BOT_4 = auto()
-    IS_BOT_5 = auto()
-    IS_BOT_6 = auto()
-    IS_BOT_7 = auto()
-    IS_BOT_8 = auto()
-    IS_BOT_9 = auto()
-    IS_BOT_10 = auto()
-    IS_BOT_11 = auto()
-    IS_BOT_12 = auto()
+BotKeys = Enum('BotKeys', [f'IS_BOT_{i + 1}' for i in range(MAX_PLAYERS)], module=__name__, qualname='BotKeys')
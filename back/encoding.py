@@ -0,0 +1,42 @@
+'''Varints and strings, the building blocks of replays, snapshots and streams
+
+Unsigned integers are little-endian base-128 varints: 7 bits per byte, the
+high bit set on every byte but the last. Signed ones are zigzag-encoded
+first (0, -1, 1, -2... become 0, 1, 2, 3...), so small negative numbers
+stay short too. Strings are their UTF-8 length followed by the bytes.
+Every read_* takes the data and a position and returns the value and the
+position after it.
+'''
+
+def write_varint(buffer: bytearray, value: int):
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data: bytes, position: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def write_signed(buffer: bytearray, value: int):
+    write_varint(buffer, value << 1 if value >= 0 else ~value << 1 | 1)
+
+def read_signed(data: bytes, position: int) -> tuple[int, int]:
+    value, position = read_varint(data, position)
+    return (~(value >> 1) if value & 1 else value >> 1), position
+
+def write_string(buffer: bytearray, string: str):
+    encoded = string.encode()
+    write_varint(buffer, len(encoded))
+    buffer += encoded
+
+def read_string(data: bytes, position: int) -> tuple[str, int]:
+    length, position = read_varint(data, position)
+    return data[position:position + length].decode(), position + length
@@ -0,0 +1,165 @@
+'''Per-frame features shared by all bots
+
+Game.update builds one GameState per frame and hands it to every bot.
+state.features is a FrameFeatures for that state: every feature is computed
+for all players at once with NumPy the first time any bot asks for it, and
+every other bot gets the cached arrays. The next frame has a new GameState
+and so a new, empty cache.
+
+Arrays are indexed like state.player_spheres (P players), state.rotators
+(R), the spheres lying around (S, active ones first, then inactive ones) and
+the threats (T, every trail sphere and then every attacking sphere).
+Positions are in game units, times in frames.
+
+    features.rotator_membership[i, r]   player i is inside rotator r
+    features.nearest_spheres(3)         indices and distances of the 3 closest spheres per player
+    features.time_to_collision[i]       frames until player i touches someone else's trail
+'''
+from functools import cached_property
+from itertools import chain
+from typing import Sequence
+
+import numpy as np
+
+import typing
+if typing.TYPE_CHECKING:
+    from .core import GameState, Sphere
+
+def gather(spheres: Sequence['Sphere']) -> np.ndarray:
+    '''Returns an array of shape (len(spheres), 6): cx, cy, vx, vy, radius, damping'''
+    values = chain.from_iterable((s.center.x, s.center.y, s.velocity.x, s.velocity.y, s.radius, s.damping_factor) for s in spheres)
+    return np.fromiter(values, float, count=len(spheres) * 6).reshape(-1, 6)
+
+def squared(values: np.ndarray) -> np.ndarray:
+    # Game compares against (r1 + r2) ** 2 computed by libm pow,
+    # which is not always bit-equal to x*x. float_power goes through pow too
+    return np.float_power(values, 2)
+
+
+class FrameFeatures:
+    def __init__(self, state: 'GameState'):
+        self.state = state
+        self.nearest: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+
+    @cached_property
+    def players(self) -> np.ndarray:
+        '''(P, 6) cx, cy, vx, vy, radius, damping'''
+        return gather(self.state.player_spheres)
+
+    @cached_property
+    def alive(self) -> np.ndarray:
+        return np.array([p.alive for p in self.state.player_spheres], dtype=bool)
+
+    @cached_property
+    def rotators(self) -> np.ndarray:
+        '''(R, 6) gather() of the rotators'''
+        return gather(self.state.rotators)
+
+    @cached_property
+    def rotator_distances(self) -> np.ndarray:
+        '''(P, R) distance between player and rotator centers'''
+        rotators = self.rotators
+        return np.hypot(self.players[:, None, 0] - rotators[None, :, 0], self.players[:, None, 1] - rotators[None, :, 1])
+
+    @cached_property
+    def rotator_membership(self) -> np.ndarray:
+        '''(P, R) bool, the same test as PlayerSphere.check_center_inside(rotator)'''
+        rotators = self.rotators
+        dx = self.players[:, None, 0] - rotators[None, :, 0]
+        dy = self.players[:, None, 1] - rotators[None, :, 1]
+        return dx * dx + dy * dy <= squared(rotators[None, :, 4])
+
+    @cached_property
+    def in_rotator(self) -> np.ndarray:
+        '''(P,) bool, PlayerSphere.is_in_rotator'''
+        return self.rotator_membership.any(axis=1)
+
+    @cached_property
+    def spheres(self) -> np.ndarray:
+        '''(S, 6) gather() of the active and then the inactive spheres'''
+        return gather(list(self.state.active_spheres) + list(self.state.inactive_spheres))
+
+    @cached_property
+    def sphere_is_active(self) -> np.ndarray:
+        return np.arange(len(self.spheres)) < len(self.state.active_spheres)
+
+    @cached_property
+    def sphere_distances(self) -> np.ndarray:
+        '''(P, S) distance between player and sphere centers'''
+        return np.hypot(self.players[:, None, 0] - self.spheres[None, :, 0], self.players[:, None, 1] - self.spheres[None, :, 1])
+
+    def nearest_spheres(self, k: int) -> tuple[np.ndarray, np.ndarray]:
+        '''(P, k) indices into spheres and their distances, closest first
+
+        k is cut to the number of spheres there are.
+        '''
+        k = min(k, len(self.spheres))
+        if k not in self.nearest:
+            distances = self.sphere_distances
+            if k < distances.shape[1]:
+                indices = np.argpartition(distances, k, axis=1)[:, :k]
+            else:
+                indices = np.broadcast_to(np.arange(k), (len(distances), k))
+            order = np.argsort(np.take_along_axis(distances, indices, axis=1), axis=1)
+            indices = np.take_along_axis(indices, order, axis=1)
+            self.nearest[k] = indices, np.take_along_axis(distances, indices, axis=1)
+        return self.nearest[k]
+
+    @cached_property
+    def threats(self) -> np.ndarray:
+        '''(T, 6) gather() of every trail and then every attacking sphere
+
+        Trail spheres follow their player's path and don't use their
+        velocity, they count as standing still.
+        '''
+        players = self.state.player_spheres
+        threats = gather([s for p in players for s in p.trail] + [s for p in players for s in p.attacking_spheres])
+        trail_count = sum(len(p.trail) for p in players)
+        threats[:trail_count, 2:4] = 0
+        return threats
+
+    @cached_property
+    def threat_owners(self) -> np.ndarray:
+        '''(T,) index of the player every threat belongs to'''
+        players = self.state.player_spheres
+        owners = [owner for owner, p in enumerate(players) for _ in p.trail]
+        owners += [owner for owner, p in enumerate(players) for _ in p.attacking_spheres]
+        return np.array(owners, dtype=int)
+
+    @cached_property
+    def threat_times(self) -> np.ndarray:
+        '''(P, T) frames until the player touches the threat if both keep going straight
+
+        0 if they touch already, inf if they never will, for the player's
+        own threats and for dead players. Dodging is not taken into account.
+        '''
+        players, threats = self.players, self.threats
+        dx = threats[None, :, 0] - players[:, None, 0]
+        dy = threats[None, :, 1] - players[:, None, 1]
+        wx = threats[None, :, 2] - players[:, None, 2]
+        wy = threats[None, :, 3] - players[:, None, 3]
+        # |d + w t| = r1 + r2
+        a = wx * wx + wy * wy
+        b = 2 * (dx * wx + dy * wy)
+        c = dx * dx + dy * dy - squared(players[:, None, 4] + threats[None, :, 4])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            discriminant = b * b - 4 * a * c
+            times = (-b - np.sqrt(discriminant)) / (2 * a)
+        times = np.where((discriminant >= 0) & (a > 0) & (times >= 0), times, np.inf)
+        times = np.where(c <= 0, 0, times)
+        ignored = (self.threat_owners[None, :] == np.arange(len(players))[:, None]) | ~self.alive[:, None]
+        return np.where(ignored, np.inf, times)
+
+    @cached_property
+    def time_to_collision(self) -> np.ndarray:
+        '''(P,) frames until the first threat of threat_times, inf if none'''
+        if self.threat_times.shape[1] == 0:
+            return np.full(len(self.players), np.inf)
+        return self.threat_times.min(axis=1)
+
+    @cached_property
+    def closest_threat(self) -> np.ndarray:
+        '''(P,) index into threats of the first one to hit the player, -1 if none'''
+        if self.threat_times.shape[1] == 0:
+            return np.full(len(self.players), -1)
+        return np.where(np.isfinite(self.time_to_collision), self.threat_times.argmin(axis=1), -1)
@@ -1,7 +1,9 @@
+from collections import defaultdict
 from typing import Optional, Callable
 import random
 import heapq
 import logging
+import math
 
 import pygame
 import pygame.freetype
@@ -19,15 +21,28 @@ from .core import (
     PlayerScore,
     GameState,
     Map,
-    BotKeys,
 
     VerticalLine,
     HorizontalLine,
     Sphere,
+    SpherePool,
     PlayerSphere,
     RotatorSphere,
     Burst,
 )
+from .broad_phase import BroadPhase
+from .bot_runner import BotRunner
+from .snapshot import (
+    GameSnapshot,
+    pack_sphere,
+    unpack_sphere,
+    pack_player,
+    unpack_player,
+    pack_burst,
+    unpack_burst,
+    pack_player_scores,
+    unpack_player_scores,
+)
 from bots import Bot
 
 map1 = Map([
@@ -44,10 +59,55 @@ map1 = Map([
     (0.9, 0.8, ROTATOR_SIZE),
 ])
 
+# map1 is made for this many players, more get a bigger arena (see arena_scale)
+MAP_PLAYERS = 12
+# map1's rotator pattern: rows this far apart, columns this far apart, both this far from the walls
+MAP_ROW_SPACING = 0.3
+MAP_COLUMN_SPACING = 1.6 / 3
+MAP_MARGIN = 0.2
+
+def arena_scale(num_players: int):
+    '''How many times wider and taller than map1's (2, 1) the arena is
+
+    1 up to MAP_PLAYERS players, beyond that the area grows with the number
+    of players, so every player has as much room as in a full map1 game.
+    '''
+    if num_players <= MAP_PLAYERS:
+        return 1
+    return math.sqrt(num_players / MAP_PLAYERS)
+
+def rotator_grid(size: tuple[float, float]) -> Map:
+    '''map1's pattern over an arena of any size, for (2, 1) it is map1
+
+    Rows of rotators MAP_ROW_SPACING apart, every other one shifted by half
+    a column and one rotator shorter, spacings stretched a little to end
+    MAP_MARGIN from the walls.
+    '''
+    width, height = size
+    rows = round((height - 2 * MAP_MARGIN) / MAP_ROW_SPACING) + 1
+    columns = round((width - 2 * MAP_MARGIN) / MAP_COLUMN_SPACING) + 1
+    dy = (height - 2 * MAP_MARGIN) / (rows - 1)
+    dx = (width - 2 * MAP_MARGIN) / (columns - 1)
+    coords = []
+    for row in range(rows):
+        shifted = row % 2
+        for column in range(columns - shifted):
+            x = MAP_MARGIN + (column + shifted / 2) * dx
+            y = MAP_MARGIN + row * dy
+            coords.append((x / width, y / height, ROTATOR_SIZE))
+    return Map(coords)
+
+# set_seed never has to replay more uniforms than this to reach any point of the stream
+RNG_CHECKPOINT_INTERVAL = 256
+
 class Game:
-    def __init__(self, colors: dict[int, tuple[Team, str, Callable[[], PlayerSphere]]], seed=None) -> None:
-        size = (2, 1)
+    def __init__(self, colors: dict[int, tuple[Team, str, Callable[[], PlayerSphere]]], seed=None, engine='objects', broad_phase=True,
+                 bot_deadline: Optional[float] = None, bot_workers: int = 0, skip_cutscenes: bool = False) -> None:
+        scale = arena_scale(len(colors))
+        size = (2 * scale, scale)
         self.size = size
+        # spheres and bursts per second grow with the area of the arena
+        self.spawn_rate = scale ** 2
         self.leftwall = None
         self.rightwall = None
         self.topwall = None
@@ -64,18 +124,43 @@ class Game:
         self.scores = [0] * self.num_players
 
         self.rotators = []
-        self.load_map(map1)
+        self.load_map(map1 if scale == 1 else rotator_grid(size))
+
+        # 'objects' moves and tests every Sphere through its own methods, 'numpy' keeps
+        # the spheres in arrays and does the same work in batches (see numpy_engine.py)
+        if engine == 'objects':
+            self.engine = None
+        elif engine == 'numpy':
+            from .numpy_engine import NumpyEngine
+            self.engine = NumpyEngine(self)
+        else:
+            raise ValueError(f'unknown engine {engine!r}')
+        # uniform grid that limits which spheres are tested against players and bursts,
+        # the numpy engine has its own way
+        self.broad_phase = BroadPhase(self) if broad_phase and self.engine is None else None
+
+        # ReplayRecorder or ReplayPlayer, told about presses, frames and new games (see replay.py)
+        self.replay = None
+        # Profiler timing the phases of update(), see profiler.py
+        self.profiler = None
+        # for headless games: the intro, the results and the end screen only simulate
+        # what can change the rest of the game, when no bot reads the state (see cutscenes_unseen)
+        self.skip_cutscenes = skip_cutscenes
 
         self.seed = None
         # logging.info(self.seed)
         self.random = None
         self.total_uniforms = 0
+        # total_uniforms -> random.getstate() of self.seed's stream at that point
+        self.rng_checkpoints: dict[int, tuple] = {}
 
         self.player_spheres: list[PlayerSphere] = []
         self.bot_player_spheres: list[PlayerSphere] = []
-        self.active_spheres: list[Sphere] = []
-        self.inactive_spheres: list[Sphere] = []
-        self.bursts = []
+        self.active_spheres = SpherePool()
+        self.inactive_spheres = SpherePool()
+        self.bursts = SpherePool()
+        # spheres of finished rounds, reused by spawn_random_sphere
+        self.free_spheres: list[Sphere] = []
         self.someone_won = False
 
         self.stage = GameStage.ROTATING_AROUND_CENTER
@@ -92,14 +177,39 @@ class Game:
         self.score2 = 0
         self.how_to_win_text = ''
         self.player_scores = None
+        self.next_stage: Optional[GameStage] = None
 
         self.restart_game(seed)
 
+        # asks the bots every frame and times them, see bot_runner.py
+        self.bot_runner = BotRunner(self, bot_deadline, bot_workers)
+
     def load_map(self, map_: Map):
         for i in map_.rotators_coords:
             self.rotators.append(RotatorSphere(Vector2(i[0]*self.size[0], i[1]*self.size[1]), i[2]))
+        self.index_rotators()
+
+    def index_rotators(self):
+        '''Buckets the rotators by the grid cells their bounding boxes cover, for rotators_at'''
+        self.rotator_cell_size = cell_size = 2 * max((rotator.radius for rotator in self.rotators), default=1)
+        cells = defaultdict(list)
+        for rotator in self.rotators:
+            x, y = rotator.center
+            # a little more than the radius, for rounding
+            reach = rotator.radius * 1.001
+            for cx in range(int((x - reach) // cell_size), int((x + reach) // cell_size) + 1):
+                for cy in range(int((y - reach) // cell_size), int((y + reach) // cell_size) + 1):
+                    cells[cx, cy].append(rotator)
+        self.rotator_cells = dict(cells)
+
+    def rotators_at(self, point) -> list[RotatorSphere]:
+        '''The rotators that can have point inside, in the order of self.rotators'''
+        cell_size = self.rotator_cell_size
+        return self.rotator_cells.get((int(point[0] // cell_size), int(point[1] // cell_size)), [])
 
     def random_uniform(self, a, b, from_where='unknown'):
+        if self.total_uniforms % RNG_CHECKPOINT_INTERVAL == 0:
+            self.rng_checkpoints[self.total_uniforms] = self.random.getstate()
         self.total_uniforms += 1
         # logging.info(f'uniform {self.total_uniforms} {from_where}')
         return self.random.uniform(a, b)
@@ -110,6 +220,7 @@ class Game:
 
     def restart_round(self):
         self.starting_angle = self.random_uniform(0, 360, 'starting angle')
+        self.recycle_spheres()
 
         self.bot_player_spheres = []
         self.player_spheres = []
@@ -123,12 +234,12 @@ class Game:
                 self.bot_player_spheres.append(ps)
             self.player_spheres.append(ps)
 
-        self.inactive_spheres = []
-        self.active_spheres = []
-        for i in range(10):
+        self.inactive_spheres = SpherePool()
+        self.active_spheres = SpherePool()
+        for i in range(round(10 * self.spawn_rate)):
             self.spawn_random_sphere()
-        self.time_to_spawn_burst = self.random_uniform(5, 15, 'time_until_burst')
-        self.bursts = []
+        self.time_to_spawn_burst = self.random_uniform(5, 15, 'time_until_burst') / self.spawn_rate
+        self.bursts = SpherePool()
 
         self.someone_won = False
 
@@ -136,27 +247,33 @@ class Game:
         self.timer = 0
         self.death_order: list[int] = []
 
-    def set_seed(self, seed=None, total_uniforms=0):
+    def set_seed(self, seed=None, total_uniforms=0, random_state=None):
         if self.seed is None or self.seed != seed:
             self.seed = seed
             if self.seed is None:
                 self.seed = random.randint(0, 1000000000)
             self.random = random.Random(self.seed)
-            for _ in range(total_uniforms):
-                self.random.uniform(0, 2)
+            self.total_uniforms = 0
+            self.rng_checkpoints = {0: self.random.getstate()}
+        if random_state is not None:
+            self.random.setstate(random_state)
             self.total_uniforms = total_uniforms
-        else:
-            if self.total_uniforms <= total_uniforms:
-                for _ in range(total_uniforms - self.total_uniforms):
-                    self.random.uniform(0, 2)
-                self.total_uniforms = total_uniforms
-            else:
-                self.random = random.Random(self.seed)
-                for _ in range(total_uniforms):
-                    self.random.uniform(0, 2)
-                self.total_uniforms = total_uniforms
+            return
+        if not self.total_uniforms <= total_uniforms <= self.total_uniforms + RNG_CHECKPOINT_INTERVAL:
+            checkpoint = total_uniforms - total_uniforms % RNG_CHECKPOINT_INTERVAL
+            if checkpoint in self.rng_checkpoints:
+                self.random.setstate(self.rng_checkpoints[checkpoint])
+                self.total_uniforms = checkpoint
+            elif self.total_uniforms > total_uniforms:
+                self.random.setstate(self.rng_checkpoints[0])
+                self.total_uniforms = 0
+        # replaying through random_uniform records the checkpoints it passes
+        while self.total_uniforms < total_uniforms:
+            self.random_uniform(0, 2, 'set_seed')
 
     def restart_game(self, seed=None):
+        if self.replay is not None:
+            seed = self.replay.restart_game(seed)
         self.set_seed(seed)
         # logging.info('reset seed to', seed, 'and uniforms to 0')
 
@@ -176,41 +293,72 @@ class Game:
     def register_players_and_keys(self, keys_list: list):
         self.num_players = len(keys_list)
         self.keys_list = keys_list
+        self.key_indices = {key: index for index, key in enumerate(keys_list)}
         self.actions_in_last_frame = []
 
     def get_random_spawn_position(self, radius):
         return (self.random_uniform(radius, self.size[0]-radius, 'random pos x'),
                 self.random_uniform(radius, self.size[1]-radius, 'random pos y'))
 
+    def recycle_spheres(self):
+        for spheres in self.active_spheres, self.inactive_spheres:
+            self.free_spheres.extend(spheres)
+        for player in self.player_spheres:
+            for spheres in player.trail, player.queue_to_trail, player.attacking_spheres:
+                self.free_spheres.extend(spheres)
+
     def spawn_random_sphere(self):
-        self.active_spheres.append(Sphere(Vector2(self.get_random_spawn_position(SPHERE_SIZE)),
-                                   Vector2(0, 0),
-                                   SPHERE_SIZE,
-                                   (255,255,255)))
+        center = self.get_random_spawn_position(SPHERE_SIZE)
+        if self.free_spheres:
+            sphere = self.free_spheres.pop()
+            sphere.center = Vector2(center)
+            sphere.velocity = Vector2(0, 0)
+            sphere.radius = SPHERE_SIZE
+            sphere.color = (255,255,255)
+            sphere.mass = 1
+            sphere.damping_factor = 1
+        else:
+            sphere = Sphere(Vector2(center),
+                            Vector2(0, 0),
+                            SPHERE_SIZE,
+                            (255,255,255))
+        self.active_spheres.append(sphere)
+        if self.broad_phase is not None:
+            self.broad_phase.add_active_sphere(sphere)
 
     def check_wall_collision(self, sphere: Sphere):
+        radius = sphere.radius
+        x, y = sphere.center.x, sphere.center.y
+        # clear of every wall, the bounds are the ones the intersects_* tests compare with
+        if self.topwall.y + radius <= y <= self.bottomwall.y - radius and self.leftwall.x + radius <= x <= self.rightwall.x - radius:
+            return
+        center, velocity = sphere.center, sphere.velocity
         if sphere.intersects_horizontal_line(self.topwall):
-            sphere.velocity.y *= -1
-            sphere.center.y = sphere.radius
-            return True
-        if sphere.intersects_horizontal_line(self.bottomwall):
-            sphere.velocity.y *= -1
-            sphere.center.y = self.bottomwall.y - sphere.radius
-            return True
-        if sphere.intersects_vertical_line(self.leftwall):
-            sphere.velocity.x *= -1
-            sphere.center.x = sphere.radius
-            return True
-        if sphere.intersects_vertical_line(self.rightwall):
-            sphere.velocity.x *= -1
-            sphere.center.x = self.rightwall.x - sphere.radius
-            return True
+            velocity.y *= -1
+            center.y = radius
+        elif sphere.intersects_horizontal_line(self.bottomwall):
+            velocity.y *= -1
+            center.y = self.bottomwall.y - radius
+        elif sphere.intersects_vertical_line(self.leftwall):
+            velocity.x *= -1
+            center.x = radius
+        elif sphere.intersects_vertical_line(self.rightwall):
+            velocity.x *= -1
+            center.x = self.rightwall.x - radius
+        else:
+            return
+        # the same vectors for plain spheres, ArraySpheres (see numpy_engine.py) hand out copies
+        sphere.center, sphere.velocity = center, velocity
+        return True
 
     def process_actions(self, actions):
         # self.actions_in_last_frame: list[int] = []
         for action in actions:
-            if action in self.keys_list:
-                self.actions_in_last_frame.append(self.keys_list.index(action))
+            index = self.key_indices.get(action)
+            if index is not None:
+                self.actions_in_last_frame.append(index)
+                if self.replay is not None:
+                    self.replay.press(index)
         # if len(actions) > 0:
         #     logging.info(actions, self.actions_in_last_frame)
 
@@ -218,7 +366,7 @@ class Game:
         if self.actions_in_last_frame is not None:
             for player in self.actions_in_last_frame:
                 player_sphere = self.player_spheres[player]
-                for rotator in self.rotators:
+                for rotator in self.rotators_at(player_sphere.center):
                     if player_sphere.check_center_inside(rotator) and not player_sphere.is_dodging():
                         if player_sphere.rotating_around is None:
                             player_sphere.rotating_around = rotator
@@ -239,17 +387,15 @@ class Game:
         self.actions_in_last_frame = []
 
     def update_positions_and_wall_collisions(self):
-        for i in self.player_spheres:
-            if not i.alive: continue
-            if self.check_wall_collision(i):
-                i.rotating_around = None
-            i.update()
+        if self.engine is not None:
+            return self.engine.update_positions_and_wall_collisions()
+        self.update_player_positions()
         for player in self.player_spheres:
             for i in player.attacking_spheres:
                 if self.check_wall_collision(i) and not player.is_dodging():
                     i.color = (255, 255, 255)
-                    self.inactive_spheres.append(i)
                     player.attacking_spheres.remove(i)
+                    self.inactive_spheres.append(i)
                     i.damping_factor = 0.98
                 i.update()
         for i in self.active_spheres:
@@ -258,42 +404,81 @@ class Game:
         for i in self.inactive_spheres:
             self.check_wall_collision(i)
             i.update()
+        self.process_bursts()
+
+    def update_player_positions(self):
+        for i in self.player_spheres:
+            if not i.alive: continue
+            if self.check_wall_collision(i):
+                i.rotating_around = None
+            i.update()
+
+    def process_bursts(self):
+        if self.engine is not None:
+            return self.engine.process_bursts()
+        if self.broad_phase is not None:
+            return self.broad_phase.process_bursts()
         for i in self.bursts:
             if not i.alive: self.bursts.remove(i)
             i.update()
             if i.active:
-                for sphere in self.active_spheres:
-                    if i.intersects(sphere):
-                        i.active_player.add_sphere_to_queue(sphere)
-                        self.active_spheres.remove(sphere)
-                        self.spawn_random_sphere()
-                for sphere in self.inactive_spheres:
-                    if i.intersects(sphere):
-                        i.active_player.add_sphere_to_queue(sphere)
-                        self.inactive_spheres.remove(sphere)
-                for p in self.player_spheres:
-                    if p is not i.active_player:
-                        for index, sphere in enumerate(p.trail):
-                            if i.intersects(sphere):
-                                i.active_player.add_sphere_to_queue(sphere)
-                                p.remove_sphere(index)
-                for player in self.player_spheres:
-                    for sphere in player.attacking_spheres:
-                        if i.intersects(sphere):
-                            i.active_player.add_sphere_to_queue(sphere)
-                            player.attacking_spheres.remove(sphere)
-                for b in self.bursts:
-                    if i == b or b.active: continue
-                    if i.intersects(b):
-                        b.activate(i.active_player)
+                self.absorb_active_spheres(i)
+                self.absorb_inactive_spheres(i)
+                self.absorb_trails(i)
+                self.absorb_attacking_spheres(i)
+                self.activate_bursts_around(i)
+
+    # candidates limit which of the spheres already in the pool are looked at,
+    # see SpherePool.iterate. Spheres spawned by the loop itself are always checked
+
+    def absorb_active_spheres(self, burst: Burst, candidates: Optional[list[Sphere]] = None):
+        for sphere in self.active_spheres.iterate(candidates):
+            if burst.intersects(sphere):
+                self.active_spheres.remove(sphere)
+                burst.active_player.add_sphere_to_queue(sphere)
+                self.spawn_random_sphere()
+
+    def absorb_inactive_spheres(self, burst: Burst, candidates: Optional[list[Sphere]] = None):
+        for sphere in self.inactive_spheres.iterate(candidates):
+            if burst.intersects(sphere):
+                self.inactive_spheres.remove(sphere)
+                burst.active_player.add_sphere_to_queue(sphere)
+
+    def absorb_trails(self, burst: Burst, candidates: Optional[list[Sphere]] = None):
+        # trails are plain lists, candidates only spare the intersection tests
+        candidates = None if candidates is None else set(candidates)
+        for p in self.player_spheres:
+            if p is not burst.active_player:
+                if candidates is None:
+                    absorbed = [index for index, sphere in enumerate(p.trail) if burst.intersects(sphere)]
+                else:
+                    absorbed = [index for index, sphere in enumerate(p.trail) if sphere in candidates and burst.intersects(sphere)]
+                for index in absorbed:
+                    burst.active_player.add_sphere_to_queue(p.trail[index])
+                # from the back, so the indices are still valid
+                for index in reversed(absorbed):
+                    p.remove_sphere(index)
+
+    def absorb_attacking_spheres(self, burst: Burst, candidates: Optional[list[Sphere]] = None):
+        for player in self.player_spheres:
+            for sphere in player.attacking_spheres.iterate(candidates):
+                if burst.intersects(sphere):
+                    player.attacking_spheres.remove(sphere)
+                    burst.active_player.add_sphere_to_queue(sphere)
 
+    def activate_bursts_around(self, burst: Burst, candidates: Optional[list[Burst]] = None):
+        for b in self.bursts.iterate(candidates):
+            if burst == b or b.active: continue
+            if burst.intersects(b):
+                b.activate(burst.active_player)
 
     def update_positions_to_rotate_around_center(self):
         ROTATION_SPEED = 500
         FINAL_SIZE = 0.15
         t = self.timer / 3
         center = Vector2(self.size) / 2
-        right = Vector2(FINAL_SIZE, 0)
+        # wide enough for everybody to end up side by side
+        right = Vector2(max(FINAL_SIZE, self.num_players * PLAYER_SIZE * 1.05 / math.pi), 0)
         for index, sphere in enumerate(self.player_spheres):
             angle = index / self.num_players * 360 + t * ROTATION_SPEED + self.starting_angle
             direction = right.rotate(angle)
@@ -305,51 +490,94 @@ class Game:
                 sphere.velocity = velocity
 
     def process_collisions(self):
+        if self.engine is not None:
+            return self.engine.process_collisions()
+        if self.broad_phase is not None:
+            return self.broad_phase.process_collisions()
+        if self.profiler is not None:
+            # every alive player against the players after it and every sphere
+            alive = sum(sphere.alive for sphere in self.player_spheres)
+            spheres = sum(len(p.trail) + len(p.attacking_spheres) for p in self.player_spheres) \
+                + len(self.active_spheres) + len(self.inactive_spheres) + len(self.bursts)
+            self.profiler.count('pairs_tested', alive * (alive - 1) // 2 + alive * spheres)
+        for index, sphere in enumerate(self.player_spheres):
+            if not sphere.alive: continue
+            self.collide_players(index, sphere)
+            self.check_trail_collisions(index, sphere)
+            self.collect_active_spheres(sphere)
+            self.collect_inactive_spheres(sphere)
+            self.activate_bursts(sphere)
+
+    def collide_all_players(self):
+        '''collide_players for every alive player, in order
+
+        A player is only moved by the players before it and in its own turn, so
+        this can come before the rest of the players' turns.
+        '''
+        if self.engine is not None:
+            return self.engine.collide_all_players()
+        if self.broad_phase is not None:
+            return self.broad_phase.collide_players()
         for index, sphere in enumerate(self.player_spheres):
             if not sphere.alive: continue
-            # other players
-            for sphere_to_check in self.player_spheres[index+1:]:
-                if not sphere_to_check.alive: continue
-                if sphere.intersects(sphere_to_check):
-                    sphere.rotating_around = None
-                    sphere_to_check.rotating_around = None
-                    if not sphere.is_dodging() and not sphere_to_check.is_dodging():
-                        sphere.collide_with(sphere_to_check)
-
-            for other_player in self.player_spheres:
-                if sphere == other_player:
-                    continue
-                # other players' trails
-                for sphere_to_check in other_player.trail:
-                    if sphere.intersects(sphere_to_check) and not sphere.is_dodging():
-                        self.process_player_death(index, sphere, killer_sphere=other_player)
-
-                # attacking spheres
-                for sphere_to_check in other_player.attacking_spheres:
-                    if sphere.intersects(sphere_to_check) and not sphere.is_dodging():
-                        self.process_player_death(index, sphere, killer_sphere=other_player)
-
-            # white spheres
-            for sphere_to_check in self.active_spheres:
-                if sphere.intersects(sphere_to_check):
-                    if not sphere.is_dodging():
-                        sphere.add_sphere_to_queue(sphere_to_check)
-                        self.active_spheres.remove(sphere_to_check)
-                        self.spawn_random_sphere()
-            for sphere_to_check in self.inactive_spheres:
-                if sphere.intersects(sphere_to_check):
-                    if not sphere.is_dodging():
-                        sphere.add_sphere_to_queue(sphere_to_check)
-                        self.inactive_spheres.remove(sphere_to_check)
-
-            for burst in self.bursts:
-                if sphere.intersects(burst) and not burst.active:
-                    burst.activate(sphere)
+            self.collide_players(index, sphere)
+
+    def collide_players(self, index: int, sphere: PlayerSphere):
+        for sphere_to_check in self.player_spheres[index+1:]:
+            if not sphere_to_check.alive: continue
+            # the same test collide_pair starts with, inlined because most pairs are far apart
+            if sphere.center.distance_squared_to(sphere_to_check.center) <= (sphere.radius + sphere_to_check.radius) ** 2:
+                self.collide_pair(sphere, sphere_to_check)
+
+    def collide_pair(self, sphere: PlayerSphere, sphere_to_check: PlayerSphere) -> bool:
+        '''Stops two touching players rotating and pushes them apart, returns whether they moved'''
+        if not sphere.intersects(sphere_to_check):
+            return False
+        sphere.rotating_around = None
+        sphere_to_check.rotating_around = None
+        if not sphere.is_dodging() and not sphere_to_check.is_dodging():
+            sphere.collide_with(sphere_to_check)
+            return True
+        return False
+
+    def check_trail_collisions(self, index: int, sphere: PlayerSphere):
+        for other_player in self.player_spheres:
+            if sphere == other_player:
+                continue
+            # other players' trails
+            for sphere_to_check in other_player.trail:
+                if sphere.intersects(sphere_to_check) and not sphere.is_dodging():
+                    self.process_player_death(index, sphere, killer_sphere=other_player)
+
+            # attacking spheres
+            for sphere_to_check in other_player.attacking_spheres:
+                if sphere.intersects(sphere_to_check) and not sphere.is_dodging():
+                    self.process_player_death(index, sphere, killer_sphere=other_player)
+
+    def collect_active_spheres(self, sphere: PlayerSphere, candidates: Optional[list[Sphere]] = None):
+        for sphere_to_check in self.active_spheres.iterate(candidates):
+            if sphere.intersects(sphere_to_check):
+                if not sphere.is_dodging():
+                    self.active_spheres.remove(sphere_to_check)
+                    sphere.add_sphere_to_queue(sphere_to_check)
+                    self.spawn_random_sphere()
+
+    def collect_inactive_spheres(self, sphere: PlayerSphere, candidates: Optional[list[Sphere]] = None):
+        for sphere_to_check in self.inactive_spheres.iterate(candidates):
+            if sphere.intersects(sphere_to_check):
+                if not sphere.is_dodging():
+                    self.inactive_spheres.remove(sphere_to_check)
+                    sphere.add_sphere_to_queue(sphere_to_check)
+
+    def activate_bursts(self, sphere: PlayerSphere):
+        for burst in self.bursts:
+            if sphere.intersects(burst) and not burst.active:
+                burst.activate(sphere)
 
     def spawn_burst_if_needed(self):
         if self.timer > self.time_to_spawn_burst:
             self.bursts.append(Burst(Vector2(self.get_random_spawn_position(BURST_SIZE)), BURST_SIZE))
-            self.time_to_spawn_burst += self.random_uniform(5, 15, 'time_until_burst')
+            self.time_to_spawn_burst += self.random_uniform(5, 15, 'time_until_burst') / self.spawn_rate
 
     def process_player_death(self, killed_index: int, killed_sphere: PlayerSphere, *, killer_index: Optional[int] = None, killer_sphere: Optional[PlayerSphere] = None):
         if killer_index is None and killer_sphere is None:
@@ -386,32 +614,92 @@ class Game:
         self.player_scores = player_scores
 
 
+    def cutscenes_unseen(self) -> bool:
+        '''Whether skip_cutscenes may leave things out: no bot reads the state (Bot.reads_state)
+
+        The caller promises not to draw the game, like in battle_the_bots.py
+        or play_replay.py --headless.
+        '''
+        return not any(getattr(player.bot, 'reads_state', True) for player in self.bot_player_spheres)
+
+    def update_unseen_results(self):
+        '''SHOWING_RESULTS with skip_cutscenes, for the same game as a full update
+
+        The scores are already counted, and the next round keeps nothing of
+        this one but the random stream. It moves when an active sphere is
+        collected by a player or absorbed by a burst and a new one spawns.
+        So only what can lead there is simulated, with Game's own methods:
+        the players still alive, the bursts, the active spheres (they never
+        move) and the attacking spheres of dead players, which can still
+        kill. Trails, queues, inactive spheres and the alive players' own
+        attacking spheres stay where they are.
+        '''
+        self.perform_actions()
+        for player in self.player_spheres:
+            if not player.alive: continue
+            if self.check_wall_collision(player):
+                player.rotating_around = None
+            player.update(move_tail=False)
+        dangerous = []
+        for player in self.player_spheres:
+            if player.alive: continue
+            for i in player.attacking_spheres:
+                if self.check_wall_collision(i) and not player.is_dodging():
+                    i.color = (255, 255, 255)
+                    player.attacking_spheres.remove(i)
+                    self.inactive_spheres.append(i)
+                    i.damping_factor = 0.98
+                else:
+                    dangerous.append(i)
+                i.update()
+        for i in self.bursts:
+            if not i.alive: self.bursts.remove(i)
+            i.update()
+            if i.active:
+                self.absorb_active_spheres(i)
+                if dangerous:
+                    self.absorb_attacking_spheres(i, dangerous)
+                self.activate_bursts_around(i)
+        self.collide_all_players()
+        for index, sphere in enumerate(self.player_spheres):
+            if not sphere.alive: continue
+            self.check_trail_collisions(index, sphere)
+            self.collect_active_spheres(sphere)
+            self.activate_bursts(sphere)
+        for i in self.player_spheres:
+            i.velocity.scale_to_length(DEFAULT_SPEED)
+
     def update(self, time_delta: float):
+        profiler = self.profiler
+        if profiler is not None: profiler.begin_frame()
         # get bots actions
-        state = self.get_state()
-        bots_actions = []
-        for bot, key in zip(self.bot_player_spheres, BotKeys):
-            action = bot.bot.get_action(state, time_delta)
-            if action:
-                bots_actions.append(key)
-        self.process_actions(bots_actions)
+        if self.bot_player_spheres:
+            self.process_actions(self.bot_runner.get_actions(time_delta))
+            if profiler is not None: profiler.lap('bots')
 
         # perform actions. actions were commited in process actions function
         if self.stage == GameStage.ROTATING_AROUND_CENTER:
             if self.timer < 3:
-                self.update_positions_to_rotate_around_center()
+                # the positions only depend on the timer, unseen only the last ones are needed
+                if not (self.skip_cutscenes and self.timer + time_delta < 3 and self.cutscenes_unseen()):
+                    self.update_positions_to_rotate_around_center()
                 self.timer += time_delta
             else:
                 self.stage = GameStage.GAMING
                 self.timer = 0
+            if profiler is not None: profiler.lap('update_positions_to_rotate_around_center')
         elif self.stage == GameStage.GAMING:
             self.perform_actions()
+            if profiler is not None: profiler.lap('perform_actions')
 
             self.update_positions_and_wall_collisions()
+            if profiler is not None: profiler.lap('update_positions_and_wall_collisions')
 
             self.process_collisions()
+            if profiler is not None: profiler.lap('process_collisions')
 
             self.spawn_burst_if_needed()
+            if profiler is not None: profiler.lap('spawn_burst_if_needed')
 
             for i in self.player_spheres:
                 i.velocity.scale_to_length(DEFAULT_SPEED)
@@ -436,15 +724,22 @@ class Game:
                     self.someone_won = self.player_spheres[max(enumerate(self.scores), key=lambda x:x[1])[0]].color
                     self.next_stage = GameStage.END_SCREEN
         elif self.stage == GameStage.SHOWING_RESULTS:
-            self.perform_actions()
+            if self.skip_cutscenes and self.cutscenes_unseen():
+                self.update_unseen_results()
+                if profiler is not None: profiler.lap('update_unseen_results')
+            else:
+                self.perform_actions()
+                if profiler is not None: profiler.lap('perform_actions')
 
-            self.update_positions_and_wall_collisions()
+                self.update_positions_and_wall_collisions()
+                if profiler is not None: profiler.lap('update_positions_and_wall_collisions')
 
-            # other collisions
-            self.process_collisions()
+                # other collisions
+                self.process_collisions()
+                if profiler is not None: profiler.lap('process_collisions')
 
-            for i in self.player_spheres:
-                i.velocity.scale_to_length(DEFAULT_SPEED)
+                for i in self.player_spheres:
+                    i.velocity.scale_to_length(DEFAULT_SPEED)
 
             if self.timer > 5:
                 self.stage = self.next_stage
@@ -452,20 +747,44 @@ class Game:
             self.timer += time_delta
         elif self.stage == GameStage.RESTART_ROUND:
             self.restart_round()
+            if profiler is not None: profiler.lap('restart_round')
         elif self.stage == GameStage.END_SCREEN:
             self.perform_actions()
+            if profiler is not None: profiler.lap('perform_actions')
 
-            self.update_positions_and_wall_collisions()
+            # the next game starts from a new seed, unseen nothing that moves here matters.
+            # Presses still count, they shorten the end screen
+            if not (self.skip_cutscenes and self.cutscenes_unseen()):
+                self.update_positions_and_wall_collisions()
+                if profiler is not None: profiler.lap('update_positions_and_wall_collisions')
 
-            # other collisions
-            self.process_collisions()
+                # other collisions
+                self.process_collisions()
+                if profiler is not None: profiler.lap('process_collisions')
 
-            for i in self.player_spheres:
-                i.velocity.scale_to_length(DEFAULT_SPEED)
+                for i in self.player_spheres:
+                    i.velocity.scale_to_length(DEFAULT_SPEED)
             if self.timer > 30:
                 self.restart_game()
             self.timer += time_delta
 
+        self.compact_pools()
+        if self.replay is not None:
+            self.replay.end_frame()
+        if profiler is not None:
+            profiler.lap('other')
+            profiler.count('active_spheres', len(self.active_spheres))
+            profiler.count('inactive_spheres', len(self.inactive_spheres))
+            profiler.count('bursts', len(self.bursts))
+            profiler.count('trail_spheres', sum(len(player.trail) for player in self.player_spheres))
+
+    def compact_pools(self):
+        self.active_spheres.compact()
+        self.inactive_spheres.compact()
+        self.bursts.compact()
+        for player in self.player_spheres:
+            player.queue_to_trail.compact()
+            player.attacking_spheres.compact()
 
     def get_state(self):
         return GameState(self.player_spheres,
@@ -473,11 +792,11 @@ class Game:
                          self.inactive_spheres,
                          self.bursts,
                          self.rotators,
+                         self.size,
                          self.timer,
                          self.death_order,
                          self.seed,
                          self.total_uniforms)
-                        #  self.random)
 
     def get_front_state(self):
         return self.get_state().update_to_front(self.player_scores, self.how_to_win_text, self.stage, self.someone_won)
@@ -485,6 +804,7 @@ class Game:
 
     def set_state(self, state: GameState):
         self.rotators = state.rotators
+        self.index_rotators()
         self.player_spheres = state.player_spheres
         self.active_spheres = state.active_spheres
         self.inactive_spheres = state.inactive_spheres
@@ -492,9 +812,105 @@ class Game:
         self.timer = state.timer
         self.death_order = state.death_order
         self.set_seed(state.seed, state.total_uniforms)
-        # self.random = state.random_
         # self.stage = state.stage
 
+    def snapshot(self, random_state: bool = True) -> GameSnapshot:
+        '''Copies everything update() depends on into plain data, see snapshot.py
+
+        random_state=False leaves out the 2.5 kB RNG state, restore() then
+        replays the stream from the closest checkpoint (see set_seed).
+        '''
+        return GameSnapshot(self.seed,
+                            self.total_uniforms,
+                            self.random.getstate() if random_state else None,
+                            self.stage,
+                            self.next_stage,
+                            self.timer,
+                            self.starting_angle,
+                            self.time_to_spawn_burst,
+                            tuple(self.death_order),
+                            tuple(self.scores),
+                            tuple(self.old_scores),
+                            self.score1,
+                            self.score2,
+                            self.how_to_win_text,
+                            self.someone_won,
+                            pack_player_scores(self.player_scores),
+                            tuple(self.actions_in_last_frame),
+                            tuple(pack_player(p, self.rotators) for p in self.player_spheres),
+                            tuple(map(pack_sphere, self.active_spheres)),
+                            tuple(map(pack_sphere, self.inactive_spheres)),
+                            tuple(pack_burst(b, self.player_spheres) for b in self.bursts))
+
+    def restore(self, snapshot: GameSnapshot):
+        '''Puts the game back to the snapshot, which stays valid and can be restored again
+
+        The PlayerSphere objects are kept and updated, so bots stay attached
+        to their players. All other spheres are new objects.
+        '''
+        if len(snapshot.players) != self.num_players:
+            raise ValueError(f'snapshot has {len(snapshot.players)} players, this game has {self.num_players}')
+        self.set_seed(snapshot.seed, snapshot.total_uniforms, snapshot.random_state)
+        self.stage = snapshot.stage
+        self.next_stage = snapshot.next_stage
+        self.timer = snapshot.timer
+        self.starting_angle = snapshot.starting_angle
+        self.time_to_spawn_burst = snapshot.time_to_spawn_burst
+        self.death_order = list(snapshot.death_order)
+        self.scores = list(snapshot.scores)
+        self.old_scores = list(snapshot.old_scores)
+        self.score1 = snapshot.score1
+        self.score2 = snapshot.score2
+        self.how_to_win_text = snapshot.how_to_win_text
+        self.someone_won = snapshot.someone_won
+        self.player_scores = unpack_player_scores(snapshot.player_scores)
+        self.actions_in_last_frame = list(snapshot.actions_in_last_frame)
+        for player, data in zip(self.player_spheres, snapshot.players):
+            unpack_player(player, data, self.rotators)
+        self.active_spheres = SpherePool(map(unpack_sphere, snapshot.active_spheres))
+        self.inactive_spheres = SpherePool(map(unpack_sphere, snapshot.inactive_spheres))
+        self.bursts = SpherePool(unpack_burst(data, self.player_spheres) for data in snapshot.bursts)
+
+    def clone(self) -> 'Game':
+        '''A copy of this game to simulate ahead with
+
+        The copy shares only what never changes (colors, rotators) with this
+        game. It has no debug surface, and its players have no bots: whoever
+        steps a clone presses the buttons through process_actions().
+        '''
+        game = Game.__new__(Game)
+        game.size = self.size
+        game.spawn_rate = self.spawn_rate
+        game.leftwall = self.leftwall
+        game.rightwall = self.rightwall
+        game.topwall = self.topwall
+        game.bottomwall = self.bottomwall
+        game.debug_surface = None
+        game.replay = None
+        game.profiler = None
+        # whoever steps a clone looks at it
+        game.skip_cutscenes = False
+        game.colors = self.colors
+        game.num_players = self.num_players
+        game.keys_list = self.keys_list
+        game.key_indices = self.key_indices
+        game.rotators = self.rotators
+        game.rotator_cell_size = self.rotator_cell_size
+        game.rotator_cells = self.rotator_cells
+        game.engine = None if self.engine is None else type(self.engine)(game)
+        game.broad_phase = None if self.broad_phase is None else BroadPhase(game)
+        game.free_spheres = []
+        game.seed = self.seed
+        game.random = random.Random(self.seed)
+        game.total_uniforms = self.total_uniforms
+        # the clone's own checkpoints, a search that steps many clones doesn't grow this game's
+        game.rng_checkpoints = dict(self.rng_checkpoints)
+        game.player_spheres = [PlayerSphere(Vector2(), Vector2(), PLAYER_SIZE, team.value) for team, _, _ in self.colors.values()]
+        game.bot_player_spheres = []
+        game.bot_runner = BotRunner(game)
+        game.restore(self.snapshot())
+        return game
+
     def draw_debug(self, debug_surface: pygame.Surface):
         for i in self.player_spheres:
             if i.bot is None:
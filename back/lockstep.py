@@ -0,0 +1,314 @@
+'''Lockstep multiplayer over asyncio streams
+
+A Game is deterministic given its seed and its inputs (see replay.py), so
+the peers only exchange who pressed in which frame. LockstepServer plays
+the authoritative Game, bots included, with a ReplayRecorder attached.
+After every frame it sends the replay events of that frame to every
+client. A LockstepClient keeps a ReplayPlayer on a Replay it extends as the
+frames arrive, so it plays exactly the frames the server played.
+
+Connecting: the client sends how many players it controls, the server
+answers with their indices, the input delay and the replay so far
+(Replay.to_bytes, keyframes included). The client seeks to its end, so
+joining a game that is already running works the same way.
+
+Then everything is varints:
+
+    server to client, per frame: the events of the frame (value << 2 | kind,
+    kinds from replay.py), then END_FRAME. A frame without presses is 1 byte
+    client to server, per press: frame, bitmask of the pressed players
+
+A client asks for its presses to be played `delay` frames after the last
+frame it played, which hides the round trip to the server. The server never
+waits for anybody: presses for a frame it already played go to the next
+one (counted in LockstepServer.late), presses of players the client does
+not control are ignored.
+
+Link delays what is written through it like a slow network would, so all
+of this can be tried out over localhost (see net_play.py --check).
+'''
+from collections import deque
+from typing import Optional
+import asyncio
+import random
+
+from .game import Game
+from .encoding import write_varint
+from .replay import Replay, ReplayRecorder, ReplayPlayer
+
+# 100 ms at 60 fps
+DELAY = 6
+
+# the low 2 bits of the event kinds of replay.py are all used, a frame ends with value 0 << 2 | 3
+END_FRAME = 3
+
+async def read_varint_from(reader: asyncio.StreamReader) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+
+
+class Link:
+    '''Delays every write by latency ± jitter seconds, in order like TCP does'''
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def wrap(self, writer: asyncio.StreamWriter) -> 'DelayedWriter':
+        return DelayedWriter(writer, self)
+
+
+class DelayedWriter:
+    '''The part of StreamWriter the lockstep peers use, going through a Link'''
+    def __init__(self, writer: asyncio.StreamWriter, link: Link):
+        self.writer = writer
+        self.link = link
+        # loop time of the last scheduled write, later writes never overtake it
+        self.last = 0.0
+        # data waiting for its time, None closes. Timers due at the same time may run
+        # in any order, every timer takes the oldest item so it doesn't matter
+        self.queue: deque[Optional[bytes]] = deque()
+
+    def schedule(self, data: Optional[bytes]):
+        loop = asyncio.get_running_loop()
+        self.last = max(self.last, loop.time() + self.link.delay())
+        self.queue.append(data)
+        loop.call_at(self.last, self.write_next)
+
+    def write_next(self):
+        data = self.queue.popleft()
+        if data is None:
+            self.writer.close()
+        elif not self.writer.is_closing():
+            self.writer.write(data)
+
+    def write(self, data: bytes):
+        self.schedule(bytes(data))
+
+    def close(self):
+        self.schedule(None)
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing()
+
+    async def drain(self):
+        await self.writer.drain()
+
+
+class Peer:
+    def __init__(self, writer, seats: list[int]):
+        self.writer = writer
+        self.seats = seats
+        self.mask = sum(1 << index for index in seats)
+
+
+class LockstepServer:
+    '''Plays the game for everybody, players without a bot are seats for the clients
+
+    run() starts playing once every seat is taken. A client that leaves frees
+    its seats, its players stop pressing until somebody takes them again.
+    '''
+    def __init__(self, colors, seed=None, delay: int = DELAY, time_delta: float = 1 / 60,
+                 link: Optional[Link] = None, **game_kwargs):
+        self.game = Game(colors, seed, **game_kwargs)
+        self.recorder = ReplayRecorder(self.game, time_delta)
+        self.delay = delay
+        self.link = link
+        self.free = [index for index, (_, _, BotClass_or_None) in enumerate(colors.values()) if BotClass_or_None is None]
+        self.peers: list[Peer] = []
+        # frame -> indices of the players pressing in it
+        self.pending: dict[int, list[int]] = {}
+        # events of self.recorder.replay already sent
+        self.sent = len(self.recorder.replay.events)
+        self.all_seated = asyncio.Event()
+        if not self.free:
+            self.all_seated.set()
+        self.late = 0
+        # handshakes, then frames and presses
+        self.bytes_joining = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def frame(self) -> int:
+        '''The next frame to be played'''
+        return self.recorder.replay.frames
+
+    async def start(self, host: str = 'localhost', port: int = 0) -> asyncio.Server:
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.link is not None:
+            writer = self.link.wrap(writer)
+        try:
+            count = await read_varint_from(reader)
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        if not 0 < count <= len(self.free):
+            writer.close()
+            return
+        seats, self.free[:count] = self.free[:count], []
+        message = bytearray()
+        write_varint(message, self.delay)
+        write_varint(message, len(seats))
+        for index in seats:
+            write_varint(message, index)
+        # the next frame sent is self.frame, as nothing else runs until this coroutine awaits
+        replay = self.recorder.replay.to_bytes()
+        write_varint(message, len(replay))
+        message += replay
+        writer.write(message)
+        self.bytes_joining += len(message)
+        peer = Peer(writer, seats)
+        self.peers.append(peer)
+        if not self.free:
+            self.all_seated.set()
+        try:
+            while True:
+                frame = await read_varint_from(reader)
+                mask = await read_varint_from(reader)
+                self.receive(peer, frame, mask)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.peers.remove(peer)
+            self.free = sorted(self.free + seats)
+            writer.close()
+
+    def receive(self, peer: Peer, frame: int, mask: int):
+        self.bytes_received += varint_size(frame) + varint_size(mask)
+        if frame < self.frame:
+            self.late += 1
+            frame = self.frame
+        presses = self.pending.setdefault(frame, [])
+        mask &= peer.mask
+        presses.extend(index for index in peer.seats if mask >> index & 1)
+
+    def step(self):
+        '''Plays one frame and sends it to the clients'''
+        game = self.game
+        replay = self.recorder.replay
+        presses = self.pending.pop(self.frame, None)
+        if presses:
+            game.process_actions([game.keys_list[index] for index in presses])
+        game.update(replay.time_delta)
+        message = bytearray()
+        for _, kind, value in replay.events[self.sent:]:
+            write_varint(message, value << 2 | kind)
+        write_varint(message, END_FRAME)
+        self.sent = len(replay.events)
+        for peer in self.peers:
+            peer.writer.write(message)
+        self.bytes_sent += len(message) * len(self.peers)
+
+    async def run(self, frames: Optional[int] = None, speed: float = 1):
+        '''Plays in real time (times speed) until frames frames were played or forever'''
+        await self.all_seated.wait()
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while frames is None or self.frame < frames:
+            self.step()
+            next_time += self.recorder.replay.time_delta / speed
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+
+    def close(self):
+        for peer in self.peers:
+            peer.writer.close()
+        self.game.bot_runner.close()
+
+
+def varint_size(value: int) -> int:
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+class LockstepClient:
+    '''Plays the frames the server sends, step() plays the next one that arrived
+
+    The frames wait in self.frames until they are played, so the one who
+    shows the game decides the pace; receive() fills it in the background.
+    '''
+    def __init__(self, players: int = 1, link: Optional[Link] = None, **game_kwargs):
+        self.players = players
+        self.link = link
+        self.game_kwargs = game_kwargs
+        self.player: Optional[ReplayPlayer] = None
+        self.seats: list[int] = []
+        self.delay = DELAY
+        # events of every frame received and not played yet
+        self.frames: deque[list[tuple[int, int]]] = deque()
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer = None
+        self.connected = False
+        self.bytes_sent = 0
+
+    @property
+    def game(self) -> Game:
+        return self.player.game
+
+    async def connect(self, host: str, port: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        if self.link is not None:
+            writer = self.link.wrap(writer)
+        message = bytearray()
+        write_varint(message, self.players)
+        writer.write(message)
+        try:
+            self.delay = await read_varint_from(reader)
+        except asyncio.IncompleteReadError:
+            writer.close()
+            raise ConnectionError('the server has no free seats') from None
+        self.seats = [await read_varint_from(reader) for _ in range(await read_varint_from(reader))]
+        data = await reader.readexactly(await read_varint_from(reader))
+        # nothing is drawn while catching up
+        self.player = ReplayPlayer(Replay.from_bytes(data), **self.game_kwargs)
+        self.player.seek(self.player.replay.frames)
+        self.reader = reader
+        self.writer = writer
+        self.connected = True
+
+    async def receive(self):
+        '''Receives frames until the server goes away'''
+        events = []
+        try:
+            while True:
+                value = await read_varint_from(self.reader)
+                kind = value & 3
+                if kind == END_FRAME:
+                    self.frames.append(events)
+                    events = []
+                else:
+                    events.append((kind, value >> 2))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connected = False
+            self.writer.close()
+
+    def press(self, seat: int):
+        '''Presses for the seat-th player of this client'''
+        message = bytearray()
+        write_varint(message, self.player.frame + self.delay)
+        write_varint(message, 1 << self.seats[seat])
+        self.writer.write(message)
+        self.bytes_sent += len(message)
+
+    def step(self) -> bool:
+        '''Plays the next received frame, False if there is none yet'''
+        if not self.frames:
+            return False
+        replay = self.player.replay
+        for kind, value in self.frames.popleft():
+            replay.events.append((replay.frames, kind, value))
+        replay.frames += 1
+        self.player.step()
+        return True
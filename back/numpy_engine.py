@@ -0,0 +1,469 @@
+'''Structure-of-arrays physics for Game
+
+Game(colors, seed, engine='numpy') keeps the center, velocity, radius and
+damping_factor of every sphere that is not a player, a burst or a rotator
+in a column of NumpyEngine.data, one array for the whole game. The spheres
+in Game's lists are ArraySpheres, views on their column, so GameState, the
+bots, snapshots and the drawing see Spheres as usual. A plain Sphere that
+ends up in one of the lists (spawned, restored, added by a benchmark) gets
+a column the next time the engine goes through that list, see columns_of().
+
+Tails following their paths, wall reflection and integration, and the
+burst/sphere and player/sphere overlap tests are batched array operations
+on data: the free spheres move in place under a mask of their columns, the
+tails read and write only their centers. Nothing is copied out of the
+spheres or back.
+
+Who gets what depends on order (spawned spheres are tested in the same
+frame, the first trail hit picks the killer, players are handled one after
+another). Instead of re-deriving those rules, the engine uses the arrays to
+find the rare players and bursts that really touch something and lets Game
+run its own loops for them, limited to the spheres they touch. The outcome
+for a given seed is therefore the same as with the object path.
+'''
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+import numpy as np
+from pygame import Vector2
+
+from .core import DEFAULT_SPEED, Sphere
+from .broad_phase import BroadPhase
+from .features import squared
+
+import typing
+if typing.TYPE_CHECKING:
+    from .game import Game
+
+# the rows of NumpyEngine.data
+CX, CY, VX, VY, RADIUS, DAMPING = range(6)
+
+# pairs up to which every circle is tested against every sphere, past that
+# only the spheres in a strip around each circle are (see NumpyEngine.touching)
+DENSE_PAIRS = 4096
+
+def within(distance_squared: np.ndarray, reach: np.ndarray) -> np.ndarray:
+    '''distance_squared <= squared(reach), elementwise
+
+    reach * reach is much cheaper than the pow in squared() and at most a
+    rounding away from it, so pow only decides the close calls.
+    '''
+    close = distance_squared <= reach * reach * (1 + 1e-12)
+    if close.any():
+        close[close] = distance_squared[close] <= squared(reach[close])
+    return close
+
+
+class ArraySphere(Sphere):
+    '''A Sphere whose center, velocity, radius and damping_factor are its column of engine.data
+
+    Made out of a plain Sphere by NumpyEngine.adopt, never constructed.
+    center and velocity are new Vector2s every time, changing one changes
+    nothing until it is assigned back. The column goes back to the engine
+    when the sphere is garbage. Copies and pickles are plain Spheres.
+    '''
+    engine: 'NumpyEngine'
+    column: int
+
+    @property
+    def center(self) -> Vector2:
+        data, column = self.engine.data, self.column
+        return Vector2(data.item(CX, column), data.item(CY, column))
+
+    @center.setter
+    def center(self, center):
+        data, column = self.engine.data, self.column
+        data[CX, column], data[CY, column] = center
+
+    @property
+    def velocity(self) -> Vector2:
+        data, column = self.engine.data, self.column
+        return Vector2(data.item(VX, column), data.item(VY, column))
+
+    @velocity.setter
+    def velocity(self, velocity):
+        data, column = self.engine.data, self.column
+        data[VX, column], data[VY, column] = velocity
+
+    @property
+    def radius(self) -> float:
+        return self.engine.data.item(RADIUS, self.column)
+
+    @radius.setter
+    def radius(self, radius: float):
+        self.engine.data[RADIUS, self.column] = radius
+
+    @property
+    def damping_factor(self) -> float:
+        return self.engine.data.item(DAMPING, self.column)
+
+    @damping_factor.setter
+    def damping_factor(self, damping_factor: float):
+        self.engine.data[DAMPING, self.column] = damping_factor
+
+    def __reduce__(self):
+        sphere = Sphere(self.center, self.velocity, self.radius, self.color, self.mass, self.damping_factor)
+        return Sphere.__reduce_ex__(sphere, 2)
+
+    def __del__(self):
+        self.engine.free.append(self.column)
+
+
+class NumpyEngine:
+    def __init__(self, game: 'Game', capacity: int = 256):
+        self.game = game
+        # cx, cy, vx, vy, radius and damping_factor of every ArraySphere, a column each
+        self.data = np.zeros((6, capacity))
+        # columns no sphere uses, the lowest last
+        self.free = list(range(capacity - 1, -1, -1))
+        # only for the player/player collisions, which are not about arrays
+        self.broad_phase = BroadPhase(game)
+
+    def grow(self):
+        capacity = self.data.shape[1]
+        data = np.zeros((6, 2 * capacity))
+        data[:, :capacity] = self.data
+        self.data = data
+        self.free[:0] = range(2 * capacity - 1, capacity - 1, -1)
+
+    def adopt(self, sphere: Sphere) -> int:
+        '''Moves a plain sphere into a column, turning it into an ArraySphere, returns the column'''
+        if not self.free:
+            self.grow()
+        column = self.free.pop()
+        self.data[:, column] = (sphere.center.x, sphere.center.y, sphere.velocity.x, sphere.velocity.y,
+                                sphere.radius, sphere.damping_factor)
+        fields = vars(sphere)
+        for name in 'center', 'velocity', 'radius', 'damping_factor':
+            fields.pop(name, None)
+        sphere.engine = self
+        sphere.column = column
+        sphere.__class__ = ArraySphere
+        return column
+
+    def columns_of(self, spheres: Iterable[Sphere]) -> list[int]:
+        '''The columns of the spheres, plain ones are adopted first
+
+        spheres is a list or a pool, something that can be iterated twice.
+        A sphere belongs to one game, its columns are in that game's engine.
+        '''
+        try:
+            return [sphere.column for sphere in spheres]
+        except AttributeError:
+            return [sphere.column if type(sphere) is ArraySphere else self.adopt(sphere) for sphere in spheres]
+
+    def touching(self, x: np.ndarray, y: np.ndarray, radius: np.ndarray, columns: list[int]) -> tuple[np.ndarray, np.ndarray]:
+        '''(i, j) of every circle i (x, y, radius) that intersects the sphere in columns[j]
+
+        The test is Sphere.intersects, pairs come sorted by i and then by j.
+        '''
+        sx, sy, _, _, sr = self.data[:RADIUS + 1, columns]
+        if len(x) * len(columns) <= DENSE_PAIRS:
+            dx = x[:, None] - sx
+            dy = y[:, None] - sy
+            hits = within(dx * dx + dy * dy, radius[:, None] + sr)
+            tested = hits.size
+            first, second = np.nonzero(hits)
+        else:
+            # only the spheres in a strip around every circle, a little wider for rounding
+            order = np.argsort(sx, kind='stable')
+            reach = (radius + sr.max()) * 1.001
+            sorted_x = sx[order]
+            starts = np.searchsorted(sorted_x, x - reach, 'left')
+            counts = np.searchsorted(sorted_x, x + reach, 'right') - starts
+            tested = int(counts.sum())
+            first = np.repeat(np.arange(len(x)), counts)
+            # starts[i], starts[i] + 1, ... for every i
+            second = order[np.arange(tested) + np.repeat(starts - np.cumsum(counts) + counts, counts)]
+            dx = x[first] - sx[second]
+            dy = y[first] - sy[second]
+            hits = within(dx * dx + dy * dy, radius[first] + sr[second])
+            first, second = first[hits], second[hits]
+            order = np.lexsort((second, first))
+            first, second = first[order], second[order]
+        profiler = self.game.profiler
+        if profiler is not None:
+            profiler.count('pairs_tested', tested)
+        return first, second
+
+    def bounce(self, values: list[float]) -> bool:
+        '''Game.check_wall_collision on a [cx, cy, vx, vy, radius, damping_factor] list'''
+        game = self.game
+        cx, cy, vx, vy, radius, _ = values
+        if game.topwall.y - radius < cy < game.topwall.y + radius:
+            values[VY] = -vy
+            values[CY] = radius
+        elif game.bottomwall.y - radius < cy < game.bottomwall.y + radius:
+            values[VY] = -vy
+            values[CY] = game.bottomwall.y - radius
+        elif game.leftwall.x - radius < cx < game.leftwall.x + radius:
+            values[VX] = -vx
+            values[CX] = radius
+        elif game.rightwall.x - radius < cx < game.rightwall.x + radius:
+            values[VX] = -vx
+            values[CX] = game.rightwall.x - radius
+        else:
+            return False
+        return True
+
+    def update_positions_and_wall_collisions(self):
+        '''Game.update_positions_and_wall_collisions, every sphere but the players in one pass
+
+        The trails and queues (PlayerSphere.follow_path) move their centers
+        towards the spots on the paths at once. The attacking, active and
+        inactive spheres (Game.check_wall_collision and Sphere.update) are
+        moved where they are in data, masked by the columns they use; only the
+        few near a wall are bounced one by one.
+        '''
+        game = self.game
+        players = game.player_spheres
+        # follow_path looks at the path before the player adds its new position
+        following = []
+        spots = []
+        # (player, where its queue starts in following)
+        queues = []
+        xs, ys = array('d'), array('d')
+        for player in players:
+            if not player.alive: continue
+            trail, queue = player.trail, player.queue_to_trail
+            waiting = len(queue)
+            if not trail and not waiting: continue
+            path = player.path
+            step = player.path_size_per_trail_sphere
+            offset = len(xs)
+            following += trail
+            spots += path.indices(step, 1, len(trail), offset)
+            if waiting:
+                # the queue continues from the spot of the last trail sphere
+                queues.append((player, len(following)))
+                following += queue
+                spots += path.indices(step, len(trail), waiting, offset)
+            xs += path.xs
+            ys += path.ys
+        for player in players:
+            if not player.alive: continue
+            if game.check_wall_collision(player):
+                player.rotating_around = None
+            player.update(move_tail=False)
+
+        if following:
+            columns = np.array(self.columns_of(following))
+            spots = np.array(spots)
+            targets = np.array((np.frombuffer(xs)[spots], np.frombuffer(ys)[spots]))
+            centers = self.data[CX:CY + 1, columns]
+            way = targets - centers
+            distance = np.sqrt(way[0] * way[0] + way[1] * way[1])
+            # Vector2.move_towards: the target if it is at most speed away, else speed closer to it
+            speed = DEFAULT_SPEED * 3
+            arrived = distance <= speed
+            centers += way * (speed / np.maximum(distance, speed))
+            np.copyto(centers, targets, where=arrived)
+            self.data[CX:CY + 1, columns] = centers
+            if queues:
+                # Vector2 == is within 1e-6 on both axes
+                at_target = (np.abs(centers - targets) < 1e-6).all(axis=0).tolist()
+            for player, start in queues:
+                queue = player.queue_to_trail
+                end = start + len(queue)
+                # arrived spheres join the trail in queue order
+                if any(at_target[start:end]):
+                    for sphere, arrived in zip(following[start:end], at_target[start:end]):
+                        if arrived:
+                            player.add_sphere_to_trail(sphere)
+                            queue.remove(sphere)
+
+        attacking = [(player, sphere) for player in players if len(player.attacking_spheres)
+                     for sphere in player.attacking_spheres]
+        columns = self.columns_of([sphere for _, sphere in attacking])
+        columns += self.columns_of(game.active_spheres)
+        columns += self.columns_of(game.inactive_spheres)
+        if not columns:
+            return self.process_bursts()
+        data = self.data
+        moving = np.zeros(data.shape[1], bool)
+        moving[columns] = True
+        x, y, radius = data[CX], data[CY], data[RADIUS]
+        # clear of every wall, the same bounds as in Game.check_wall_collision
+        clear = (game.topwall.y + radius <= y) & (y <= game.bottomwall.y - radius)
+        clear &= (game.leftwall.x + radius <= x) & (x <= game.rightwall.x - radius)
+        removed = []
+        bouncing = np.flatnonzero(moving & ~clear).tolist()
+        if bouncing:
+            attacking_at = {column: index for index, column in enumerate(columns[:len(attacking)])}
+            for column in bouncing:
+                values = data[:, column].tolist()
+                if self.bounce(values):
+                    data[:, column] = values
+                    index = attacking_at.get(column)
+                    # attacking spheres that hit a wall while their owner is not dodging become inactive
+                    if index is not None and not attacking[index][0].is_dodging():
+                        data[DAMPING, column] = 0.98
+                        removed.append(index)
+        # Sphere.update
+        position, velocity = data[CX:CY + 1], data[VX:VY + 1]
+        np.add(position, velocity, out=position, where=moving)
+        np.multiply(velocity, data[DAMPING], out=velocity, where=moving)
+
+        removed = [attacking[index] for index in sorted(removed)]
+        for player, sphere in removed:
+            sphere.color = (255, 255, 255)
+            player.attacking_spheres.remove(sphere)
+            game.inactive_spheres.append(sphere)
+        # they join inactive_spheres before its loop, so they move twice this frame
+        for _, sphere in removed:
+            values = data[:, sphere.column].tolist()
+            self.bounce(values)
+            values[CX] += values[VX]
+            values[CY] += values[VY]
+            values[VX] *= values[DAMPING]
+            values[VY] *= values[DAMPING]
+            data[:, sphere.column] = values
+        self.process_bursts()
+
+    def targets(self) -> tuple[list[Sphere], list[int], list[int], tuple[int, int, int]]:
+        '''Every trail, attacking, active and inactive sphere, their columns and owners
+
+        The owners are player indices, for the trail and attacking spheres
+        only. Also returns where the attacking, the active and the inactive
+        spheres start.
+        '''
+        game = self.game
+        players = game.player_spheres
+        spheres = []
+        owners = []
+        for owner, player in enumerate(players):
+            if player.trail:
+                spheres += player.trail
+                owners += [owner] * len(player.trail)
+        attacking = len(spheres)
+        for owner, player in enumerate(players):
+            if len(player.attacking_spheres):
+                spheres += player.attacking_spheres
+                owners += [owner] * (len(spheres) - len(owners))
+        active = len(spheres)
+        spheres += game.active_spheres
+        inactive = len(spheres)
+        spheres += game.inactive_spheres
+        return spheres, self.columns_of(spheres), owners, (attacking, active, inactive)
+
+    def process_bursts(self):
+        '''Game.process_bursts with the spheres every active burst may touch found at once
+
+        Every active burst is tested against every trail, attacking, active
+        and inactive sphere with the radius it can have after growing this
+        frame. Then the bursts are handled in order as in Game: Game's absorb
+        loops run for the spheres a burst may touch, exactly tested, so
+        transfers and spawned spheres stay the same. A burst set off by an
+        earlier one this frame runs Game's loops over everything.
+        '''
+        game = self.game
+        bursts = list(game.bursts)
+        active = [burst for burst in bursts if burst.active]
+        if not active:
+            # nothing can be absorbed or set off
+            for burst in bursts:
+                if not burst.alive: game.bursts.remove(burst)
+                burst.update()
+            return
+        players = game.player_spheres
+        spheres, columns, owners, (attacking_start, active_start, inactive_start) = self.targets()
+        found = {}
+        if spheres:
+            x = np.array([burst.center.x for burst in active])
+            y = np.array([burst.center.y for burst in active])
+            # Burst.update grows the radius before the burst looks around, the margin covers rounding
+            radius = np.array([burst.radius + (burst.grow_rate if burst.frames_from_burst < 40 else 0) + 1e-9
+                               for burst in active])
+            first, second = self.touching(x, y, radius, columns)
+            starts = np.searchsorted(first, np.arange(len(active) + 1)).tolist()
+            second = second.tolist()
+            found = {burst: second[starts[index]:starts[index + 1]] for index, burst in enumerate(active)}
+        # spheres spawned from here on are not in found
+        spawned_from = len(game.active_spheres.slots)
+
+        for burst in bursts:
+            if not burst.alive: game.bursts.remove(burst)
+            burst.update()
+            if not burst.active: continue
+            if burst not in found:
+                # set off by a burst before it
+                game.absorb_active_spheres(burst)
+                game.absorb_inactive_spheres(burst)
+                game.absorb_trails(burst)
+                game.absorb_attacking_spheres(burst)
+                game.activate_bursts_around(burst)
+                continue
+            hits = found[burst]
+            attacking_at = bisect_left(hits, attacking_start)
+            active_at = bisect_left(hits, active_start)
+            inactive_at = bisect_left(hits, inactive_start)
+            spawned = [s for s in game.active_spheres.slots[spawned_from:] if s is not None and burst.intersects(s)]
+            active_hits = [spheres[i] for i in hits[active_at:inactive_at]]
+            if active_hits or spawned:
+                game.absorb_active_spheres(burst, active_hits + spawned)
+            inactive_hits = [spheres[i] for i in hits[inactive_at:]]
+            if inactive_hits:
+                game.absorb_inactive_spheres(burst, inactive_hits)
+            trail_hits = [spheres[i] for i in hits[:attacking_at] if players[owners[i]] is not burst.active_player]
+            if trail_hits:
+                game.absorb_trails(burst, trail_hits)
+            attacking_hits = [spheres[i] for i in hits[attacking_at:active_at]]
+            if attacking_hits:
+                game.absorb_attacking_spheres(burst, attacking_hits)
+            game.activate_bursts_around(burst)
+
+    def collide_all_players(self):
+        self.broad_phase.collide_players()
+
+    def process_collisions(self):
+        game = self.game
+        players = game.player_spheres
+        alive = [player for player in players if player.alive]
+        if not alive:
+            return
+        x, y, radius = np.array([[player.center.x for player in alive], [player.center.y for player in alive],
+                                 [player.radius for player in alive]])
+        # player centers only change in player/player collisions, and player i is never
+        # moved again after its own turn, so resolving these first changes nothing.
+        # Most frames no two players are close, with a margin for rounding
+        dx = x[:, None] - x
+        dy = y[:, None] - y
+        reach = (radius[:, None] + radius) * 1.001
+        if np.count_nonzero(dx * dx + dy * dy <= reach * reach) > len(alive):
+            game.collide_all_players()
+            x, y = np.array([[player.center.x for player in alive], [player.center.y for player in alive]])
+
+        spheres, columns, owners, (attacking_start, active_start, inactive_start) = self.targets()
+        first, second = self.touching(x, y, radius, columns)
+        starts = np.searchsorted(first, np.arange(len(alive) + 1)).tolist()
+        second = second.tolist()
+        bursts = list(game.bursts)
+        near_burst = [False] * len(alive)
+        if bursts:
+            dx = x[:, None] - [burst.center.x for burst in bursts]
+            dy = y[:, None] - [burst.center.y for burst in bursts]
+            near_burst = within(dx * dx + dy * dy, radius[:, None] + [burst.radius for burst in bursts]).any(axis=1).tolist()
+        # spheres spawned from here on are not in second
+        spawned_from = len(game.active_spheres.slots)
+
+        for number, player in enumerate(alive):
+            hits = second[starts[number]:starts[number + 1]]
+            spawned = game.active_spheres.slots[spawned_from:]
+            if (hits or spawned) and not player.is_dodging():
+                index = players.index(player)
+                attacking_at = bisect_left(hits, attacking_start)
+                active_at = bisect_left(hits, active_start)
+                inactive_at = bisect_left(hits, inactive_start)
+                # a hit on a trail handed over earlier this frame is stale, Game's loop finds nothing there
+                if any(owners[i] != index for i in hits[:active_at]):
+                    game.check_trail_collisions(index, player)
+                active_hits = [spheres[i] for i in hits[active_at:inactive_at]]
+                active_hits += [sphere for sphere in spawned if sphere is not None]
+                if active_hits:
+                    game.collect_active_spheres(player, active_hits)
+                inactive_hits = [spheres[i] for i in hits[inactive_at:]]
+                if inactive_hits:
+                    game.collect_inactive_spheres(player, inactive_hits)
+            if near_burst[number]:
+                game.activate_bursts(player)
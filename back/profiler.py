@@ -0,0 +1,199 @@
+'''Where the time of a frame goes
+
+Game.update and front.draw_game call Profiler.lap(phase) after each of
+their phases when game.profiler is set, which adds the time since the
+previous lap to that phase. Without a profiler they only check that it is
+None. Counters (sphere counts, collision pairs tested...) are summed over
+the frame the same way with count().
+
+Every phase and counter keeps a fixed-bucket histogram over all frames, so
+memory doesn't grow with the length of the game. A frame ends when the next
+one begins or with close(). Given a stream, every frame is also written to
+it as it ends, as CSV rows (frame, kind, name, value) or as a JSON object
+per line:
+
+    profiler = Profiler.open('profile.csv')
+    game.profiler = profiler
+    ... game.update(), draw_game(..., profiler=profiler) ...
+    profiler.close()
+    print(profiler.summary())
+'''
+from bisect import bisect_left
+from typing import Optional, TextIO
+import csv
+import json
+import time
+
+# upper bounds of the time buckets, in microseconds, the last bucket takes the rest
+TIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+# upper bounds of the counter buckets
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.samples = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.samples += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram'):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.samples += other.samples
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.samples if self.samples else 0
+
+    def percentile(self, q: float):
+        '''Upper bound of the bucket the q-th percentile falls in, max for the last bucket'''
+        rank = q / 100 * self.samples
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'total': self.total,
+                'samples': self.samples, 'max': self.max}
+
+
+class Profiler:
+    def __init__(self, stream: Optional[TextIO] = None, format: str = 'csv'):
+        if format not in ('csv', 'jsonl'):
+            raise ValueError(f'unknown format {format!r}')
+        self.stream = stream
+        self.format = format
+        self.writer = csv.writer(stream) if stream is not None and format == 'csv' else None
+        if self.writer is not None:
+            self.writer.writerow(('frame', 'kind', 'name', 'value'))
+        # microseconds per frame
+        self.phases: dict[str, Histogram] = {}
+        self.counters: dict[str, Histogram] = {}
+        self.frames = 0
+        self.frame_phases: dict[str, float] = {}
+        self.frame_counters: dict[str, int] = {}
+        self.in_frame = False
+        self.last = 0.0
+
+    @classmethod
+    def open(cls, path: str) -> 'Profiler':
+        '''A profiler streaming to a file, JSON lines for .json and .jsonl, CSV otherwise'''
+        format = 'jsonl' if path.endswith(('.json', '.jsonl')) else 'csv'
+        return cls(open(path, 'w', newline=''), format)
+
+    def begin_frame(self):
+        if self.in_frame:
+            self.end_frame()
+        self.in_frame = True
+        self.last = time.perf_counter()
+
+    def start(self):
+        '''Starts timing without a phase, for code that runs after a pause in the frame (drawing)'''
+        self.in_frame = True
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        phases = self.frame_phases
+        phases[phase] = phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name: str, value: int = 1):
+        counters = self.frame_counters
+        counters[name] = counters.get(name, 0) + value
+
+    def end_frame(self):
+        total = 0.0
+        for phase, seconds in self.frame_phases.items():
+            if phase not in self.phases:
+                self.phases[phase] = Histogram(TIME_BUCKETS)
+            self.phases[phase].add(seconds * 1e6)
+            total += seconds
+        if 'frame' not in self.phases:
+            self.phases['frame'] = Histogram(TIME_BUCKETS)
+        self.phases['frame'].add(total * 1e6)
+        for name, value in self.frame_counters.items():
+            if name not in self.counters:
+                self.counters[name] = Histogram(COUNT_BUCKETS)
+            self.counters[name].add(value)
+        if self.stream is not None:
+            self.write_frame()
+        self.frames += 1
+        self.frame_phases = {}
+        self.frame_counters = {}
+        self.in_frame = False
+
+    def write_frame(self):
+        if self.writer is not None:
+            for phase, seconds in self.frame_phases.items():
+                self.writer.writerow((self.frames, 'phase', phase, f'{seconds * 1e6:.1f}'))
+            for name, value in self.frame_counters.items():
+                self.writer.writerow((self.frames, 'counter', name, value))
+        else:
+            phases = {phase: round(seconds * 1e6, 1) for phase, seconds in self.frame_phases.items()}
+            json.dump({'frame': self.frames, 'phases': phases, 'counters': self.frame_counters}, self.stream)
+            self.stream.write('\n')
+
+    def close(self):
+        '''Ends the current frame and closes the stream, the histograms stay'''
+        if self.in_frame:
+            self.end_frame()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.writer = None
+
+    def merge(self, other: 'Profiler'):
+        '''Adds the histograms of another profiler, e.g. of a game played in another process'''
+        for mine, theirs, buckets in ((self.phases, other.phases, TIME_BUCKETS), (self.counters, other.counters, COUNT_BUCKETS)):
+            for name, histogram in theirs.items():
+                if name not in mine:
+                    mine[name] = Histogram(buckets)
+                mine[name].merge(histogram)
+        self.frames += other.frames
+
+    def to_dict(self):
+        return {'frames': self.frames,
+                'phases': {phase: histogram.to_dict() for phase, histogram in self.phases.items()},
+                'counters': {name: histogram.to_dict() for name, histogram in self.counters.items()}}
+
+    def to_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def summary(self) -> str:
+        '''A table of the phases (mean, p50, p99, max in microseconds, share of the frame) and the counters'''
+        lines = [f'{self.frames} frames',
+                 f'{"phase":<40} {"frames":>7} {"mean":>9} {"p50<=":>9} {"p99<=":>9} {"max":>9} {"share":>6}']
+        frame_total = self.phases['frame'].total if 'frame' in self.phases else 0
+        for phase, h in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            share = h.total / frame_total if frame_total else 0
+            lines.append(f'{phase:<40} {h.samples:>7} {h.mean:>9.1f} {h.percentile(50):>9.0f} '
+                         f'{h.percentile(99):>9.0f} {h.max:>9.0f} {share:>6.1%}')
+        if self.counters:
+            lines.append(f'{"counter (per frame)":<40} {"frames":>7} {"mean":>9} {"p50<=":>9} {"p99<=":>9} {"max":>9}')
+            for name, h in sorted(self.counters.items()):
+                lines.append(f'{name:<40} {h.samples:>7} {h.mean:>9.1f} {h.percentile(50):>9.0f} '
+                             f'{h.percentile(99):>9.0f} {h.max:>9.0f}')
+        return '\n'.join(lines)
+
+    def __getstate__(self):
+        # the stream stays in the process that opened it
+        state = self.__dict__.copy()
+        state['stream'] = None
+        state['writer'] = None
+        return state
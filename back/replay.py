@@ -0,0 +1,324 @@
+'''Recording and re-simulating games from their inputs
+
+A Game is deterministic given its seed and the actions passed to
+process_actions, so a replay only stores the seed, the roster and which
+players pressed in which frame. The bots are not needed to play it back.
+
+File layout: MAGIC, a version byte, the length (uint32) of a
+zlib-compressed body of varints:
+
+    seed, time_delta (float64), number of players,
+    per player: team index, key kind (0 int, 1 BotKeys), key value, name, is bot
+    number of frames
+    events: (frames since the previous event << 2 | kind), value
+
+Most frames have no events at all, so a frame costs nothing unless
+somebody pressed. PRESS values are bitmasks of player indices (a player
+pressing twice in one frame gives a second PRESS with delta 0).
+RESTART_ROUND is a restart requested from outside the game (F5).
+NEW_GAME holds the seed the game picked when it restarted after END_SCREEN.
+
+Then come the keyframes, zlib-compressed GameSnapshot.to_bytes() of the
+game after that many frames, taken at the start of every round and every
+keyframe_interval frames. The keyframe index (zlib-compressed varints:
+count, then frame, round, file offset and size of each keyframe) follows,
+and the last 4 bytes are the offset of the index. Seeking restores the
+closest keyframe before the frame and simulates the rest, at most
+keyframe_interval frames. Without keyframes seeking simulates from the
+start.
+'''
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Optional, Union
+import random
+import struct
+import zlib
+
+from .core import Team, BotKeys, GameStage
+from .encoding import write_varint, read_varint, write_string, read_string
+from .game import Game
+from .snapshot import GameSnapshot
+
+MAGIC = b'ORBR'
+VERSION = 3
+
+# 30 seconds at 60 fps
+KEYFRAME_INTERVAL = 1800
+
+PRESS = 0
+RESTART_ROUND = 1
+NEW_GAME = 2
+
+Key = Union[int, BotKeys]
+
+@dataclass
+class Keyframe:
+    frame: int
+    round: int
+    # zlib-compressed GameSnapshot.to_bytes()
+    data: bytes
+
+    @classmethod
+    def from_game(cls, frame: int, round: int, game: Game) -> 'Keyframe':
+        # the RNG state is 2.5 kB that doesn't compress, total_uniforms is enough to get it back
+        return cls(frame, round, zlib.compress(game.snapshot(random_state=False).to_bytes()))
+
+    def snapshot(self) -> GameSnapshot:
+        return GameSnapshot.from_bytes(zlib.decompress(self.data))
+
+
+@dataclass
+class Replay:
+    seed: int
+    time_delta: float
+    # key, team, name, whether a bot played
+    roster: list[tuple[Key, Team, str, bool]]
+    frames: int = 0
+    # frame, kind, value
+    events: list[tuple[int, int, int]] = field(default_factory=list)
+    # ordered by frame
+    keyframes: list[Keyframe] = field(default_factory=list)
+
+    def colors(self):
+        '''Colors for Game with every player human, so no bot is ever asked'''
+        return {key: (team, name, None) for key, team, name, _ in self.roster}
+
+    def to_bytes(self) -> bytes:
+        body = bytearray()
+        write_varint(body, self.seed)
+        body += struct.pack('<d', self.time_delta)
+        write_varint(body, len(self.roster))
+        teams = list(Team)
+        for key, team, name, is_bot in self.roster:
+            write_varint(body, teams.index(team))
+            if isinstance(key, BotKeys):
+                write_varint(body, 1)
+                write_varint(body, key.value)
+            else:
+                write_varint(body, 0)
+                write_varint(body, key)
+            write_string(body, name)
+            body.append(is_bot)
+        write_varint(body, self.frames)
+        last_frame = 0
+        for frame, kind, value in self.events:
+            write_varint(body, (frame - last_frame) << 2 | kind)
+            write_varint(body, value)
+            last_frame = frame
+        body = zlib.compress(body, 9)
+        data = bytearray(MAGIC + bytes([VERSION]) + struct.pack('<I', len(body)) + body)
+        index = bytearray()
+        write_varint(index, len(self.keyframes))
+        for keyframe in self.keyframes:
+            write_varint(index, keyframe.frame)
+            write_varint(index, keyframe.round)
+            write_varint(index, len(data))
+            write_varint(index, len(keyframe.data))
+            data += keyframe.data
+        index_offset = len(data)
+        data += zlib.compress(index, 9)
+        data += struct.pack('<I', index_offset)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Replay':
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a replay')
+        version = data[len(MAGIC)]
+        if version != VERSION:
+            raise ValueError(f'unsupported replay version {version}')
+        length, = struct.unpack_from('<I', data, len(MAGIC) + 1)
+        start = len(MAGIC) + 5
+        body = zlib.decompress(data[start:start + length])
+        seed, position = read_varint(body, 0)
+        time_delta, = struct.unpack_from('<d', body, position)
+        position += 8
+        num_players, position = read_varint(body, position)
+        teams = list(Team)
+        roster = []
+        for _ in range(num_players):
+            team, position = read_varint(body, position)
+            kind, position = read_varint(body, position)
+            key, position = read_varint(body, position)
+            if kind == 1:
+                key = BotKeys(key)
+            name, position = read_string(body, position)
+            is_bot = bool(body[position])
+            position += 1
+            roster.append((key, teams[team], name, is_bot))
+        frames, position = read_varint(body, position)
+        events = []
+        frame = 0
+        while position < len(body):
+            header, position = read_varint(body, position)
+            value, position = read_varint(body, position)
+            frame += header >> 2
+            events.append((frame, header & 3, value))
+        keyframes = []
+        index_offset, = struct.unpack_from('<I', data, len(data) - 4)
+        index = zlib.decompress(data[index_offset:len(data) - 4])
+        count, position = read_varint(index, 0)
+        for _ in range(count):
+            frame, position = read_varint(index, position)
+            round, position = read_varint(index, position)
+            offset, position = read_varint(index, position)
+            size, position = read_varint(index, position)
+            keyframes.append(Keyframe(frame, round, data[offset:offset + size]))
+        return cls(seed, time_delta, roster, frames, events, keyframes)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'Replay':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayRecorder:
+    '''Records everything a game gets from outside, attach before its first update
+
+    Presses and new seeds are reported by the game itself. A restart of the
+    round from outside has to go through ReplayRecorder.restart_round().
+    Keyframes are taken at the start of every round and at least every
+    keyframe_interval frames, None takes them only at round starts.
+    '''
+    def __init__(self, game: Game, time_delta: float = 1 / 60, keyframe_interval: Optional[int] = KEYFRAME_INTERVAL):
+        self.game = game
+        roster = [(key, team, name, BotClass_or_None is not None) for key, (team, name, BotClass_or_None) in game.colors.items()]
+        self.replay = Replay(game.seed, time_delta, roster)
+        self.presses: list[int] = []
+        self.keyframe_interval = keyframe_interval
+        self.round = 0
+        self.round_restarted = False
+        self.replay.keyframes.append(Keyframe.from_game(0, self.round, game))
+        game.replay = self
+
+    def press(self, index: int):
+        self.presses.append(index)
+
+    def restart_round(self):
+        self.replay.events.append((self.replay.frames, RESTART_ROUND, 0))
+        self.game.restart_round()
+        self.round_restarted = True
+
+    def restart_game(self, seed):
+        if seed is None:
+            # the same draw Game.set_seed would make
+            seed = random.randint(0, 1000000000)
+        self.replay.events.append((self.replay.frames, NEW_GAME, seed))
+        self.round_restarted = True
+        return seed
+
+    def end_frame(self):
+        presses = self.presses
+        while presses:
+            mask = 0
+            repeated = []
+            for index in presses:
+                if mask >> index & 1:
+                    repeated.append(index)
+                mask |= 1 << index
+            self.replay.events.append((self.replay.frames, PRESS, mask))
+            presses = repeated
+        self.presses = []
+        self.replay.frames += 1
+
+        game = self.game
+        # restart_round() sets the timer to 0 and the next update starts counting,
+        # restarts from outside or after END_SCREEN are flagged
+        if self.round_restarted or game.stage == GameStage.ROTATING_AROUND_CENTER and game.timer == 0:
+            self.round += 1
+            self.round_restarted = False
+            self.add_keyframe()
+        elif self.keyframe_interval is not None and self.replay.frames - self.replay.keyframes[-1].frame >= self.keyframe_interval:
+            self.add_keyframe()
+
+    def add_keyframe(self):
+        self.replay.keyframes.append(Keyframe.from_game(self.replay.frames, self.round, self.game))
+
+    def save(self, path: str):
+        self.replay.save(path)
+
+
+class ReplayPlayer:
+    '''Re-simulates a Replay on a Game without bots'''
+    def __init__(self, replay: Replay, **game_kwargs):
+        self.replay = replay
+        self.game = Game(replay.colors(), replay.seed, **game_kwargs)
+        self.game.replay = self
+        self.frame = 0
+        self.position = 0 # index of the next event
+        self.seeds: list[int] = []
+        self.keyframe_frames = [keyframe.frame for keyframe in replay.keyframes]
+
+    def seek(self, frame: int):
+        '''Brings the game to the state after the given number of frames
+
+        Restores the closest keyframe at or before the frame, unless the game
+        is already between it and the frame, and simulates from there.
+        '''
+        frame = max(0, min(frame, self.replay.frames))
+        index = bisect_right(self.keyframe_frames, frame) - 1
+        if index >= 0:
+            keyframe = self.replay.keyframes[index]
+            if not keyframe.frame <= self.frame <= frame:
+                self.game.restore(keyframe.snapshot())
+                self.jump_to(keyframe.frame)
+        elif frame < self.frame:
+            self.game.restart_game(self.replay.seed)
+            self.game.actions_in_last_frame = []
+            self.jump_to(0)
+        while self.frame < frame:
+            self.step()
+
+    def seek_round(self, round: int):
+        '''Seeks to the start of the round, counted from 0 over the whole replay'''
+        for keyframe in self.replay.keyframes:
+            if keyframe.round == round:
+                return self.seek(keyframe.frame)
+        raise ValueError(f'no keyframe for round {round}')
+
+    def jump_to(self, frame: int):
+        self.frame = frame
+        self.position = bisect_left(self.replay.events, (frame,))
+        # seeds of restarts before the frame are not needed anymore
+        self.seeds = []
+
+    def press(self, index: int):
+        return
+
+    def end_frame(self):
+        return
+
+    def restart_game(self, seed):
+        if seed is not None:
+            # seek() going back to the start
+            return seed
+        if not self.seeds:
+            raise ValueError(f'replay out of sync: the game restarted in frame {self.frame} without a recorded seed')
+        return self.seeds.pop(0)
+
+    def is_finished(self):
+        return self.frame >= self.replay.frames
+
+    def step(self):
+        game = self.game
+        events = self.replay.events
+        while self.position < len(events) and events[self.position][0] == self.frame:
+            _, kind, value = events[self.position]
+            if kind == PRESS:
+                game.process_actions([key for index, key in enumerate(game.keys_list) if value >> index & 1])
+            elif kind == RESTART_ROUND:
+                game.restart_round()
+            elif kind == NEW_GAME:
+                self.seeds.append(value)
+            self.position += 1
+        game.update(self.replay.time_delta)
+        self.frame += 1
+
+    def play(self):
+        '''Plays the rest of the replay as fast as possible'''
+        while not self.is_finished():
+            self.step()
@@ -0,0 +1,132 @@
+'''Playing ahead of the inputs and correcting the game when they arrive
+
+With an input delay (see lockstep.py) a press shows up some frames after
+it was made. RollbackGame plays every frame right away instead, guessing
+"no press" for the inputs that are not there yet. It takes a snapshot
+before every frame it plays for the first time, and when an input arrives
+for a frame that was already played it restores the last snapshot taken
+at or before that frame and plays the frames since then again, all before
+the next frame is shown. Afterwards the game is the one it would have been
+had the input been there in time.
+
+Frames played again take no snapshot, that would double what a rollback
+costs. A later rollback into them starts from the snapshot before them and
+plays a few frames more.
+
+A Game is only deterministic given its inputs if nothing else presses, so
+the game must not have bots. When the game restarts after END_SCREEN, the
+seed drawn the first time is used again when that frame is played again.
+
+    python -m benchmarks.rollback    # what a rollback costs
+'''
+from collections import deque
+from typing import Optional
+import random
+
+from .game import Game
+from .snapshot import GameSnapshot
+
+# 8 frames is 133 ms at 60 fps, more than a round trip over most connections
+FRAMES = 8
+
+class RollbackGame:
+    def __init__(self, game: Game, frames: int = FRAMES, time_delta: float = 1 / 60):
+        if game.bot_player_spheres:
+            raise ValueError('a game with bots can not be played again, their presses would not be the same')
+        self.game = game
+        self.frames = frames
+        self.time_delta = time_delta
+        # the next frame to be played
+        self.frame = 0
+        # (frame, snapshot taken before playing it), oldest first, from the last one
+        # at or before the oldest frame that can still get an input
+        self.history: deque[tuple[int, GameSnapshot]] = deque()
+        # frame -> indices of the players pressing in it, only frames that may still be played again
+        self.inputs: dict[int, list[int]] = {}
+        # frame -> seed of the game that started in it
+        self.seeds: dict[int, int] = {}
+        # the earliest frame that got an input after it was played
+        self.dirty: Optional[int] = None
+        self.rollbacks = 0
+        self.frames_played_again = 0
+        # ((seed, total_uniforms), random.getstate()) of the last snapshot
+        self.random_state: tuple[Optional[tuple], Optional[tuple]] = (None, None)
+        game.replay = self
+
+    def press(self, index: int):
+        return
+
+    def end_frame(self):
+        return
+
+    def restart_game(self, seed):
+        if seed is None:
+            if self.frame not in self.seeds:
+                # the same draw Game.set_seed would make
+                self.seeds[self.frame] = random.randint(0, 1000000000)
+            seed = self.seeds[self.frame]
+        return seed
+
+    def add_input(self, frame: int, index: int):
+        '''Player index presses in frame, which may have been played already'''
+        if frame < self.frame - self.frames or frame < self.frame and frame < self.history[0][0]:
+            raise ValueError(f'frame {frame} was played more than {self.frames} frames ago')
+        self.inputs.setdefault(frame, []).append(index)
+        if frame < self.frame and (self.dirty is None or frame < self.dirty):
+            self.dirty = frame
+
+    def play_frame(self, snapshot: bool = True):
+        game = self.game
+        if snapshot:
+            self.history.append((self.frame, self.snapshot()))
+        presses = self.inputs.get(self.frame)
+        if presses:
+            game.process_actions([game.keys_list[index] for index in presses])
+        game.update(self.time_delta)
+        self.frame += 1
+
+    def snapshot(self) -> GameSnapshot:
+        '''Game.snapshot() with the RNG state, so that restore() does not replay the stream
+
+        The state only depends on the seed and the uniforms drawn, and most
+        frames draw none, so it is copied only when one of them changed.
+        '''
+        game = self.game
+        snapshot = game.snapshot(random_state=False)
+        key = game.seed, game.total_uniforms
+        if self.random_state[0] != key:
+            self.random_state = key, game.random.getstate()
+        snapshot.random_state = self.random_state[1]
+        return snapshot
+
+    def rollback(self):
+        '''Plays the frames since the earliest late input again'''
+        if self.dirty is None:
+            return
+        target = self.frame
+        history = self.history
+        # the snapshots after the dirty frame saw the wrong inputs
+        while history[-1][0] > self.dirty:
+            history.pop()
+        frame, snapshot = history[-1]
+        self.game.restore(snapshot)
+        self.frames_played_again += target - frame
+        self.frame = frame
+        self.dirty = None
+        self.rollbacks += 1
+        while self.frame < target:
+            self.play_frame(snapshot=False)
+
+    def step(self):
+        '''Corrects the game if inputs came late and plays the next frame'''
+        self.rollback()
+        self.play_frame()
+        # a rollback to the oldest frame that can still get an input starts from history[0]
+        history = self.history
+        while len(history) > 1 and history[1][0] <= self.frame - self.frames:
+            history.popleft()
+        # inputs and seeds of frames that can't be played again anymore
+        for frame in [frame for frame in self.inputs if frame < history[0][0]]:
+            del self.inputs[frame]
+        for frame in [frame for frame in self.seeds if frame < history[0][0]]:
+            del self.seeds[frame]
@@ -0,0 +1,365 @@
+'''Plain data copies of a Game, for lookahead and search bots
+
+GameSnapshot holds every value Game.update depends on as numbers, tuples
+and PathBuffer copies. References between objects are stored as indices:
+a player's rotator, a burst's active player (-1 for None). Spheres are
+(cx, cy, vx, vy, radius, color, mass, damping_factor) tuples.
+
+Game.snapshot() takes one, Game.restore() puts it back and Game.clone()
+builds a second Game from it, see there. fingerprint() hashes a game's
+snapshot, to check that two games are the same.
+
+to_bytes()/from_bytes() store a snapshot the way replays store everything
+(see encoding.py), replays use that for their keyframes. Integers are
+varints (signed ones zigzag-encoded, -1 indices are stored plus one),
+floats and mass and damping_factor float64, flags single bytes:
+
+    seed, total_uniforms, random state: 0 for None, else 1, version,
+        the 625 words as uint32, then 0 or 1 and gauss_next (float64)
+    stage, next stage (0 for None), timer, starting_angle, time_to_spawn_burst
+    death_order, scores, old_scores: count, then signed values
+    score1, score2, how_to_win_text, someone_won: 0, 1 or 2 and a color
+    player scores: 0 for None, else count + 1, then 4 signed numbers and
+        an optional color (0 for None, else 1 and the color) each
+    actions_in_last_frame: count, then player indices
+    players: count, then of each the sphere, rotator, dodge_initiated,
+        frames_from_dodge, path (maxlen, length, then the xs and the ys
+        newest first), queue, trail and attacking spheres, alive
+    active spheres, inactive spheres
+    bursts: count, then of each the sphere, middle radius, grow_rate,
+        alive, active, active player, frames_from_burst, frames_from_spawn
+
+A color is 3 bytes. A sphere is its 7 floats (the SphereData order without
+the color) and its color, a list of spheres is the count and the spheres.
+'''
+from array import array
+from dataclasses import dataclass
+from typing import Optional, Union
+import hashlib
+import struct
+
+from pygame import Vector2
+
+from .core import GameStage, PlayerScore, Sphere, SpherePool, PlayerSphere, RotatorSphere, Burst, PathBuffer
+from .encoding import write_varint, read_varint, write_signed, read_signed, write_string, read_string
+
+import typing
+if typing.TYPE_CHECKING:
+    from .game import Game
+
+SphereData = tuple[float, float, float, float, float, tuple[int, int, int], float, float]
+
+# Mersenne Twister words and index in random.getstate()
+RANDOM_WORDS = 625
+# the floats of SphereData, then the color
+SPHERE = struct.Struct('<7d3B')
+FLOATS2 = struct.Struct('<2d')
+FLOATS3 = struct.Struct('<3d')
+
+
+@dataclass
+class GameSnapshot:
+    seed: int
+    total_uniforms: int
+    # None to reach total_uniforms by replaying the stream, see Game.set_seed
+    random_state: Optional[tuple]
+    stage: GameStage
+    next_stage: Optional[GameStage]
+    timer: float
+    starting_angle: float
+    time_to_spawn_burst: float
+    death_order: tuple[int, ...]
+    scores: tuple[int, ...]
+    old_scores: tuple[int, ...]
+    score1: int
+    score2: int
+    how_to_win_text: str
+    someone_won: Union[bool, tuple[int, int, int]]
+    # PlayerScore fields as tuples, None before the first round ended
+    player_scores: Optional[tuple[tuple, ...]]
+    actions_in_last_frame: tuple[int, ...]
+    # see pack_player
+    players: tuple[tuple, ...]
+    active_spheres: tuple[SphereData, ...]
+    inactive_spheres: tuple[SphereData, ...]
+    # see pack_burst
+    bursts: tuple[tuple, ...]
+
+    def to_bytes(self) -> bytes:
+        buffer = bytearray()
+        write_varint(buffer, self.seed)
+        write_varint(buffer, self.total_uniforms)
+        if self.random_state is None:
+            buffer.append(0)
+        else:
+            version, words, gauss_next = self.random_state
+            buffer.append(1)
+            write_varint(buffer, version)
+            buffer += struct.pack(f'<{RANDOM_WORDS}I', *words)
+            write_optional_float(buffer, gauss_next)
+        write_varint(buffer, self.stage.value)
+        write_varint(buffer, 0 if self.next_stage is None else self.next_stage.value)
+        buffer += FLOATS3.pack(self.timer, self.starting_angle, self.time_to_spawn_burst)
+        for numbers in self.death_order, self.scores, self.old_scores:
+            write_varint(buffer, len(numbers))
+            for number in numbers:
+                write_signed(buffer, number)
+        write_signed(buffer, self.score1)
+        write_signed(buffer, self.score2)
+        write_string(buffer, self.how_to_win_text)
+        if isinstance(self.someone_won, bool):
+            buffer.append(self.someone_won)
+        else:
+            buffer.append(2)
+            buffer += bytes(self.someone_won)
+        if self.player_scores is None:
+            write_varint(buffer, 0)
+        else:
+            write_varint(buffer, len(self.player_scores) + 1)
+            for *numbers, color in self.player_scores:
+                for number in numbers:
+                    write_signed(buffer, number)
+                if color is None:
+                    buffer.append(0)
+                else:
+                    buffer.append(1)
+                    buffer += bytes(color)
+        write_varint(buffer, len(self.actions_in_last_frame))
+        for index in self.actions_in_last_frame:
+            write_varint(buffer, index)
+        write_varint(buffer, len(self.players))
+        for sphere, rotator, dodge_initiated, frames_from_dodge, path, queue, trail, attacking, alive in self.players:
+            write_sphere(buffer, sphere)
+            write_varint(buffer, rotator + 1)
+            buffer.append(dodge_initiated)
+            write_varint(buffer, frames_from_dodge)
+            write_path(buffer, path)
+            write_spheres(buffer, queue)
+            write_spheres(buffer, trail)
+            write_spheres(buffer, attacking)
+            buffer.append(alive)
+        write_spheres(buffer, self.active_spheres)
+        write_spheres(buffer, self.inactive_spheres)
+        write_varint(buffer, len(self.bursts))
+        for sphere, middle_radius, grow_rate, alive, active, active_player, frames_from_burst, frames_from_spawn in self.bursts:
+            write_sphere(buffer, sphere)
+            buffer += FLOATS2.pack(middle_radius, grow_rate)
+            buffer.append(alive)
+            buffer.append(active)
+            write_varint(buffer, active_player + 1)
+            write_varint(buffer, frames_from_burst)
+            write_varint(buffer, frames_from_spawn)
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'GameSnapshot':
+        seed, position = read_varint(data, 0)
+        total_uniforms, position = read_varint(data, position)
+        random_state = None
+        if data[position]:
+            version, position = read_varint(data, position + 1)
+            words = struct.unpack_from(f'<{RANDOM_WORDS}I', data, position)
+            gauss_next, position = read_optional_float(data, position + 4 * RANDOM_WORDS)
+            random_state = version, words, gauss_next
+        else:
+            position += 1
+        stage, position = read_varint(data, position)
+        next_stage, position = read_varint(data, position)
+        timer, starting_angle, time_to_spawn_burst = FLOATS3.unpack_from(data, position)
+        position += FLOATS3.size
+        tuples = []
+        for _ in range(3):
+            count, position = read_varint(data, position)
+            numbers = []
+            for _ in range(count):
+                number, position = read_signed(data, position)
+                numbers.append(number)
+            tuples.append(tuple(numbers))
+        death_order, scores, old_scores = tuples
+        score1, position = read_signed(data, position)
+        score2, position = read_signed(data, position)
+        how_to_win_text, position = read_string(data, position)
+        someone_won = data[position]
+        position += 1
+        if someone_won == 2:
+            someone_won = tuple(data[position:position + 3])
+            position += 3
+        else:
+            someone_won = bool(someone_won)
+        count, position = read_varint(data, position)
+        player_scores = None
+        if count:
+            player_scores = []
+            for _ in range(count - 1):
+                numbers = []
+                for _ in range(4):
+                    number, position = read_signed(data, position)
+                    numbers.append(number)
+                color = None
+                if data[position]:
+                    color = tuple(data[position + 1:position + 4])
+                    position += 3
+                position += 1
+                player_scores.append((*numbers, color))
+            player_scores = tuple(player_scores)
+        count, position = read_varint(data, position)
+        actions_in_last_frame = []
+        for _ in range(count):
+            index, position = read_varint(data, position)
+            actions_in_last_frame.append(index)
+        count, position = read_varint(data, position)
+        players = []
+        for _ in range(count):
+            sphere, position = read_sphere(data, position)
+            rotator, position = read_varint(data, position)
+            dodge_initiated = bool(data[position])
+            frames_from_dodge, position = read_varint(data, position + 1)
+            path, position = read_path(data, position)
+            queue, position = read_spheres(data, position)
+            trail, position = read_spheres(data, position)
+            attacking, position = read_spheres(data, position)
+            alive = bool(data[position])
+            position += 1
+            players.append((sphere, rotator - 1, dodge_initiated, frames_from_dodge, path, queue, trail, attacking, alive))
+        active_spheres, position = read_spheres(data, position)
+        inactive_spheres, position = read_spheres(data, position)
+        count, position = read_varint(data, position)
+        bursts = []
+        for _ in range(count):
+            sphere, position = read_sphere(data, position)
+            middle_radius, grow_rate = FLOATS2.unpack_from(data, position)
+            position += FLOATS2.size
+            alive, active = bool(data[position]), bool(data[position + 1])
+            active_player, position = read_varint(data, position + 2)
+            frames_from_burst, position = read_varint(data, position)
+            frames_from_spawn, position = read_varint(data, position)
+            bursts.append((sphere, middle_radius, grow_rate, alive, active, active_player - 1, frames_from_burst, frames_from_spawn))
+        return cls(seed, total_uniforms, random_state, GameStage(stage), GameStage(next_stage) if next_stage else None,
+                   timer, starting_angle, time_to_spawn_burst, death_order, scores, old_scores, score1, score2,
+                   how_to_win_text, someone_won, player_scores, tuple(actions_in_last_frame), tuple(players),
+                   active_spheres, inactive_spheres, tuple(bursts))
+
+
+def pack_sphere(s: Sphere) -> SphereData:
+    return (s.center.x, s.center.y, s.velocity.x, s.velocity.y, s.radius, s.color, s.mass, s.damping_factor)
+
+def unpack_sphere(data: SphereData) -> Sphere:
+    cx, cy, vx, vy, radius, color, mass, damping_factor = data
+    return Sphere(Vector2(cx, cy), Vector2(vx, vy), radius, color, mass, damping_factor)
+
+def pack_player(p: PlayerSphere, rotators: list[RotatorSphere]) -> tuple:
+    return (pack_sphere(p),
+            -1 if p.rotating_around is None else rotators.index(p.rotating_around),
+            p.dodge_initiated,
+            p.frames_from_dodge,
+            p.path.copy(),
+            tuple(map(pack_sphere, p.queue_to_trail)),
+            tuple(map(pack_sphere, p.trail)),
+            tuple(map(pack_sphere, p.attacking_spheres)),
+            p.alive)
+
+def unpack_player(p: PlayerSphere, data: tuple, rotators: list[RotatorSphere]):
+    '''Sets the fields of p from pack_player() data'''
+    sphere, rotator, p.dodge_initiated, p.frames_from_dodge, path, queue, trail, attacking, p.alive = data
+    cx, cy, vx, vy, p.radius, p.color, p.mass, p.damping_factor = sphere
+    p.center = Vector2(cx, cy)
+    p.velocity = Vector2(vx, vy)
+    p.rotating_around = None if rotator == -1 else rotators[rotator]
+    # the snapshot can be restored again, so its path is not handed out
+    p.path = path.copy()
+    p.queue_to_trail = SpherePool(map(unpack_sphere, queue))
+    p.trail = list(map(unpack_sphere, trail))
+    p.attacking_spheres = SpherePool(map(unpack_sphere, attacking))
+
+def write_path(buffer: bytearray, path: PathBuffer):
+    # only the positions in use, newest first
+    indices = [path.physical_index(i) for i in range(path.length)]
+    write_varint(buffer, path.maxlen)
+    write_varint(buffer, path.length)
+    buffer += struct.pack(f'<{2 * path.length}d', *[path.xs[i] for i in indices], *[path.ys[i] for i in indices])
+
+def read_path(data: bytes, position: int) -> tuple[PathBuffer, int]:
+    maxlen, position = read_varint(data, position)
+    length, position = read_varint(data, position)
+    path = PathBuffer(maxlen, capacity=length)
+    values = struct.unpack_from(f'<{2 * length}d', data, position)
+    path.xs[:length] = array('d', values[:length])
+    path.ys[:length] = array('d', values[length:])
+    path.length = length
+    return path, position + 16 * length
+
+def write_sphere(buffer: bytearray, sphere: SphereData):
+    cx, cy, vx, vy, radius, color, mass, damping_factor = sphere
+    buffer += SPHERE.pack(cx, cy, vx, vy, radius, mass, damping_factor, *color)
+
+def read_sphere(data: bytes, position: int) -> tuple[SphereData, int]:
+    cx, cy, vx, vy, radius, mass, damping_factor, r, g, b = SPHERE.unpack_from(data, position)
+    return (cx, cy, vx, vy, radius, (r, g, b), mass, damping_factor), position + SPHERE.size
+
+def write_spheres(buffer: bytearray, spheres: tuple[SphereData, ...]):
+    write_varint(buffer, len(spheres))
+    for sphere in spheres:
+        write_sphere(buffer, sphere)
+
+def read_spheres(data: bytes, position: int) -> tuple[tuple[SphereData, ...], int]:
+    count, position = read_varint(data, position)
+    end = position + count * SPHERE.size
+    spheres = tuple((cx, cy, vx, vy, radius, (r, g, b), mass, damping_factor)
+                    for cx, cy, vx, vy, radius, mass, damping_factor, r, g, b in SPHERE.iter_unpack(data[position:end]))
+    return spheres, end
+
+def write_optional_float(buffer: bytearray, value: Optional[float]):
+    if value is None:
+        buffer.append(0)
+    else:
+        buffer.append(1)
+        buffer += struct.pack('<d', value)
+
+def read_optional_float(data: bytes, position: int) -> tuple[Optional[float], int]:
+    if not data[position]:
+        return None, position + 1
+    return struct.unpack_from('<d', data, position + 1)[0], position + 9
+
+def pack_burst(b: Burst, players: list[PlayerSphere]) -> tuple:
+    return (pack_sphere(b),
+            b.middle_sphere.radius,
+            b.grow_rate,
+            b.alive,
+            b.active,
+            -1 if b.active_player is None else players.index(b.active_player),
+            b.frames_from_burst,
+            b.frames_from_spawn)
+
+def unpack_burst(data: tuple, players: list[PlayerSphere]) -> Burst:
+    sphere, middle_radius, grow_rate, alive, active, active_player, frames_from_burst, frames_from_spawn = data
+    cx, cy, vx, vy, radius, color, mass, damping_factor = sphere
+    b = Burst(Vector2(cx, cy), radius)
+    b.velocity.update(vx, vy)
+    b.color, b.mass, b.damping_factor = color, mass, damping_factor
+    b.middle_sphere.radius = middle_radius
+    b.grow_rate = grow_rate
+    b.alive = alive
+    b.active = active
+    b.active_player = None if active_player == -1 else players[active_player]
+    b.frames_from_burst = frames_from_burst
+    b.frames_from_spawn = frames_from_spawn
+    return b
+
+def pack_player_scores(player_scores: Optional[list[PlayerScore]]):
+    if player_scores is None:
+        return None
+    return tuple((p.old_score, p.old_position, p.new_score, p.new_position, p.color) for p in player_scores)
+
+def unpack_player_scores(data: Optional[tuple[tuple, ...]]):
+    if data is None:
+        return None
+    return [PlayerScore(*score) for score in data]
+
+
+def fingerprint(game: 'Game') -> str:
+    '''The start of the sha256 of game's snapshot
+
+    The RNG state is left out, it follows from seed and total_uniforms and a
+    game restored without it (a late joiner, a rollback) hasn't got it.
+    '''
+    return hashlib.sha256(game.snapshot(random_state=False).to_bytes()).hexdigest()[:16]
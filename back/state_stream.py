@@ -0,0 +1,559 @@
+'''Streaming what is drawn of a Game to spectators that don't simulate it
+
+StateEncoder turns the front state of every frame into a message: a full
+one every keyframe_interval frames (and when asked for, for somebody who
+just started listening), deltas against the previous message in between.
+StateDecoder rebuilds a GameStateFront from them that front.draw_game
+draws like the game's own, up to the quantization: positions and radii are
+sent in 1/QUANTUM of a unit (map1's height), directions in 1/ANGLE_STEPS of a
+turn and the timer in milliseconds.
+
+Every sphere gets an id the first time it is sent, its Python object is
+what identifies it (Sphere compares by identity), so a sphere keeps its id
+while it goes from the field to a trail and back. Ids count from 0 again
+at every full message, a sphere that is in no container any more is
+forgotten and its id is not given to another one. Containers are id
+lists: players, active, inactive and bursts, and the trail, queue and
+attacking spheres of every player.
+
+A message is varints (signed ones zigzag-encoded), sections in this order:
+
+    kind (FULL, DELTA), flags (which of the optional sections follow)
+    timer (DELTA: the change)
+    STAGE: stage; TEXT: how_to_win_text; SCORES: player_scores; WON: someone_won
+    ROTATORS: width and height of the arena, count, then x, y, radius of each rotator;
+        LABELS: per player the bot class name, '' for humans
+    new spheres: count, then kind, x, y, radius, color of each (ids follow the last one)
+    changed containers: count, then code << 1 | whole, then either the whole
+        id list or the removed ids and the appended ids
+    moved spheres: count, then id step, dx, dy of each; resized: id step, dr;
+        recolored: id step, color
+    players: count, then index, alive | dodging << 1, direction of each;
+        bursts: id step, radius of the middle sphere
+
+where an id step is the id minus the previous id in the list minus 1.
+Only what changed is sent, a quiet frame is a dozen bytes.
+
+write_message()/read_message() frame messages on a file or pipe,
+StateBroadcaster sends them to everybody connected to a local socket.
+'''
+from collections import deque
+from typing import Optional
+import asyncio
+import math
+
+from pygame import Vector2
+
+from .core import GameStage, GameStateFront, PlayerScore, Sphere, SpherePool, PlayerSphere, RotatorSphere, Burst, DEFAULT_SPEED
+from .encoding import write_varint, read_varint, write_signed, read_signed, write_string, read_string
+
+import typing
+if typing.TYPE_CHECKING:
+    from .game import Game
+
+# 2 s at 60 fps
+KEYFRAME_INTERVAL = 120
+
+# positions and radii are sent in these steps of a unit, the height of a map1 arena
+QUANTUM = 8192
+ANGLE_STEPS = 4096
+
+FULL = 0
+DELTA = 1
+
+# flags
+STAGE = 1
+TEXT = 2
+SCORES = 4
+WON = 8
+ROTATORS = 16
+LABELS = 32
+
+# kinds of new spheres
+SPHERE = 0
+PLAYER = 1
+BURST = 2
+
+# container codes, then 4 + 3 * player index + TRAIL/QUEUE/ATTACKING
+PLAYERS = 0
+ACTIVE = 1
+INACTIVE = 2
+BURSTS = 3
+TRAIL = 0
+QUEUE = 1
+ATTACKING = 2
+
+def quantize(value: float) -> int:
+    return round(value * QUANTUM)
+
+def pack_color(color) -> int:
+    r, g, b = tuple(color)[:3]
+    return r << 16 | g << 8 | b
+
+def unpack_color(value: int) -> tuple[int, int, int]:
+    return value >> 16, value >> 8 & 0xff, value & 0xff
+
+def write_optional_color(buffer: bytearray, color):
+    # False/None as 0
+    write_varint(buffer, pack_color(color) + 1 if color else 0)
+
+def read_optional_color(data: bytes, position: int, none):
+    value, position = read_varint(data, position)
+    return (unpack_color(value - 1) if value else none), position
+
+def write_ids(buffer: bytearray, ids: list[int]):
+    write_varint(buffer, len(ids))
+    for sid in ids:
+        write_varint(buffer, sid)
+
+def read_ids(data: bytes, position: int) -> tuple[list[int], int]:
+    count, position = read_varint(data, position)
+    ids = []
+    for _ in range(count):
+        sid, position = read_varint(data, position)
+        ids.append(sid)
+    return ids, position
+
+
+class StateEncoder:
+    '''Encodes the front state of game after every frame, see encode()'''
+    def __init__(self, game: 'Game', keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.frames_since_full = 0
+        # the next message is FULL
+        self.full_requested = True
+        self.reset()
+
+    def reset(self):
+        # the spheres in the containers, in the order of their ids
+        self.ids: dict[Sphere, int] = {}
+        self.spheres: dict[int, Sphere] = {}
+        self.next_id = 0
+        # id -> (x, y, radius, color) as last sent
+        self.sent: dict[int, tuple[int, int, int, int]] = {}
+        self.containers: dict[int, list[int]] = {}
+        # player index -> (flags, direction), burst id -> middle radius
+        self.players: dict[int, tuple[int, int]] = {}
+        self.bursts: dict[int, int] = {}
+        self.timer = 0
+        self.stage = None
+        self.how_to_win_text = None
+        self.player_scores = None
+        self.someone_won = None
+        self.size = None
+        self.rotators = None
+        self.labels = None
+
+    def request_full(self):
+        self.full_requested = True
+
+    def encode(self) -> bytes:
+        game = self.game
+        full = self.full_requested or self.frames_since_full >= self.keyframe_interval
+        if full:
+            self.reset()
+            self.full_requested = False
+            self.frames_since_full = 0
+        self.frames_since_full += 1
+
+        flags = 0
+        stage = game.stage.value
+        if stage != self.stage:
+            flags |= STAGE
+        if game.how_to_win_text != self.how_to_win_text:
+            flags |= TEXT
+        player_scores = None if game.player_scores is None else \
+            tuple((p.old_score, p.old_position, p.new_score, p.new_position, p.color) for p in game.player_scores)
+        if full or player_scores != self.player_scores:
+            flags |= SCORES
+        if full or game.someone_won != self.someone_won:
+            flags |= WON
+        size = quantize(game.size[0]), quantize(game.size[1])
+        rotators = [(quantize(r.center.x), quantize(r.center.y), quantize(r.radius)) for r in game.rotators]
+        if size != self.size or rotators != self.rotators:
+            flags |= ROTATORS
+        labels = ['' if p.bot is None else type(p.bot).__name__ for p in game.player_spheres]
+        if labels != self.labels:
+            flags |= LABELS
+
+        message = bytearray()
+        write_varint(message, FULL if full else DELTA)
+        write_varint(message, flags)
+        timer = round(game.timer * 1000)
+        write_signed(message, timer - self.timer)
+        self.timer = timer
+        if flags & STAGE:
+            write_varint(message, stage)
+            self.stage = stage
+        if flags & TEXT:
+            write_string(message, game.how_to_win_text)
+            self.how_to_win_text = game.how_to_win_text
+        if flags & SCORES:
+            if player_scores is None:
+                write_varint(message, 0)
+            else:
+                write_varint(message, len(player_scores) + 1)
+                for *numbers, color in player_scores:
+                    for number in numbers:
+                        write_signed(message, number)
+                    write_optional_color(message, color)
+            self.player_scores = player_scores
+        if flags & WON:
+            write_optional_color(message, game.someone_won)
+            self.someone_won = game.someone_won
+        if flags & ROTATORS:
+            for value in size:
+                write_varint(message, value)
+            self.size = size
+            write_varint(message, len(rotators))
+            for values in rotators:
+                for value in values:
+                    write_signed(message, value)
+            self.rotators = rotators
+        if flags & LABELS:
+            write_varint(message, len(labels))
+            for label in labels:
+                write_string(message, label)
+            self.labels = labels
+
+        # containers, with ids for the spheres seen for the first time
+        players = game.player_spheres
+        containers = {PLAYERS: players, ACTIVE: game.active_spheres, INACTIVE: game.inactive_spheres, BURSTS: game.bursts}
+        for index, p in enumerate(players):
+            containers[4 + 3 * index + TRAIL] = p.trail
+            containers[4 + 3 * index + QUEUE] = p.queue_to_trail
+            containers[4 + 3 * index + ATTACKING] = p.attacking_spheres
+        new = []
+        ids = self.ids
+        lists = {}
+        for code, spheres in containers.items():
+            lists[code] = sphere_ids = []
+            for sphere in spheres:
+                sid = ids.get(sphere)
+                if sid is None:
+                    sid = ids[sphere] = self.next_id
+                    self.spheres[sid] = sphere
+                    self.next_id += 1
+                    new.append(sphere)
+                sphere_ids.append(sid)
+
+        write_varint(message, len(new))
+        for sphere in new:
+            write_varint(message, PLAYER if isinstance(sphere, PlayerSphere) else BURST if isinstance(sphere, Burst) else SPHERE)
+            values = quantize(sphere.center.x), quantize(sphere.center.y), quantize(sphere.radius), pack_color(sphere.color)
+            write_signed(message, values[0])
+            write_signed(message, values[1])
+            write_varint(message, values[2])
+            write_varint(message, values[3])
+            self.sent[ids[sphere]] = values
+
+        changed = [(code, sphere_ids) for code, sphere_ids in lists.items() if self.containers.get(code, []) != sphere_ids]
+        write_varint(message, len(changed))
+        # ids removed from a container, forgotten below unless they are in another one
+        gone = []
+        for code, sphere_ids in changed:
+            old = self.containers.get(code, [])
+            now = set(sphere_ids)
+            removed = [sid for sid in old if sid not in now]
+            gone += removed
+            kept = [sid for sid in old if sid in now]
+            # spheres only disappear and get appended most of the time, anything else is sent whole
+            if sphere_ids[:len(kept)] == kept and len(removed) + len(sphere_ids) - len(kept) < len(sphere_ids):
+                write_varint(message, code << 1)
+                write_ids(message, removed)
+                write_ids(message, sphere_ids[len(kept):])
+            else:
+                write_varint(message, code << 1 | 1)
+                write_ids(message, sphere_ids)
+            self.containers[code] = sphere_ids
+        for code in [code for code in self.containers if code not in lists]:
+            # the players of the last round had more containers
+            gone += self.containers.pop(code)
+        if gone:
+            live = set().union(*lists.values())
+            for sid in set(gone) - live:
+                del ids[self.spheres.pop(sid)]
+                del self.sent[sid]
+                self.bursts.pop(sid, None)
+
+        moved = []
+        resized = []
+        recolored = []
+        sent = self.sent
+        for sphere, sid in ids.items():
+            x, y, radius, color = sent[sid]
+            nx, ny = quantize(sphere.center.x), quantize(sphere.center.y)
+            if nx != x or ny != y:
+                moved.append((sid, nx - x, ny - y))
+            nradius = quantize(sphere.radius)
+            if nradius != radius:
+                resized.append((sid, nradius - radius))
+            ncolor = pack_color(sphere.color)
+            if ncolor != color:
+                recolored.append((sid, ncolor))
+            if (nx, ny, nradius, ncolor) != (x, y, radius, color):
+                sent[sid] = nx, ny, nradius, ncolor
+        for entries in (moved, resized, recolored):
+            write_varint(message, len(entries))
+            last = -1
+            for sid, *values in entries:
+                write_varint(message, sid - last - 1)
+                last = sid
+                for value in values:
+                    if entries is recolored:
+                        write_varint(message, value)
+                    else:
+                        write_signed(message, value)
+
+        changed_players = []
+        for index, p in enumerate(players):
+            values = p.alive | p.is_dodging() << 1, round(math.atan2(p.velocity.y, p.velocity.x) / math.tau * ANGLE_STEPS) % ANGLE_STEPS
+            if self.players.get(index) != values:
+                changed_players.append((index, values))
+                self.players[index] = values
+        write_varint(message, len(changed_players))
+        for index, (player_flags, direction) in changed_players:
+            write_varint(message, index)
+            write_varint(message, player_flags)
+            write_varint(message, direction)
+
+        changed_bursts = []
+        for burst, sid in zip(game.bursts, lists[BURSTS]):
+            radius = quantize(burst.middle_sphere.radius)
+            if self.bursts.get(sid) != radius:
+                changed_bursts.append((sid, radius))
+                self.bursts[sid] = radius
+        write_varint(message, len(changed_bursts))
+        last = -1
+        for sid, radius in sorted(changed_bursts):
+            write_varint(message, sid - last - 1)
+            last = sid
+            write_varint(message, radius)
+        return bytes(message)
+
+
+class StateDecoder:
+    '''Rebuilds the GameStateFront of every message, decode() returns None until the first FULL one'''
+    def __init__(self):
+        self.started = False
+        self.reset()
+
+    def reset(self):
+        self.spheres: list[Sphere] = []
+        self.containers: dict[int, list[int]] = {}
+        self.timer = 0
+        self.stage = GameStage.ROTATING_AROUND_CENTER
+        self.how_to_win_text = ''
+        self.player_scores = None
+        self.someone_won = False
+        self.size = (2, 1)
+        self.rotators: list[RotatorSphere] = []
+        self.labels: list[str] = []
+        # stand-ins for the bots, only their class names are drawn
+        self.bots = {}
+
+    def bot(self, label: str):
+        if not label:
+            return None
+        if label not in self.bots:
+            self.bots[label] = type(label, (), {})()
+        return self.bots[label]
+
+    def decode(self, data: bytes) -> Optional[GameStateFront]:
+        kind, position = read_varint(data, 0)
+        if kind == FULL:
+            self.reset()
+            self.started = True
+        elif not self.started:
+            return None
+        flags, position = read_varint(data, position)
+        timer, position = read_signed(data, position)
+        self.timer += timer
+        if flags & STAGE:
+            stage, position = read_varint(data, position)
+            self.stage = GameStage(stage)
+        if flags & TEXT:
+            self.how_to_win_text, position = read_string(data, position)
+        if flags & SCORES:
+            count, position = read_varint(data, position)
+            if count == 0:
+                self.player_scores = None
+            else:
+                self.player_scores = []
+                for _ in range(count - 1):
+                    numbers = []
+                    for _ in range(4):
+                        number, position = read_signed(data, position)
+                        numbers.append(number)
+                    color, position = read_optional_color(data, position, None)
+                    self.player_scores.append(PlayerScore(*numbers, color))
+        if flags & WON:
+            self.someone_won, position = read_optional_color(data, position, False)
+        if flags & ROTATORS:
+            width, position = read_varint(data, position)
+            height, position = read_varint(data, position)
+            self.size = (width / QUANTUM, height / QUANTUM)
+            count, position = read_varint(data, position)
+            self.rotators = []
+            for _ in range(count):
+                x, position = read_signed(data, position)
+                y, position = read_signed(data, position)
+                radius, position = read_signed(data, position)
+                self.rotators.append(RotatorSphere(Vector2(x / QUANTUM, y / QUANTUM), radius / QUANTUM))
+        if flags & LABELS:
+            count, position = read_varint(data, position)
+            self.labels = []
+            for _ in range(count):
+                label, position = read_string(data, position)
+                self.labels.append(label)
+
+        count, position = read_varint(data, position)
+        for _ in range(count):
+            kind, position = read_varint(data, position)
+            x, position = read_signed(data, position)
+            y, position = read_signed(data, position)
+            radius, position = read_varint(data, position)
+            color, position = read_varint(data, position)
+            center = Vector2(x / QUANTUM, y / QUANTUM)
+            if kind == PLAYER:
+                sphere = PlayerSphere(center, Vector2(DEFAULT_SPEED, 0), radius / QUANTUM, unpack_color(color))
+            elif kind == BURST:
+                sphere = Burst(center, radius / QUANTUM)
+                sphere.color = unpack_color(color)
+            else:
+                sphere = Sphere(center, Vector2(0, 0), radius / QUANTUM, unpack_color(color))
+            self.spheres.append(sphere)
+
+        spheres = self.spheres
+        count, position = read_varint(data, position)
+        for _ in range(count):
+            value, position = read_varint(data, position)
+            code = value >> 1
+            if value & 1:
+                self.containers[code], position = read_ids(data, position)
+            else:
+                removed, position = read_ids(data, position)
+                appended, position = read_ids(data, position)
+                removed = set(removed)
+                self.containers[code] = [sid for sid in self.containers.get(code, []) if sid not in removed] + appended
+
+        for section in range(3):
+            count, position = read_varint(data, position)
+            sid = -1
+            for _ in range(count):
+                step, position = read_varint(data, position)
+                sid += step + 1
+                sphere = spheres[sid]
+                if section == 0:
+                    dx, position = read_signed(data, position)
+                    dy, position = read_signed(data, position)
+                    # a burst's middle sphere has the same center vector, it moves along
+                    sphere.center.update(sphere.center.x + dx / QUANTUM, sphere.center.y + dy / QUANTUM)
+                elif section == 1:
+                    dr, position = read_signed(data, position)
+                    sphere.radius += dr / QUANTUM
+                else:
+                    color, position = read_varint(data, position)
+                    sphere.color = unpack_color(color)
+
+        players = [spheres[sid] for sid in self.containers.get(PLAYERS, [])]
+        count, position = read_varint(data, position)
+        for _ in range(count):
+            index, position = read_varint(data, position)
+            player_flags, position = read_varint(data, position)
+            direction, position = read_varint(data, position)
+            p = players[index]
+            p.alive = bool(player_flags & 1)
+            p.frames_from_dodge = 1 if player_flags & 2 else 0
+            p.velocity = Vector2(DEFAULT_SPEED, 0).rotate_rad(direction / ANGLE_STEPS * math.tau)
+        count, position = read_varint(data, position)
+        sid = -1
+        for _ in range(count):
+            step, position = read_varint(data, position)
+            sid += step + 1
+            radius, position = read_varint(data, position)
+            spheres[sid].middle_sphere.radius = radius / QUANTUM
+
+        for index, p in enumerate(players):
+            p.bot = self.bot(self.labels[index]) if index < len(self.labels) else None
+            p.trail = [spheres[sid] for sid in self.containers.get(4 + 3 * index + TRAIL, [])]
+            p.queue_to_trail = SpherePool(spheres[sid] for sid in self.containers.get(4 + 3 * index + QUEUE, []))
+            p.attacking_spheres = SpherePool(spheres[sid] for sid in self.containers.get(4 + 3 * index + ATTACKING, []))
+
+        def pool(code):
+            return SpherePool(spheres[sid] for sid in self.containers.get(code, []))
+        return GameStateFront(players, pool(ACTIVE), pool(INACTIVE), pool(BURSTS), self.rotators, self.size,
+                              self.timer / 1000, [], None, 0,
+                              self.player_scores, self.how_to_win_text, self.stage, self.someone_won)
+
+
+def write_message(file, data: bytes):
+    length = bytearray()
+    write_varint(length, len(data))
+    file.write(bytes(length) + data)
+
+def read_message(file) -> Optional[bytes]:
+    '''The next message from a binary file, None at its end'''
+    length = 0
+    shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return None
+        length |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            break
+        shift += 7
+    data = file.read(length)
+    return data if len(data) == length else None
+
+
+class StateBroadcaster:
+    '''Sends the messages of an encoder to everybody connected, framed like write_message()
+
+    Somebody who connects gets the messages from the next FULL one on, which
+    is asked from the encoder right away.
+    '''
+    def __init__(self, encoder: StateEncoder):
+        self.encoder = encoder
+        self.writers: list[asyncio.StreamWriter] = []
+        # connected, waiting for a FULL message
+        self.waiting: list[asyncio.StreamWriter] = []
+        self.bytes_sent = 0
+
+    async def start(self, host: str = 'localhost', port: int = 0) -> asyncio.Server:
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.waiting.append(writer)
+        self.encoder.request_full()
+        # nothing is read, this only notices when they leave
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        for writers in (self.writers, self.waiting):
+            if writer in writers:
+                writers.remove(writer)
+        writer.close()
+
+    def publish(self, data: bytes):
+        if data[0] == FULL:
+            self.writers += self.waiting
+            self.waiting = []
+        length = bytearray()
+        write_varint(length, len(data))
+        message = bytes(length) + data
+        for writer in self.writers:
+            writer.write(message)
+        self.bytes_sent += len(message) * len(self.writers)
+
+    def step(self):
+        '''Encodes the frame the game just played and sends it, if anybody listens'''
+        if self.writers or self.waiting:
+            self.publish(self.encoder.encode())
+
+    def close(self):
+        for writer in self.writers + self.waiting:
+            writer.close()
@@ -0,0 +1,219 @@
+'''Many Games stepped in lockstep, for training bots
+
+VecEnv holds N games, each with its own seed and roster (the same colors
+dicts Game takes). step() takes one action bit per player of every game,
+advances all games by one frame and returns NumPy arrays:
+
+    obs['players']  (N, P, PLAYER_FEATURES) x, y, vx, vy, alive, dodging,
+                    can dodge, rotating, trail length
+    obs['spheres']  (N, max_spheres, 3) x, y, 1 for active / 2 for inactive,
+                    the first max_spheres lying around, zero padded
+    obs['player_mask'], obs['stage'], obs['timer']
+    rewards         (N, P) points, see GameBatch.step
+    dones           (N,) the game reached END_SCREEN and was restarted
+
+P is the largest roster, smaller rosters are padded (player_mask is False
+there). Players of a roster that have a bot are still driven by the bot,
+their action bits are ignored.
+
+A frame of a game is plain Python, so one process tops out at a few
+thousand games*frames per second. With workers > 1 the games are split
+into GameBatches living in worker processes that step in lockstep. Every
+game draws its seeds from its own stream, so the results don't depend on
+the number of workers.
+'''
+from typing import Optional, Callable
+import multiprocessing
+import random
+
+import numpy as np
+
+from .core import Team, GameStage, PlayerSphere
+from .game import Game
+
+PLAYER_FEATURES = 9
+
+Roster = dict[int, tuple[Team, str, Optional[Callable[[], PlayerSphere]]]]
+
+
+class GameBatch:
+    '''Games of a VecEnv that are stepped by one process'''
+    def __init__(self, rosters: list[Roster], seeds: list[int], num_players: int,
+                 time_delta: float, max_spheres: int, game_kwargs: dict):
+        self.num_players = num_players
+        self.time_delta = time_delta
+        self.max_spheres = max_spheres
+        # the first seed and the seeds of restarts of each game
+        self.seeds = [random.Random(seed) for seed in seeds]
+        self.games = [Game(roster, self.next_seed(n), **game_kwargs) for n, roster in enumerate(rosters)]
+        # points already handed out as rewards in the current round, see step
+        self.credited = np.zeros((len(self.games), num_players))
+
+    def next_seed(self, n: int):
+        return self.seeds[n].randint(0, 1000000000)
+
+    def reset(self):
+        for n, game in enumerate(self.games):
+            game.restart_game(self.next_seed(n))
+        self.credited[:] = 0
+        return self.observe()
+
+    def step(self, actions: list[list[bool]]):
+        '''Advances every game by one frame
+
+        A player is rewarded with the points of their place in death_order in
+        the frame they die, the survivor gets theirs when the round ends.
+        Over a round the rewards add up to the change of Game.scores.
+
+        Games that reach END_SCREEN are restarted with a new seed right away:
+        their obs already belong to the new game and infos[n] holds the
+        final 'scores' and the 'seed' of the finished one.
+        '''
+        rewards = np.zeros((len(self.games), self.num_players))
+        dones = np.zeros(len(self.games), dtype=bool)
+        infos = [{} for _ in self.games]
+        for n, (game, pressed) in enumerate(zip(self.games, actions)):
+            keys = [key for key, press in zip(game.keys_list, pressed) if press]
+            if keys:
+                game.process_actions(keys)
+            deaths = len(game.death_order)
+            scores = list(game.scores)
+
+            game.update(self.time_delta)
+
+            if game.scores != scores:
+                # the round ended, process_results has emptied death_order
+                for player, (new, old) in enumerate(zip(game.scores, scores)):
+                    rewards[n, player] = new - old - self.credited[n, player]
+                self.credited[n] = 0
+            elif game.stage == GameStage.GAMING:
+                for place in range(deaths, len(game.death_order)):
+                    player = game.death_order[place]
+                    rewards[n, player] += place
+                    self.credited[n, player] += place
+
+            if game.stage == GameStage.END_SCREEN:
+                dones[n] = True
+                infos[n] = {'scores': list(game.scores), 'seed': game.seed}
+                game.restart_game(self.next_seed(n))
+                self.credited[n] = 0
+        return self.observe(), rewards, dones, infos
+
+    def observe(self):
+        padding = (0,) * PLAYER_FEATURES
+        players = []
+        spheres = []
+        for game in self.games:
+            rows = [(p.center.x, p.center.y, p.velocity.x, p.velocity.y, p.alive, p.is_dodging(),
+                     p.can_dodge(), p.rotating_around is not None, len(p.trail)) for p in game.player_spheres]
+            players += rows
+            players += [padding] * (self.num_players - len(rows))
+            rows = [(s.center.x, s.center.y, 1) for _, s in zip(range(self.max_spheres), game.active_spheres)]
+            if len(rows) < self.max_spheres:
+                rows += [(s.center.x, s.center.y, 2) for _, s in zip(range(self.max_spheres - len(rows)), game.inactive_spheres)]
+            spheres += rows
+            spheres += [(0, 0, 0)] * (self.max_spheres - len(rows))
+        players = np.array(players, dtype=float).reshape(len(self.games), self.num_players, PLAYER_FEATURES)
+        spheres = np.array(spheres, dtype=float).reshape(len(self.games), self.max_spheres, 3)
+        stage = np.array([game.stage.value for game in self.games])
+        timer = np.array([game.timer for game in self.games], dtype=float)
+        return players, spheres, stage, timer
+
+
+def run_worker(connection, *batch_args):
+    batch = GameBatch(*batch_args)
+    while True:
+        command, data = connection.recv()
+        if command == 'step':
+            connection.send(batch.step(data))
+        elif command == 'reset':
+            connection.send(batch.reset())
+        elif command == 'close':
+            connection.close()
+            return
+
+
+class VecEnv:
+    def __init__(self,
+                 rosters: list[Roster],
+                 seed: Optional[int] = None,
+                 time_delta: float = 1 / 60,
+                 max_spheres: int = 32,
+                 workers: int = 1,
+                 **game_kwargs):
+        self.num_envs = len(rosters)
+        self.num_players = max(len(roster) for roster in rosters)
+        seeds = random.Random(seed)
+        stream_seeds = [seeds.randint(0, 1000000000) for _ in rosters]
+
+        self.player_mask = np.zeros((self.num_envs, self.num_players), dtype=bool)
+        for n, roster in enumerate(rosters):
+            self.player_mask[n, :len(roster)] = True
+
+        workers = max(1, min(workers, self.num_envs))
+        bounds = [self.num_envs * i // workers for i in range(workers + 1)]
+        # games [bounds[i], bounds[i+1]) are stepped by worker i
+        self.slices = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.batch = None
+        self.connections = []
+        self.processes = []
+        batch_args = [(rosters[s], stream_seeds[s], self.num_players, time_delta, max_spheres, game_kwargs) for s in self.slices]
+        if workers == 1:
+            self.batch = GameBatch(*batch_args[0])
+        else:
+            for args in batch_args:
+                connection, worker_connection = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=run_worker, args=(worker_connection, *args), daemon=True)
+                process.start()
+                worker_connection.close()
+                self.connections.append(connection)
+                self.processes.append(process)
+
+    @property
+    def games(self) -> list[Game]:
+        '''The Game objects, only available when they live in this process (workers=1)'''
+        if self.batch is None:
+            raise RuntimeError('the games live in worker processes')
+        return self.batch.games
+
+    def call(self, command: str, data_for_slice=lambda s: None) -> list:
+        if self.batch is not None:
+            data = data_for_slice(self.slices[0])
+            return [self.batch.step(data) if command == 'step' else self.batch.reset()]
+        for connection, s in zip(self.connections, self.slices):
+            connection.send((command, data_for_slice(s)))
+        return [connection.recv() for connection in self.connections]
+
+    def reset(self) -> dict[str, np.ndarray]:
+        return self.make_obs(self.call('reset'))
+
+    def step(self, actions: np.ndarray):
+        '''Advances every game by one frame, returns obs, rewards, dones, infos
+
+        actions: (N, P) bool, True presses the action button of that player
+        '''
+        actions = np.asarray(actions, dtype=bool)
+        results = self.call('step', lambda s: actions[s].tolist())
+        obs = self.make_obs([result[0] for result in results])
+        rewards = np.concatenate([result[1] for result in results])
+        dones = np.concatenate([result[2] for result in results])
+        infos = [info for result in results for info in result[3]]
+        return obs, rewards, dones, infos
+
+    def make_obs(self, observations) -> dict[str, np.ndarray]:
+        players, spheres, stage, timer = (np.concatenate(parts) for parts in zip(*observations))
+        return {
+            'players': players,
+            'spheres': spheres,
+            'player_mask': self.player_mask.copy(),
+            'stage': stage,
+            'timer': timer,
+        }
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
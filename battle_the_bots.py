@@ -1,4 +1,10 @@
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import argparse
+import math
+import os
+import random
 import time
 import logging
 logging.basicConfig(level=logging.INFO,
@@ -9,31 +15,44 @@ import pygame
 pygame.init()
 
 from back import Game, BotKeys, Team, GameStage
+from back.profiler import Profiler
 from bots import DoNothingBot, RandomBot, bots
 
 # GAMES = 100 # now using seeds : TODO maybe use seeded seed generation to get same seeds each run instead of having that seed list
-PLAYERS = [DoNothingBot, DoNothingBot] # not more than 12
+SEEDS = [787251266, 968271055, 109343014, 581667902, 854334122, 611688196, 601120768, 484691195, 857432951, 508818228, 202498239, 168362712, 153090000, 891572378, 629210471, 246177171, 442757202, 436592637, 468111692, 302367863, 992324453, 855935731, 984202434, 591644537, 503974825, 785524348, 88878125, 144351835, 599968379, 181569796, 228103852, 791174225, 605257316, 815810279, 721292242, 504329190, 555155765, 558730856, 228398930, 298848590, 237944805, 935390629, 439442625, 908527079, 485428665, 804105406, 700461605, 608538327, 561535972, 733285131, 37539035, 193262144, 94048620, 900415354, 619468819, 60036589, 827460053, 333197116, 452424559, 707985269, 817029849, 729948939, 31495869, 778892060, 728021479, 524084484, 92534795, 21483267, 216996293, 939874795, 169546128, 1236526, 741089702, 92600992, 286051289, 72434738, 57370079, 857079062, 880213289, 958549841, 199465350, 171340932, 351400607, 372941186, 266192059, 764242959, 314184390, 215945602, 556759145, 928468740, 664582682, 759908453, 563974013, 394553980, 542083439, 979431316, 540203510, 438744192, 88979073, 180301569]
+PLAYERS = [DoNothingBot, DoNothingBot] # up to MAX_PLAYERS, past 12 the arena grows
 # PLAYERS = list(bots)
 PLAYERS = list(map(lambda x: RandomBot(x/20), range(1, 11)))
-
-
-assert len(PLAYERS) <= 12
+# PLAYERS = [RandomBot((i % 10 + 1) / 20) for i in range(200)] # a free-for-all, see benchmarks/free_for_all.py
 
 colors = {
     key: (team, class_.__name__ + f' {counter}', class_) for key, team, (counter, class_) in zip(BotKeys, Team, enumerate(PLAYERS))
 }
 # logging.info(colors)
-def play_a_console_game(number, seed):
+def play_a_console_game(number, seed, show_progress=True, profile=False, **game_kwargs):
+    '''Plays one game until END_SCREEN, returns (scores, frames, seconds, bot_times, profiler)
+
+    bot_times has BotStats.summary() of every player, profiler is the
+    game's Profiler if profile is set and None otherwise. game_kwargs go to
+    Game (bot_deadline, bot_workers...).
+    '''
+    # RandomBot draws from the global random, seeding it makes the game depend on its seed only,
+    # no matter which games were played before it in this process
+    random.seed(seed)
     sstart_time = time.time()
     start_time = time.time()
-    game = Game(colors, seed)
+    game = Game(colors, seed, **game_kwargs)
+    if profile:
+        game.profiler = Profiler()
+    frames = 0
     while game.stage != GameStage.END_SCREEN:
         t = time.time()
         current_time = t - start_time
         overall_time = t - sstart_time
         time_delta = 1 / 60 # seconds
         game.update(time_delta)
-        if current_time > 1:
+        frames += 1
+        if show_progress and current_time > 1:
             # logging.info(' '*50, '\r', end='')
             s = f'Game {number}: seed {game.seed} | {game.stage.name} {game.scores} {overall_time:.1f} {game.timer:.1f}'
             print(f'{s:<80}\r', end='')
@@ -41,7 +60,25 @@ def play_a_console_game(number, seed):
         if game.stage == GameStage.GAMING and game.timer > 180:
             for index, player in enumerate(game.player_spheres):
                 game.process_player_death(index, player, killer_index=0)
-    return game.scores
+    game.bot_runner.close()
+    if profile:
+        game.profiler.close()
+    return game.scores, frames, time.time() - sstart_time, [stats.summary() for stats in game.bot_runner.stats], game.profiler
+
+def play_seed(seed, profile=False, **game_kwargs):
+    '''Job for the worker processes, a console game without progress output'''
+    return play_a_console_game(None, seed, show_progress=False, profile=profile, **game_kwargs)
+
+def run_tournament(seeds, workers=1, chunksize=1, profile=False, **game_kwargs):
+    '''Plays a game for every seed, returns the (scores, frames, seconds, bot_times, profiler) results in seed order
+
+    With workers > 1 the games are spread over a process pool, chunksize seeds per job.
+    Every game only depends on its seed, so the results are the same as with a serial run.
+    '''
+    if workers <= 1:
+        return [play_a_console_game(number, seed, profile=profile, **game_kwargs) for number, seed in enumerate(seeds)]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(partial(play_seed, profile=profile, **game_kwargs), seeds, chunksize=chunksize))
 
 def set_up_gui_games():
     surface = pygame.display.set_mode((600, 300))
@@ -50,33 +87,105 @@ def set_up_gui_games():
 #     gs = GameScreen(surface, colors)
 #     gs.main()
 
-def main():
-    seeds = [787251266, 968271055, 109343014, 581667902, 854334122, 611688196, 601120768, 484691195, 857432951, 508818228, 202498239, 168362712, 153090000, 891572378, 629210471, 246177171, 442757202, 436592637, 468111692, 302367863, 992324453, 855935731, 984202434, 591644537, 503974825, 785524348, 88878125, 144351835, 599968379, 181569796, 228103852, 791174225, 605257316, 815810279, 721292242, 504329190, 555155765, 558730856, 228398930, 298848590, 237944805, 935390629, 439442625, 908527079, 485428665, 804105406, 700461605, 608538327, 561535972, 733285131, 37539035, 193262144, 94048620, 900415354, 619468819, 60036589, 827460053, 333197116, 452424559, 707985269, 817029849, 729948939, 31495869, 778892060, 728021479, 524084484, 92534795, 21483267, 216996293, 939874795, 169546128, 1236526, 741089702, 92600992, 286051289, 72434738, 57370079, 857079062, 880213289, 958549841, 199465350, 171340932, 351400607, 372941186, 266192059, 764242959, 314184390, 215945602, 556759145, 928468740, 664582682, 759908453, 563974013, 394553980, 542083439, 979431316, 540203510, 438744192, 88979073, 180301569]
-    # surface = set_up_gui_games()
-    start_time = time.time()
+def report(seeds, results, seconds):
     wins = []
-    cumulative_times = []
-    for game_number, seed in enumerate(seeds):
-        # scores = play_a_gui_game(surface)
-        scores = play_a_console_game(game_number, seed)
+    for game_number, (seed, (scores, frames, game_time, _, _)) in enumerate(zip(seeds, results)):
         best = max(enumerate(scores), key=lambda x: x[1])
         best_player = PLAYERS[best[0]].__name__ + f' {best[0]}'
         score = best[1]
         wins.append(best_player)
-        time_passed = time.time() - start_time
-        cumulative_times.append(time_passed)
-        logging.info(f'Game {game_number}: winner is {best_player} with score {score}. {time_passed:.1f} seconds from start')
+        logging.info(f'Game {game_number}: seed {seed}, winner is {best_player} with score {score}. {frames} frames in {game_time:.1f} seconds')
     logging.info(Counter(wins))
 
-    game_times = []
-    for i,j in zip(cumulative_times[:-1], cumulative_times[1:]):
-        game_times.append(j-i)
+    game_times = [game_time for _, _, game_time, _, _ in results]
     mean = sum(game_times) / len(game_times)
     l_m_sqrd = [(l - mean) ** 2 for l in game_times]
-    import math
     std = math.sqrt(sum(l_m_sqrd) / len(game_times))
     logging.info(f'{mean=:.3f}, {std=:.3f}')
-    logging.info(f'{time.time() - start_time:.1f} seconds passed.')
+    total_frames = sum(frames for _, frames, _, _, _ in results)
+    logging.info(f'{len(results) / seconds:.2f} games/s, {total_frames / seconds:.0f} frames/s')
+    logging.info(f'{seconds:.1f} seconds passed.')
+    report_bot_times(results)
+    profilers = [profiler for _, _, _, _, profiler in results if profiler is not None]
+    if profilers:
+        total = Profiler()
+        for profiler in profilers:
+            total.merge(profiler)
+        logging.info('time per frame in microseconds over all games\n' + total.summary())
+
+def report_bot_times(results):
+    '''Logs the get_action time of every player: mean over all games and the worst p99 of a game'''
+    for index, class_ in enumerate(PLAYERS):
+        summaries = [bot_times[index] for _, _, _, bot_times, _ in results]
+        calls = sum(calls for calls, _, _, _ in summaries)
+        if calls == 0:
+            continue
+        mean = sum(calls * mean for calls, mean, _, _ in summaries) / calls
+        p99 = max(p99 for _, _, p99, _ in summaries)
+        timeouts = sum(timeouts for _, _, _, timeouts in summaries)
+        logging.info(f'{class_.__name__} {index}: mean {mean * 1e6:.0f} us, p99 <= {p99 * 1e6:.0f} us, '
+                     f'{timeouts} of {calls} answers after the deadline')
+
+def measure_scaling(seeds, max_workers, chunksize, **game_kwargs):
+    '''Plays the seeds with 1, 2, 4, ... max_workers processes and logs the speedup over one process
+
+    game_kwargs go to every Game, like in run_tournament.
+    '''
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if max_workers > 1:
+        counts.append(max_workers)
+    serial_scores = None
+    serial_rate = None
+    for workers in counts:
+        start_time = time.perf_counter()
+        if workers > 1:
+            results = run_tournament(seeds, workers, chunksize, **game_kwargs)
+        else:
+            results = [play_seed(seed, **game_kwargs) for seed in seeds]
+        seconds = time.perf_counter() - start_time
+        scores = [scores for scores, _, _, _, _ in results]
+        rate = len(seeds) / seconds
+        if serial_scores is None:
+            serial_scores, serial_rate = scores, rate
+        same = 'same scores' if scores == serial_scores else 'SCORES DIFFER from 1 worker!'
+        frames = sum(frames for _, frames, _, _, _ in results)
+        logging.info(f'{workers:>3} workers: {rate:.2f} games/s, {frames / seconds:.0f} frames/s, '
+                     f'speedup {rate / serial_rate:.2f}, efficiency {rate / serial_rate / workers:.0%}, {same}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays the bots in PLAYERS against each other on a list of seeds')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes, 1 plays the games in this process (default: number of cores)')
+    parser.add_argument('-c', '--chunksize', type=int, default=1,
+                        help='seeds handed to a worker at once (default: 1)')
+    parser.add_argument('-n', '--games', type=int, default=len(SEEDS),
+                        help=f'play only the first GAMES seeds (default: {len(SEEDS)})')
+    parser.add_argument('--scaling', action='store_true',
+                        help='play the seeds with 1, 2, 4, ... WORKERS processes and report the speedup')
+    parser.add_argument('-d', '--deadline', type=float, default=None,
+                        help='milliseconds a bot has per frame, later answers count as no press (default: no deadline)')
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='time the phases of every frame and log a summary over all games')
+    parser.add_argument('-b', '--bot-workers', type=int, default=0,
+                        help='processes per game that ask the bots concurrently, 0 asks them in the game\'s process (default: 0)')
+    parser.add_argument('--full-cutscenes', action='store_true',
+                        help='simulate the intro and results of every round in full even when no bot reads the state, '
+                             'the outcome is the same either way')
+    args = parser.parse_args()
+    seeds = SEEDS[:args.games]
+    game_kwargs = {'bot_deadline': None if args.deadline is None else args.deadline / 1000,
+                   'bot_workers': args.bot_workers,
+                   'skip_cutscenes': not args.full_cutscenes}
+
+    if args.scaling:
+        measure_scaling(seeds, args.workers, args.chunksize, **game_kwargs)
+        return
+    logging.info(f'{len(seeds)} games on {args.workers} workers')
+    start_time = time.perf_counter()
+    results = run_tournament(seeds, args.workers, args.chunksize, profile=args.profile, **game_kwargs)
+    report(seeds, results, time.perf_counter() - start_time)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
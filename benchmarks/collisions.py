@@ -0,0 +1,77 @@
+'''Collision cost against the total number of spheres
+
+Every configuration plays the same frames from the same seed, so besides
+the timings this also checks that they all end in the same state.
+
+    python -m benchmarks.collisions
+'''
+import random
+import time
+
+import pygame
+from pygame import Vector2
+
+from back import Game, GameStage, BotKeys, Team, Sphere, SPHERE_SIZE
+from back.snapshot import fingerprint
+from bots import DoNothingBot
+
+CONFIGS = {
+    'brute force': dict(broad_phase=False),
+    'grid': dict(),
+    'numpy': dict(engine='numpy'),
+}
+SPHERE_COUNTS = [50, 100, 200, 400, 800, 1600]
+PLAYERS = 12
+FRAMES = 120
+SEED = 787251266
+
+def make_game(config, num_spheres):
+    colors = {
+        key: (team, f'DoNothingBot {i}', DoNothingBot) for i, (key, team) in enumerate(zip(BotKeys, Team))
+        if i < PLAYERS
+    }
+    game = Game(colors, SEED, **config)
+    while game.stage != GameStage.GAMING:
+        game.update(1/60)
+    rng = random.Random(SEED)
+    # half of the spheres are tails, the rest lie around as inactive spheres
+    for player in game.player_spheres:
+        for _ in range(num_spheres // 2 // PLAYERS):
+            player.add_sphere_to_queue(Sphere(Vector2(player.center), Vector2(0, 0), SPHERE_SIZE))
+    for _ in range(num_spheres - num_spheres // 2 // PLAYERS * PLAYERS):
+        center = Vector2(rng.uniform(0, game.size[0]), rng.uniform(0, game.size[1]))
+        game.inactive_spheres.append(Sphere(center, Vector2(0, 0), SPHERE_SIZE, damping_factor=0.98))
+    return game
+
+def run(config, num_spheres):
+    game = make_game(config, num_spheres)
+    collision_time = 0
+    def timed(method):
+        def wrapper():
+            nonlocal collision_time
+            start = time.perf_counter()
+            method()
+            collision_time += time.perf_counter() - start
+        return wrapper
+    # burst absorption and player collisions, the part the broad-phase is about
+    game.process_bursts = timed(game.process_bursts)
+    game.process_collisions = timed(game.process_collisions)
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        game.update(1/60)
+    elapsed = time.perf_counter() - start
+    return elapsed / FRAMES, collision_time / FRAMES, fingerprint(game)
+
+def main():
+    pygame.init()
+    print(f'{PLAYERS} players, {FRAMES} frames, microseconds per frame: whole frame / collisions only')
+    print(f'{"spheres":>8}' + ''.join(f'{name:>20}' for name in CONFIGS))
+    for num_spheres in SPHERE_COUNTS:
+        results = [run(config, num_spheres) for config in CONFIGS.values()]
+        line = f'{num_spheres:>8}' + ''.join(f'{f"{frame * 1e6:.0f} / {collisions * 1e6:.0f}":>20}' for frame, collisions, _ in results)
+        if len({state for _, _, state in results}) != 1:
+            line += '  states differ!'
+        print(line)
+
+if __name__ == '__main__':
+    main()
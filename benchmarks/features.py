@@ -0,0 +1,78 @@
+'''Bot cost with and without the shared FrameFeatures cache
+
+Every bot looks for its nearest sphere, whether it is in a rotator and
+whether someone's trail is about to hit it. LoopBot does that with its
+own loops over the state, FeatureBot reads state.features, which is
+computed once per frame for all of them.
+
+    python -m benchmarks.features
+'''
+import random
+import time
+
+import pygame
+from pygame import Vector2
+
+from back import Game, GameStage, BotKeys, Team, Sphere, SPHERE_SIZE
+from back.core import GameState
+from bots import Bot
+
+BOT_COUNTS = [2, 6, 12]
+FRAMES = 300
+SEED = 787251266
+TAIL = 20
+
+
+class LoopBot(Bot):
+    def get_action(self, state: GameState, time_delta: float) -> bool:
+        me = self.player_sphere
+        spheres = list(state.active_spheres) + list(state.inactive_spheres)
+        nearest = min(spheres, key=lambda s: me.center.distance_squared_to(s.center), default=None)
+        in_rotator = self.is_in_rotator(state.rotators)
+        threatened = False
+        for player in state.player_spheres:
+            if player is me: continue
+            for sphere in player.trail:
+                # a few frames straight ahead
+                for t in (5, 10, 15):
+                    if (me.center + me.velocity * t).distance_squared_to(sphere.center) <= (me.radius + sphere.radius) ** 2:
+                        threatened = True
+        return nearest is not None and threatened and not in_rotator
+
+
+class FeatureBot(Bot):
+    def get_action(self, state: GameState, time_delta: float) -> bool:
+        index = state.player_spheres.index(self.player_sphere)
+        features = state.features
+        indices, distances = features.nearest_spheres(1)
+        in_rotator = features.in_rotator[index]
+        threatened = features.time_to_collision[index] < 15
+        return indices.shape[1] > 0 and threatened and not in_rotator
+
+
+def run(BotClass, num_bots):
+    colors = {
+        key: (team, f'{BotClass.__name__} {i}', BotClass) for i, (key, team) in enumerate(zip(BotKeys, Team))
+        if i < num_bots
+    }
+    random.seed(SEED)
+    game = Game(colors, SEED)
+    while game.stage != GameStage.GAMING:
+        game.update(1/60)
+    for player in game.player_spheres:
+        for _ in range(TAIL):
+            player.add_sphere_to_queue(Sphere(Vector2(player.center), Vector2(0, 0), SPHERE_SIZE))
+    start_time = time.perf_counter()
+    for _ in range(FRAMES):
+        game.update(1/60)
+    return (time.perf_counter() - start_time) / FRAMES * 1e6
+
+
+def main():
+    print(f'{TAIL}-sphere tails, {FRAMES} frames, microseconds per frame')
+    print(f'{"bots":>5} {"own loops":>10} {"features":>10}')
+    for num_bots in BOT_COUNTS:
+        print(f'{num_bots:>5} {run(LoopBot, num_bots):>10.0f} {run(FeatureBot, num_bots):>10.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''A free-for-all of hundreds of random bots, headless, against real time
+
+Past 12 players the arena grows with the number of players (see
+game.arena_scale), with more rotators and more spheres and bursts. This
+plays such a game the way battle_the_bots.py does, without a window and
+without the cutscenes, and reports how many times faster than real time it
+runs and where the time of a frame goes. The first CHECK_FRAMES frames are
+also played with the brute force collisions, the players' grid has to give
+the same game.
+
+    python -m benchmarks.free_for_all
+    python -m benchmarks.free_for_all --players 256 --seconds 300
+'''
+import argparse
+import random
+import time
+
+import pygame
+
+from back import Game, GameStage, BotKeys, Team
+from back.profiler import Profiler
+from back.snapshot import fingerprint
+from bots import RandomBot
+
+PLAYERS = 200
+SEED = 787251266
+# game time played, the longest round of battle_the_bots.py
+SECONDS = 180
+CHECK_FRAMES = 600
+
+def make_game(players: int, **game_kwargs) -> Game:
+    colors = {key: (team, f'RandomBot {i}', RandomBot((i % 10 + 1) / 20))
+              for i, (key, team) in enumerate(zip(BotKeys, Team)) if i < players}
+    # RandomBot draws from the global random
+    random.seed(SEED)
+    return Game(colors, SEED, skip_cutscenes=True, **game_kwargs)
+
+def play(game: Game, frames: int):
+    '''Plays frames frames, returns the seconds it took and the rounds that ended'''
+    rounds = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        stage = game.stage
+        game.update(1/60)
+        if stage == GameStage.GAMING and game.stage != GameStage.GAMING:
+            rounds += 1
+    return time.perf_counter() - start, rounds
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a headless free-for-all of random bots and compares it with real time')
+    parser.add_argument('--players', type=int, default=PLAYERS, help=f'at most {len(BotKeys)} (default: %(default)s)')
+    parser.add_argument('--seconds', type=float, default=SECONDS, help='game time to play (default: %(default)s)')
+    parser.add_argument('--engine', choices=['objects', 'numpy'], default='objects')
+    args = parser.parse_args()
+    pygame.init()
+
+    fingerprints = []
+    for broad_phase in True, False:
+        game = make_game(args.players, engine=args.engine, broad_phase=broad_phase)
+        play(game, CHECK_FRAMES)
+        game.bot_runner.close()
+        fingerprints.append(fingerprint(game))
+    same = fingerprints[0] == fingerprints[1]
+
+    game = make_game(args.players, engine=args.engine)
+    game.profiler = Profiler()
+    frames = round(args.seconds * 60)
+    seconds, rounds = play(game, frames)
+    game.bot_runner.close()
+    game.profiler.close()
+    width, height = game.size
+    print(f'{args.players} players on a {width:.2f} x {height:.2f} arena with {len(game.rotators)} rotators, '
+          f'{len(game.active_spheres)} spheres to collect and a burst every {10 / game.spawn_rate:.1f} s on average')
+    print(f'{args.seconds:.0f} s of game in {seconds:.1f} s, {args.seconds / seconds:.1f}x real time, '
+          f'{rounds} rounds ended, {sum(p.alive for p in game.player_spheres)} players alive, stage {game.stage.name}')
+    print(game.profiler.summary())
+    print(f'first {CHECK_FRAMES} frames {"the same" if same else "DIFFERENT"} with the brute force collisions')
+    if not same or seconds > args.seconds:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
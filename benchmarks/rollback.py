@@ -0,0 +1,120 @@
+'''What a rollback costs with 12 players and long tails
+
+A rollback restores the last snapshot taken at or before the frame a late
+press was made in and plays the frames since then again, without taking
+snapshots (see back/rollback.py). This plays a game whose players start
+with TAIL spheres each, with presses arriving up to ROLLBACK frames late,
+checks that it ends where a game that got every press in time ends, and
+times the parts. It fails if the median rollback of ROLLBACK frames takes
+longer than BUDGET.
+
+    python -m benchmarks.rollback
+    python -m benchmarks.rollback --tail 20
+'''
+import argparse
+import random
+import time
+
+import pygame
+from pygame import Vector2
+
+from back import Game, GameStage, BotKeys, Team, Sphere, SPHERE_SIZE
+from back.rollback import RollbackGame
+from back.snapshot import fingerprint
+
+PLAYERS = 12
+SEED = 787251266
+# spheres every player gets at the start, they are in the trails after WARMUP frames
+TAIL = 5
+WARMUP = 60
+# the round lasts about 800 frames
+FRAMES = 600
+ROLLBACK = 8
+BUDGET = 0.002
+
+def make_game(tail: int):
+    '''A game of PLAYERS players that just started, each with tail spheres on the way to their trail'''
+    colors = {key: (team, f'Player {i + 1}', None) for i, (key, team) in enumerate(zip(BotKeys, Team)) if i < PLAYERS}
+    game = Game(colors, SEED)
+    while game.stage != GameStage.GAMING:
+        game.update(1/60)
+    for player in game.player_spheres:
+        for _ in range(tail):
+            player.add_sphere_to_queue(Sphere(Vector2(player.center), Vector2(0, 0), SPHERE_SIZE))
+    return game
+
+def presses(frames: int):
+    '''frame -> players pressing in it, about one press per player per second'''
+    rng = random.Random(SEED)
+    return {frame: [index for index in range(PLAYERS) if rng.random() < 1 / 60] for frame in range(frames)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a game with late presses and measures what rolling back costs')
+    parser.add_argument('--tail', type=int, default=TAIL, help='spheres every player starts with (default: %(default)s)')
+    args = parser.parse_args()
+    pygame.init()
+    inputs = presses(WARMUP + FRAMES)
+
+    # every press in time
+    game = make_game(args.tail)
+    for frame in range(WARMUP + FRAMES):
+        game.process_actions([game.keys_list[index] for index in inputs[frame]])
+        game.update(1/60)
+    expected = fingerprint(game)
+
+    # the presses of players 1-11 arrive up to ROLLBACK frames late, player 0 is local
+    rollback = RollbackGame(make_game(args.tail), ROLLBACK + 1)
+    rng = random.Random(SEED)
+    arriving: dict[int, list[tuple[int, int]]] = {}
+    for frame in range(WARMUP + FRAMES):
+        for index in inputs[frame]:
+            late = 0 if index == 0 else rng.randint(0, ROLLBACK)
+            arriving.setdefault(frame + late, []).append((frame, index))
+    rollback_times = []
+    frame_times = []
+    for frame in range(WARMUP + FRAMES):
+        for made_in, index in arriving.get(frame, []):
+            rollback.add_input(made_in, index)
+        start = time.perf_counter()
+        frames_before = rollback.frames_played_again
+        rollback.rollback()
+        if frame >= WARMUP and rollback.frames_played_again > frames_before:
+            rollback_times.append((time.perf_counter() - start, rollback.frames_played_again - frames_before))
+        start = time.perf_counter()
+        rollback.step()
+        if frame >= WARMUP:
+            frame_times.append(time.perf_counter() - start)
+    game = rollback.game
+    same = fingerprint(game) == expected
+    print(f'{PLAYERS} players, {sum(len(p.trail) for p in game.player_spheres)} trail spheres, '
+          f'{len(game.active_spheres) + len(game.inactive_spheres)} spheres lying around, stage {game.stage.name}')
+    print(f'{rollback.rollbacks} rollbacks, {rollback.frames_played_again} frames played again, '
+          f'{"same" if same else "DIFFERENT"} state as with every press in time')
+
+    # the parts, on the game as it is now
+    snapshot = game.snapshot()
+    repeat = 200
+    start = time.perf_counter()
+    for _ in range(repeat):
+        game.snapshot()
+    snapshot_time = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        game.restore(snapshot)
+    restore_time = (time.perf_counter() - start) / repeat
+    print(f'snapshot {snapshot_time * 1e6:.0f} us, restore {restore_time * 1e6:.0f} us, '
+          f'frame with its snapshot {sum(frame_times) / len(frame_times) * 1e6:.0f} us')
+
+    full = sorted(seconds for seconds, frames in rollback_times if frames == ROLLBACK)
+    median = full[len(full) // 2]
+    print(f'rolling back {ROLLBACK} frames: median {median * 1e3:.2f} ms, '
+          f'worst {full[-1] * 1e3:.2f} ms over {len(full)} rollbacks (budget {BUDGET * 1e3:.0f} ms)')
+    per_frame = sum(seconds for seconds, _ in rollback_times) / sum(frames for _, frames in rollback_times)
+    print(f'{per_frame * 1e6:.0f} us per frame played again, {ROLLBACK} frames in {per_frame * ROLLBACK * 1e3:.2f} ms')
+    if median > BUDGET:
+        print(f'over the budget of {BUDGET * 1e3:.0f} ms')
+    if not same or median > BUDGET:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+'''Fixed scenarios for judging changes to the simulation
+
+Every scenario builds a game from a fixed seed and plays a fixed number of
+frames three times: once timed (simulated frames per second), once with a
+Profiler (mean microseconds of every phase of Game.update) and once under
+tracemalloc (peak memory). The fingerprint of the final state is saved too,
+a speedup that changes it changed the game.
+
+    python -m benchmarks.scenarios --save-baseline      # on the old code
+    python -m benchmarks.scenarios                      # on the new code
+
+The results are written as JSON and compared with the baseline: a scenario
+that got more than --threshold slower counts as a regression and the
+command fails, and so does a run without a baseline. Baselines are only
+comparable on the same machine, so none is committed.
+'''
+from typing import Callable, Optional
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import pygame
+from pygame import Vector2
+
+from back import Game, GameStage, BotKeys, Team, Sphere, Burst, SPHERE_SIZE
+from back.core import BURST_SIZE
+from back.profiler import Profiler
+from back.snapshot import fingerprint
+from bots import DoNothingBot, RandomBot
+
+SEED = 787251266
+BASELINE = os.path.join(os.path.dirname(__file__), 'scenarios_baseline.json')
+THRESHOLD = 0.1
+
+
+def roster(classes):
+    return {key: (team, f'{class_.__name__} {i}', class_) for i, (key, team, class_) in enumerate(zip(BotKeys, Team, classes))}
+
+def start_gaming(game: Game):
+    while game.stage != GameStage.GAMING:
+        game.update(1/60)
+
+def scatter_inactive(game: Game, count: int, rng: random.Random, speed: float = 0):
+    for _ in range(count):
+        center = Vector2(rng.uniform(0, game.size[0]), rng.uniform(0, game.size[1]))
+        velocity = Vector2(rng.uniform(-speed, speed), rng.uniform(-speed, speed))
+        game.inactive_spheres.append(Sphere(center, velocity, SPHERE_SIZE, damping_factor=0.98))
+
+
+def idle_2(rng, game_kwargs):
+    return Game(roster([DoNothingBot] * 2), SEED, **game_kwargs), None
+
+def random_bots_12(rng, game_kwargs):
+    return Game(roster([RandomBot(cutoff / 20) for cutoff in range(1, 13)]), SEED, **game_kwargs), None
+
+def random_bots_200(rng, game_kwargs):
+    '''A free-for-all on an arena scaled up for 200 players'''
+    return Game(roster([RandomBot((i % 10 + 1) / 20) for i in range(200)]), SEED, **game_kwargs), None
+
+def tails_12x50(rng, game_kwargs):
+    game = Game(roster([DoNothingBot] * 12), SEED, **game_kwargs)
+    start_gaming(game)
+    for player in game.player_spheres:
+        for _ in range(50):
+            player.add_sphere_to_queue(Sphere(Vector2(player.center), Vector2(0, 0), SPHERE_SIZE))
+    return game, None
+
+def bursts(rng, game_kwargs):
+    '''40 bursts every 40 frames, a few of them set off, among 300 inactive spheres'''
+    game = Game(roster([DoNothingBot] * 12), SEED, **game_kwargs)
+    start_gaming(game)
+    scatter_inactive(game, 300, rng)
+    def every_frame(game: Game, frame: int):
+        if frame % 40 == 0:
+            new = [Burst(Vector2(rng.uniform(0, game.size[0]), rng.uniform(0, game.size[1])), BURST_SIZE) for _ in range(40)]
+            game.bursts.extend(new)
+            for burst in new[:4]:
+                burst.activate(rng.choice(game.player_spheres))
+    return game, every_frame
+
+def end_screen(rng, game_kwargs):
+    '''The 30 seconds after someone won, with 1500 spheres drifting around'''
+    game = Game(roster([DoNothingBot] * 12), SEED, **game_kwargs)
+    start_gaming(game)
+    game.stage = GameStage.END_SCREEN
+    game.timer = 0
+    game.someone_won = game.player_spheres[0].color
+    scatter_inactive(game, 1500, rng, speed=0.01)
+    return game, None
+
+# name -> (setup(rng, game_kwargs) -> (game, every_frame(game, frame) or None), frames)
+SCENARIOS: dict[str, tuple[Callable, int]] = {
+    'idle_2': (idle_2, 1200),
+    'random_bots_12': (random_bots_12, 1200),
+    'random_bots_200': (random_bots_200, 600),
+    'tails_12x50': (tails_12x50, 600),
+    'bursts': (bursts, 600),
+    'end_screen': (end_screen, 1500),
+}
+
+
+def play(name: str, frames: int, game_kwargs: dict, profiler: Optional[Profiler] = None):
+    setup, _ = SCENARIOS[name]
+    # RandomBot draws from the global random
+    random.seed(SEED)
+    game, every_frame = setup(random.Random(SEED), game_kwargs)
+    game.profiler = profiler
+    start = time.perf_counter()
+    for frame in range(frames):
+        if every_frame is not None:
+            every_frame(game, frame)
+        game.update(1/60)
+    seconds = time.perf_counter() - start
+    if profiler is not None:
+        profiler.close()
+    return game, seconds
+
+def run(name: str, frames: Optional[int], repeat: int, game_kwargs: dict):
+    frames = frames or SCENARIOS[name][1]
+    seconds = []
+    for _ in range(repeat):
+        game, elapsed = play(name, frames, game_kwargs)
+        seconds.append(elapsed)
+    profiler = Profiler()
+    play(name, frames, game_kwargs, profiler)
+    tracemalloc.start()
+    play(name, frames, game_kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'frames': frames,
+        'frames_per_second': frames / min(seconds),
+        'phases_us': {phase: round(h.mean, 2) for phase, h in profiler.phases.items()},
+        'peak_memory_kb': round(peak / 1024),
+        'fingerprint': fingerprint(game),
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    '''Prints the change of every scenario, True if none got slower than threshold'''
+    ok = True
+    print(f'{"scenario":<16} {"frames/s":>10} {"baseline":>10} {"change":>8} {"memory kB":>10} {"baseline":>10}')
+    for name, result in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            print(f'{name:<16} {result["frames_per_second"]:>10.0f} {"-":>10}')
+            continue
+        change = result['frames_per_second'] / old['frames_per_second'] - 1
+        line = (f'{name:<16} {result["frames_per_second"]:>10.0f} {old["frames_per_second"]:>10.0f} {change:>+8.1%} '
+                f'{result["peak_memory_kb"]:>10} {old["peak_memory_kb"]:>10}')
+        if change < -threshold:
+            line += '  REGRESSION'
+            ok = False
+        if result['frames'] == old['frames'] and result['fingerprint'] != old['fingerprint']:
+            line += '  final state differs'
+        print(line)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays fixed scenarios and compares their speed with a baseline')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help=f'default: all of {", ".join(SCENARIOS)}')
+    parser.add_argument('-o', '--output', default='scenarios_results.json', help='where to write the results (default: %(default)s)')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare with (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown in frames/s that counts as a regression (default: %(default)s)')
+    parser.add_argument('--frames', type=int, default=None, help='frames per scenario instead of its own number')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario, the fastest counts (default: %(default)s)')
+    parser.add_argument('--engine', choices=['objects', 'numpy'], default='objects')
+    parser.add_argument('--no-broad-phase', action='store_true')
+    args = parser.parse_args()
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        # baselines are per machine, none is committed
+        sys.exit(f'no baseline at {args.baseline}, save one with --save-baseline on the old code first')
+    pygame.init()
+    game_kwargs = {'engine': args.engine, 'broad_phase': not args.no_broad_phase}
+
+    results = {'python': sys.version.split()[0], 'machine': platform.machine(), 'game_kwargs': game_kwargs, 'scenarios': {}}
+    for name in args.scenarios:
+        result = run(name, args.frames, args.repeat, game_kwargs)
+        results['scenarios'][name] = result
+        slowest = max(result['phases_us'].items(), key=lambda item: item[1] if item[0] != 'frame' else 0)
+        print(f'{name:<16} {result["frames_per_second"]:>8.0f} frames/s, {result["peak_memory_kb"]:>6} kB peak, '
+              f'slowest phase {slowest[0]} {slowest[1]:.0f} us', flush=True)
+
+    path = args.baseline if args.save_baseline else args.output
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'results written to {path}')
+    if args.save_baseline:
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if not compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
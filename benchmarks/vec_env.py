@@ -0,0 +1,57 @@
+'''Env-steps/s of VecEnv against stepping the same games one by one
+
+Both sides play N games without bots, pressing random buttons. The loop
+version is what a training script would do without VecEnv: update every
+Game and read each one's GameState. VecEnv runs with 1 worker (in this
+process) and with one worker process per core.
+
+    python -m benchmarks.vec_env
+'''
+import os
+import random
+import time
+
+import numpy as np
+
+from back import Game, BotKeys, Team
+from back.vec_env import VecEnv
+
+ENV_COUNTS = [1, 8, 32, 128]
+PLAYERS = 12
+STEPS = 200
+SEED = 787251266
+
+def roster():
+    return {key: (team, f'Player {i}', None) for i, (key, team) in enumerate(zip(BotKeys, Team)) if i < PLAYERS}
+
+def run_loop(num_envs):
+    rng = random.Random(SEED)
+    games = [Game(roster(), rng.randint(0, 1000000000)) for _ in range(num_envs)]
+    start_time = time.perf_counter()
+    for _ in range(STEPS):
+        for game in games:
+            game.process_actions([key for key in game.keys_list if rng.random() < 0.02])
+            game.update(1/60)
+            game.get_state()
+    return num_envs * STEPS / (time.perf_counter() - start_time)
+
+def run_vec_env(num_envs, workers):
+    env = VecEnv([roster() for _ in range(num_envs)], seed=SEED, workers=workers)
+    rng = np.random.default_rng(SEED)
+    env.reset()
+    start_time = time.perf_counter()
+    for _ in range(STEPS):
+        env.step(rng.random((env.num_envs, env.num_players)) < 0.02)
+    seconds = time.perf_counter() - start_time
+    env.close()
+    return num_envs * STEPS / seconds
+
+def main():
+    print(f'{PLAYERS} players, {STEPS} steps, env-steps per second')
+    workers = os.cpu_count()
+    print(f'{"games":>6} {"loop":>10} {"VecEnv":>10} {f"{workers} workers":>12}')
+    for num_envs in ENV_COUNTS:
+        print(f'{num_envs:>6} {run_loop(num_envs):>10.0f} {run_vec_env(num_envs, 1):>10.0f} {run_vec_env(num_envs, workers):>12.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,14 @@ class Bot(ABC):
     
     Look at PlayerSphere class to see which fields are available there
     Look at GameState class to see which fields are available there
+    state.features has per-frame arrays shared by all bots (nearest spheres,
+    rotator membership, time to collision...), prefer them to own loops
+
+    Set reads_state to False if get_action never looks at the state, then
+    headless games with skip_cutscenes don't simulate what nobody sees.
     '''
+    reads_state = True
+
     @abstractmethod
     def get_action(self, state: GameState, time_delta: float) -> bool:
         return False
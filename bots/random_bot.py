@@ -15,6 +15,8 @@ class RandomBot():
         return RandomBotThing(self.cutoff, player)
 
 class RandomBotThing(Bot):
+    reads_state = False
+
     def __init__(self, cutoff, player):
         super().__init__(player)
         self.cutoff = cutoff
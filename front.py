@@ -1,5 +1,9 @@
-from dataclasses import dataclass
-from typing import Optional
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional, Iterable
+
+import copy
+import math
 
 import pygame
 from pygame import Vector2
@@ -9,112 +13,284 @@ pygame.freetype.init()
 font = pygame.freetype.SysFont('arial', 25)
 
 
-from back import Sphere, RotatorSphere, Burst, PlayerSphere, GameStage, color_names, Team, GameStateFront
+from back import Sphere, PlayerSphere, GameStage, color_names, GameStateFront
+
+
+class RenderCache:
+    '''Pre-rasterized circles and pre-rendered texts, least recently used dropped first
+
+    Circles are keyed by their size in pixels and color and come out pixel
+    for pixel like pygame.draw.ellipse at the same (truncated) rectangle.
+    A window of another size needs other sizes, so GameScreen clears the
+    cache when the window is resized.
+    '''
+    def __init__(self, max_circles: int = 1024, max_texts: int = 256):
+        self.max_circles = max_circles
+        self.max_texts = max_texts
+        self.circles: OrderedDict[tuple, pygame.Surface] = OrderedDict()
+        self.texts: OrderedDict[tuple, tuple[pygame.Surface, pygame.Rect]] = OrderedDict()
 
-def draw_sphere(surface: pygame.Surface, sphere: Sphere, game_size: tuple[int, int], force_color=None):
-    if force_color is None:
-        force_color = sphere.color
-    rect = sphere.get_rect()
-    new_rect = tuple(map(lambda i : i * min(game_size), rect))
-    pygame.draw.ellipse(surface, color=force_color, rect=new_rect)
+    def clear(self):
+        self.circles.clear()
+        self.texts.clear()
 
-def draw_player_triangle(surface: pygame.Surface, sphere: Sphere, game_size: tuple[int, int]):
+    def circle(self, size: tuple[int, int], color) -> pygame.Surface:
+        if type(color) is not tuple:
+            # pygame.Color isn't hashable
+            color = tuple(color)
+        key = size, color
+        sprite = self.circles.get(key)
+        if sprite is not None:
+            self.circles.move_to_end(key)
+            return sprite
+        # a color key blits faster than per-pixel alpha, the ellipse isn't antialiased anyway
+        colorkey = (0, 0, 0) if color[:3] != (0, 0, 0) else (255, 255, 255)
+        sprite = pygame.Surface(size)
+        sprite.fill(colorkey)
+        pygame.draw.ellipse(sprite, color, ((0, 0), size))
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+        sprite.set_colorkey(colorkey, pygame.RLEACCEL)
+        self.circles[key] = sprite
+        if len(self.circles) > self.max_circles:
+            self.circles.popitem(last=False)
+        return sprite
+
+    def text(self, text: str, color, size=None) -> tuple[pygame.Surface, pygame.Rect]:
+        '''font.render(text, color, size=size)'''
+        if type(color) is not tuple:
+            color = tuple(color)
+        key = text, color, size
+        rendered = self.texts.get(key)
+        if rendered is not None:
+            self.texts.move_to_end(key)
+            return rendered
+        rendered = font.render(text, color) if size is None else font.render(text, color, size=size)
+        self.texts[key] = rendered
+        if len(self.texts) > self.max_texts:
+            self.texts.popitem(last=False)
+        return rendered
+
+render_cache = RenderCache()
+
+def sphere_blit(sphere: Sphere, scale: float, force_color=None):
+    '''(sprite, position) for Surface.blits, the same pixels as pygame.draw.ellipse at the sphere's rect times scale'''
+    # pygame.Rect(i * scale for i in sphere.get_rect()), which truncates like int()
     center = sphere.center
-    scaled_center = center * min(game_size)
+    radius = sphere.radius
+    size = int(radius*2 * scale)
+    sprite = render_cache.circle((size, size), sphere.color if force_color is None else force_color)
+    return sprite, (int((center.x-radius) * scale), int((center.y-radius) * scale))
+
+def sphere_blits(spheres: Iterable[Sphere], scale: float) -> list:
+    '''[sphere_blit(i, scale) for i in spheres], neighbours of the same size and color share a lookup'''
+    circle = render_cache.circle
+    blits = []
+    last_size = last_color = sprite = None
+    for sphere in spheres:
+        center = sphere.center
+        radius = sphere.radius
+        size = int(radius*2 * scale)
+        color = sphere.color
+        if size != last_size or color != last_color:
+            sprite = circle((size, size), color)
+            last_size, last_color = size, color
+        blits.append((sprite, (int((center.x-radius) * scale), int((center.y-radius) * scale))))
+    return blits
+
+def draw_text(surface: pygame.Surface, pos, text: str, color, size=None) -> pygame.Rect:
+    '''font.render_to(surface, pos, text, color, size=size) through the cache'''
+    rendered, _ = render_cache.text(text, color, size)
+    return surface.blit(rendered, pos)
+
+class Interpolator:
+    '''Draws the game between two ticks
+
+    record() keeps the centers of the moving spheres before a tick,
+    state() then gives a copy of the front state with every sphere that
+    existed before the tick placed at alpha of the way from its old center
+    to its new one. Spheres that appeared in the tick, or jumped further
+    than MAX_STEP (a new round), are drawn where they are. The game itself
+    is not touched.
+    '''
+    # in game units, the height of a map1 arena
+    MAX_STEP = 0.1
+
+    def __init__(self):
+        self.previous: dict[Sphere, tuple[float, float]] = {}
+
+    def clear(self):
+        self.previous = {}
+
+    def record(self, state: GameStateFront):
+        previous = {}
+        for player in state.player_spheres:
+            for sphere in (player, *player.trail, *player.queue_to_trail, *player.attacking_spheres):
+                previous[sphere] = sphere.center.x, sphere.center.y
+        for pool in (state.active_spheres, state.inactive_spheres):
+            for sphere in pool:
+                previous[sphere] = sphere.center.x, sphere.center.y
+        self.previous = previous
+
+    def sphere(self, sphere: Sphere, alpha: float) -> Sphere:
+        old = self.previous.get(sphere)
+        if old is None:
+            return sphere
+        x, y = old
+        center = sphere.center
+        if (center.x - x) ** 2 + (center.y - y) ** 2 > self.MAX_STEP ** 2:
+            return sphere
+        return Sphere(Vector2(x + (center.x - x) * alpha, y + (center.y - y) * alpha), sphere.velocity, sphere.radius, sphere.color)
+
+    def player(self, player: PlayerSphere, alpha: float) -> PlayerSphere:
+        # a shallow copy is enough for drawing
+        copied = copy.copy(player)
+        copied.center = self.sphere(player, alpha).center
+        copied.trail = [self.sphere(i, alpha) for i in player.trail]
+        copied.queue_to_trail = [self.sphere(i, alpha) for i in player.queue_to_trail]
+        copied.attacking_spheres = [self.sphere(i, alpha) for i in player.attacking_spheres]
+        return copied
+
+    def state(self, state: GameStateFront, alpha: float) -> GameStateFront:
+        return replace(state,
+                       player_spheres=[self.player(i, alpha) for i in state.player_spheres],
+                       active_spheres=[self.sphere(i, alpha) for i in state.active_spheres],
+                       inactive_spheres=[self.sphere(i, alpha) for i in state.inactive_spheres])
+
+def draw_player_triangle(surface: pygame.Surface, sphere: Sphere, scale: float):
+    center = sphere.center
+    scaled_center = center * scale
     vel = sphere.velocity.copy()
     vel.scale_to_length(0.01)
-    vel = vel * min(game_size)
+    vel = vel * scale
     little_forward = scaled_center + vel
     to_the_right = vel.rotate(90)
     back_right = scaled_center - vel + to_the_right
     back_left = scaled_center - vel - to_the_right
-    pygame.draw.polygon(surface, (255,255,255), [little_forward, back_right, back_left])
-
-def draw_rotator(surface, rotator: RotatorSphere, game_size):
-    draw_sphere(surface, rotator, game_size)
-    draw_sphere(surface, rotator.middle_sphere, game_size)
-
-def draw_burst(surface, burst: Burst, game_size):
-    draw_sphere(surface, burst, game_size)
-    draw_sphere(surface, burst.middle_sphere, game_size)
-
-def draw_player(surface: pygame.Surface, sphere: PlayerSphere, game_size):
-    if not sphere.alive: return
-    for i in sphere.trail:
-        draw_sphere(surface, i, game_size)
-    for i in sphere.queue_to_trail:
-        draw_sphere(surface, i, game_size)
-    for i in sphere.attacking_spheres:
-        draw_sphere(surface, i, game_size)
+    return pygame.draw.polygon(surface, (255,255,255), [little_forward, back_right, back_left])
+
+def draw_player(surface: pygame.Surface, sphere: PlayerSphere, scale: float) -> list[pygame.Rect]:
+    if not sphere.alive: return []
+    blits = sphere_blits(sphere.trail, scale)
+    blits += sphere_blits(sphere.queue_to_trail, scale)
+    blits += sphere_blits(sphere.attacking_spheres, scale)
     if sphere.is_dodging():
-        draw_sphere(surface, sphere, game_size, force_color=pygame.Color(255,255,255).lerp(sphere.color, 0.7))
+        blits.append(sphere_blit(sphere, scale, force_color=pygame.Color(255,255,255).lerp(sphere.color, 0.7)))
     else:
-        draw_sphere(surface, sphere, game_size)
-    draw_player_triangle(surface, sphere, game_size)
+        blits.append(sphere_blit(sphere, scale))
+    rects = surface.blits(blits)
+    rects.append(draw_player_triangle(surface, sphere, scale))
     if sphere.bot is None:
-        text, text_size = font.render('Player', sphere.color, size=10)
+        text, text_size = render_cache.text('Player', sphere.color, size=10)
     else:
-        text, text_size = font.render(f'{sphere.bot.__class__.__name__}', sphere.color, size=10)
-    surface.blit(text, [(sphere.center[0])*min(game_size) - text_size.width / 2, (sphere.center[1]-0.025)*min(game_size) - text_size.height])
+        text, text_size = render_cache.text(f'{sphere.bot.__class__.__name__}', sphere.color, size=10)
+    rects.append(surface.blit(text, [(sphere.center[0])*scale - text_size.width / 2, (sphere.center[1]-0.025)*scale - text_size.height]))
+    return rects
 
 font = pygame.freetype.SysFont('arial', 25)
 
-def calculate_players_leaderboard_positions(game_size, i):
-    width = game_size[0] / 5
-    height = game_size[1] / 8
-    return (width*(2*i//len(Team) + 1), height * (i%(len(Team)//2) + 1))
-
-def draw_player_leaderboard(surface, pos, text, color):
-    size = surface.get_rect().size
-    circle_size = size[1]/9
-    pygame.draw.ellipse(surface, color, (pos, (circle_size, circle_size)))
-    font.render_to(surface, (pos[0]+2*circle_size, pos[1]), text, color, size=circle_size*1.5)
-
-def draw_game(surface, state: GameStateFront, game_size):
-    for i in state.rotators:
-        draw_rotator(surface, i, game_size)
-    for i in state.active_spheres:
-        draw_sphere(surface, i, game_size)
-    for i in state.inactive_spheres:
-        draw_sphere(surface, i, game_size)
-    for i in state.bursts:
-        draw_burst(surface, i, game_size)
+def leaderboard_grid(players: int) -> tuple[int, int]:
+    '''(columns, rows) of the leaderboard: two columns of six for up to 12 players
+
+    With more, the rows get more and thinner so that the columns stay wide
+    enough for a circle and a three digit score.
+    '''
+    rows = max(6, math.ceil(math.sqrt(players * 5 / 2)))
+    return math.ceil(max(players, 12) / rows), rows
+
+def calculate_players_leaderboard_positions(game_size, i, players=12):
+    columns, rows = leaderboard_grid(players)
+    width = game_size[0] / (columns + 3)
+    # the rows fill the height but its first and last eighth
+    height = game_size[1] * 3 / 4 / rows
+    return (width*(i//rows + 1), game_size[1] / 8 + height * (i%rows))
+
+def leaderboard_circle_size(game_size, players=12):
+    '''Size of the circles in front of the scores, smaller when the rows are more than six'''
+    _, rows = leaderboard_grid(players)
+    return game_size[1] / (rows * 1.5)
+
+def draw_player_leaderboard(surface, pos, text, color, circle_size=None) -> list[pygame.Rect]:
+    if circle_size is None:
+        circle_size = surface.get_rect().size[1]/9
+    rect = pygame.Rect(pos, (circle_size, circle_size))
+    return [surface.blit(render_cache.circle(rect.size, color), rect.topleft),
+            draw_text(surface, (pos[0]+2*circle_size, pos[1]), text, color, size=circle_size*1.5)]
+
+def world_scale(state: GameStateFront, game_size) -> float:
+    '''Pixels per game unit, the height of the arena fills game_size'''
+    return min(game_size) / state.size[1]
+
+def draw_arena(surface, state: GameStateFront, game_size):
+    '''The part of the picture that doesn't move during a game: black and the rotators'''
+    surface.fill(pygame.Color('#000000'))
+    scale = world_scale(state, game_size)
+    surface.blits(sphere_blits((j for i in state.rotators for j in (i, i.middle_sphere)), scale), doreturn=False)
+
+def draw_game(surface, state: GameStateFront, game_size, profiler=None, rotators=True) -> list[pygame.Rect]:
+    '''Draws the state over what's on surface, returns the rects it drew to
+
+    rotators=False leaves them out for a surface that already has draw_arena under it.
+    '''
+    # profiler: back.profiler.Profiler that gets the draw_* phases of the frame
+    # spheres are blitted from render_cache sprites, a batch per phase
+    if profiler is not None: profiler.start()
+    scale = world_scale(state, game_size)
+    rects = []
+    if rotators:
+        rects += surface.blits(sphere_blits((j for i in state.rotators for j in (i, i.middle_sphere)), scale))
+    if profiler is not None: profiler.lap('draw_rotators')
+    blits = sphere_blits(state.active_spheres, scale)
+    blits += sphere_blits(state.inactive_spheres, scale)
+    rects += surface.blits(blits)
+    if profiler is not None: profiler.lap('draw_spheres')
+    rects += surface.blits(sphere_blits((j for i in state.bursts for j in (i, i.middle_sphere)), scale))
+    if profiler is not None: profiler.lap('draw_bursts')
     for i in state.player_spheres:
-        draw_player(surface, i, game_size)
+        rects += draw_player(surface, i, scale)
+    if profiler is not None: profiler.lap('draw_players')
+    rects += draw_texts(surface, state, game_size)
+    if profiler is not None: profiler.lap('draw_texts')
+    return rects
+
+def draw_texts(surface, state: GameStateFront, game_size) -> list[pygame.Rect]:
+    rects = []
+    players = len(state.player_spheres)
+    circle_size = leaderboard_circle_size(game_size, players)
     if state.stage == GameStage.ROTATING_AROUND_CENTER:
         time = int(state.timer)
         text = str(3 - time)
         size = 50
-        font.render_to(surface, (game_size[0]//2-size//3, game_size[1]//2-size//2, 0, 0), text, (255, 255, 255), size=size)
+        rects.append(draw_text(surface, (game_size[0]//2-size//3, game_size[1]//2-size//2), text, (255, 255, 255), size=size))
     if state.stage == GameStage.SHOWING_RESULTS:
-        num_players = len(state.player_spheres)
-        font.render_to(surface, (30, 30), state.how_to_win_text, (255,255,255))
+        rects.append(draw_text(surface, (30, 30), state.how_to_win_text, (255,255,255)))
         if 0 < state.timer <= 1.5:
             for player_score in state.player_scores:
-                pos = calculate_players_leaderboard_positions(game_size, player_score.old_position)
-                draw_player_leaderboard(surface, pos, str(player_score.old_score), player_score.color)
+                pos = calculate_players_leaderboard_positions(game_size, player_score.old_position, players)
+                rects += draw_player_leaderboard(surface, pos, str(player_score.old_score), player_score.color, circle_size)
         if 1.5 < state.timer <= 2:
             for player_score in state.player_scores:
-                pos = calculate_players_leaderboard_positions(game_size, player_score.old_position)
-                draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color)
+                pos = calculate_players_leaderboard_positions(game_size, player_score.old_position, players)
+                rects += draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color, circle_size)
         elif 2 < state.timer <= 4:
             t = (state.timer - 2) / (4 - 2)
             for player_score in state.player_scores:
-                old_pos = calculate_players_leaderboard_positions(game_size, player_score.old_position)
-                new_pos = calculate_players_leaderboard_positions(game_size, player_score.new_position)
+                old_pos = calculate_players_leaderboard_positions(game_size, player_score.old_position, players)
+                new_pos = calculate_players_leaderboard_positions(game_size, player_score.new_position, players)
                 pos = Vector2(old_pos).lerp(new_pos, t)
-                draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color)
+                rects += draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color, circle_size)
         elif 4 < state.timer <= 5:
             for player_score in state.player_scores:
-                pos = calculate_players_leaderboard_positions(game_size, player_score.new_position)
-                draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color)
+                pos = calculate_players_leaderboard_positions(game_size, player_score.new_position, players)
+                rects += draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color, circle_size)
     if state.stage == GameStage.END_SCREEN:
         color = state.someone_won
-        font.render_to(surface, (30, 30, 100, 25), f'{color_names[color]} won', color)
+        rects.append(draw_text(surface, (30, 30), f'{color_names[color]} won', color))
         time = int(state.timer)
         text = str(30 - time)
-        font.render_to(surface, (game_size[0]/2-15, game_size[1] - 50), text, color)
+        rects.append(draw_text(surface, (game_size[0]/2-15, game_size[1] - 50), text, color))
 
         for player_score in state.player_scores:
-            pos = calculate_players_leaderboard_positions(game_size, player_score.new_position)
-            draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color)
+            pos = calculate_players_leaderboard_positions(game_size, player_score.new_position, players)
+            rects += draw_player_leaderboard(surface, pos, str(player_score.new_score), player_score.color, circle_size)
+    return rects
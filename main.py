@@ -1,4 +1,6 @@
 from traceback import print_exc
+import os
+import time
 
 import pygame
 
@@ -12,7 +14,17 @@ def main():
     pygame.init()
     pygame.display.set_caption('Orbits clone')
     settings = {'fullscreen': False,
-                'language': 'en'}
+                'language': 'en',
+                # every game is saved there, watch it with play_replay.py. None to turn off
+                'replays_folder': 'replays',
+                # seconds a bot has per frame, None waits for every answer
+                'bot_deadline': None,
+                # processes asking the bots concurrently, 0 asks them between frames
+                'bot_workers': 0,
+                # .csv or .jsonl file that gets the time of every phase of every frame, None to turn off
+                'profile_to': None,
+                # draw the spheres between two game ticks, smoother on monitors faster than 60 Hz
+                'interpolate': True}
     if settings['fullscreen']:
         window_surface = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     else:
@@ -22,7 +34,13 @@ def main():
     colors = pcs.main()
     if pcs.force_quit:
         return
-    GameScreen(window_surface, colors).main()
+    record_to = None
+    if settings['replays_folder'] is not None:
+        os.makedirs(settings['replays_folder'], exist_ok=True)
+        record_to = os.path.join(settings['replays_folder'], time.strftime('%Y-%m-%d_%H-%M-%S') + '.orbr')
+    GameScreen(window_surface, colors, record_to=record_to,
+               profile_to=settings['profile_to'], interpolate=settings['interpolate'],
+               bot_deadline=settings['bot_deadline'], bot_workers=settings['bot_workers']).main()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,137 @@
+'''Network games over LAN or localhost, see back/lockstep.py
+
+    python net_play.py server --humans 2 --bots 4       # starts when 2 players joined
+    python net_play.py client localhost --keys space    # one per player, or --keys q,p for two on one keyboard
+    python net_play.py --check                          # 2 headless clients over a laggy localhost link
+
+--latency and --jitter (milliseconds) slow down everything the process sends.
+'''
+import argparse
+import asyncio
+import random
+import threading
+
+import pygame
+
+from back import Team, BotKeys
+from back.lockstep import DELAY, Link, LockstepServer, LockstepClient
+from back.snapshot import fingerprint
+from bots import RandomBot
+
+PORT = 7777
+
+def make_colors(humans: int, bots: int):
+    '''The first humans players are seats for the clients, the bots are RandomBots'''
+    teams = iter(Team)
+    colors = {index: (next(teams), f'Player {index + 1}', None) for index in range(humans)}
+    for key, counter in zip(BotKeys, range(bots)):
+        BotClass = RandomBot((counter + 1) / 20)
+        colors[key] = (next(teams), f'{BotClass.__name__} {counter}', BotClass)
+    return colors
+
+def make_link(args):
+    if not args.latency and not args.jitter:
+        return None
+    return Link(args.latency / 1000, args.jitter / 1000, args.seed)
+
+async def serve(args):
+    server = LockstepServer(make_colors(args.humans, args.bots), args.seed, delay=args.delay, link=make_link(args))
+    listener = await server.start(args.host, args.port)
+    print(f'listening on {args.host}:{args.port}, waiting for {args.humans} players')
+    try:
+        await server.run()
+    finally:
+        server.close()
+        listener.close()
+
+def play_client(args):
+    keys = [pygame.key.key_code(name) for name in args.keys.split(',')]
+    loop = asyncio.new_event_loop()
+    client = LockstepClient(len(keys), make_link(args))
+    loop.run_until_complete(client.connect(args.host, args.port))
+    # the window runs here, the network in a thread
+    threading.Thread(target=loop.run_until_complete, args=(client.receive(),), daemon=True).start()
+    pygame.display.set_caption('Orbits clone')
+    window_surface = pygame.display.set_mode((1200, 600), pygame.RESIZABLE)
+    from screens import LockstepScreen
+    LockstepScreen(window_surface, client, loop, keys).main()
+
+async def check(args):
+    '''Plays args.frames frames with two clients pressing at random, checks they end up where the server is'''
+    # the bots of the server draw from the global random
+    random.seed(args.seed)
+    server = LockstepServer(make_colors(2, args.bots), args.seed, delay=args.delay, link=make_link(args))
+    listener = await server.start('localhost', 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = []
+    for index in range(2):
+        link = make_link(args)
+        if link is not None:
+            link.random.seed(args.seed + index + 1)
+        client = LockstepClient(1, link)
+        await client.connect('localhost', port)
+        clients.append(client)
+
+    pressed = 0
+
+    async def play(client: LockstepClient, presses: random.Random):
+        nonlocal pressed
+        receiving = asyncio.create_task(client.receive())
+        while client.connected or client.frames:
+            while client.step():
+                if presses.random() < 1 / 30:
+                    client.press(0)
+                    pressed += 1
+            await asyncio.sleep(1 / 240)
+        await receiving
+
+    playing = [asyncio.create_task(play(client, random.Random(args.seed + index))) for index, client in enumerate(clients)]
+    await server.run(args.frames)
+    server.close()
+    listener.close()
+    await asyncio.gather(*playing)
+
+    expected = fingerprint(server.game)
+    print(f'{args.frames} frames, server {expected}, scores {server.game.scores}')
+    ok = True
+    for index, client in enumerate(clients):
+        same = client.player.frame == args.frames and fingerprint(client.game) == expected
+        ok &= same
+        print(f'client {index + 1}: {client.player.frame} frames, {fingerprint(client.game)} {"same" if same else "DIFFERENT"}')
+    print(f'{server.bytes_sent / args.frames / len(clients):.2f} bytes per frame to each client, '
+          f'{server.bytes_received / args.frames / len(clients):.3f} bytes per frame from each client, '
+          f'{server.bytes_joining / len(clients):.0f} bytes to join')
+    print(f'{server.late} presses of {pressed} arrived late')
+    if not ok:
+        raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Network games over LAN or localhost')
+    parser.add_argument('mode', nargs='?', choices=['server', 'client'])
+    parser.add_argument('host', nargs='?', default='localhost')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--check', action='store_true', help='play a game with two headless clients over localhost and compare them with the server')
+    parser.add_argument('--humans', type=int, default=2, help='server: players joining over the network')
+    parser.add_argument('--bots', type=int, default=4, help='server and --check: random bots')
+    parser.add_argument('--seed', type=int, default=787251266)
+    parser.add_argument('--delay', type=int, default=DELAY, help='server: frames between a press and the frame it is played in')
+    parser.add_argument('--keys', default='space', help='client: comma separated pygame key names, one player each')
+    parser.add_argument('--frames', type=int, default=900, help='--check: frames to play')
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to everything sent')
+    parser.add_argument('--jitter', type=float, default=0, help='milliseconds the latency varies by')
+    args = parser.parse_args()
+
+    if args.check:
+        if not args.latency and not args.jitter:
+            args.latency, args.jitter = 40, 15
+        asyncio.run(check(args))
+    elif args.mode == 'server':
+        asyncio.run(serve(args))
+    elif args.mode == 'client':
+        pygame.init()
+        play_client(args)
+    else:
+        parser.error('give server, client or --check')
+
+if __name__ == '__main__':
+    main()
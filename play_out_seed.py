@@ -1,11 +1,32 @@
 from traceback import print_exc
+import argparse
+import random
 
 import pygame
 
 from screens import (GameScreen)
-from battle_the_bots import colors
+from battle_the_bots import colors, play_a_console_game
+
+def play_headless(seeds):
+    '''Plays the seeds one after another as fast as possible, printing only progress and results'''
+    for number, seed in enumerate(seeds):
+        scores, frames, seconds, _, _ = play_a_console_game(number, seed, skip_cutscenes=True)
+        print(f'{" ":<80}\r', end='')
+        print(f'{number + 1}/{len(seeds)} seed {seed}: scores {scores}, {frames} frames in {seconds:.1f} s ({frames / seconds:.0f} frames/s)')
 
 def main():
+    parser = argparse.ArgumentParser(description='Shows the bots of battle_the_bots.PLAYERS playing the given seeds')
+    parser.add_argument('seeds', type=int, nargs='*', default=[649766108],
+                        help='the window shows the first one, --headless plays them all (default: %(default)s)')
+    parser.add_argument('-s', '--speed', type=int, default=1,
+                        help='start that many times faster than real time, F9 and F8 double and halve it (default: 1)')
+    parser.add_argument('--headless', action='store_true',
+                        help='no window, play the seeds at full speed and print the results')
+    args = parser.parse_args()
+    if args.headless:
+        play_headless(args.seeds)
+        return
+
     pygame.init()
     pygame.display.set_caption('Orbits clone')
     settings = {'fullscreen': False,
@@ -15,7 +36,12 @@ def main():
     else:
         window_surface = pygame.display.set_mode((600, 300), pygame.RESIZABLE)
 
-    GameScreen(window_surface, colors, seed=649766108).main()
+    seed = args.seeds[0]
+    # like battle_the_bots, so the game is the one played there
+    random.seed(seed)
+    screen = GameScreen(window_surface, colors, seed=seed)
+    screen.speed = min(args.speed, GameScreen.MAX_SPEED)
+    screen.main()
 
 if __name__ == '__main__':
     main()
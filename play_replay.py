@@ -0,0 +1,49 @@
+'''Plays back a replay recorded by main.py
+
+    python play_replay.py replays/2024-01-01_12-00-00.orbr           # watch it
+    python play_replay.py --headless replays/2024-01-01_12-00-00.orbr
+    python play_replay.py --headless --frame 30000 replays/2024-01-01_12-00-00.orbr
+
+While watching, the arrows seek 10 seconds and page up/down jump between rounds.
+'''
+import argparse
+import time
+
+import pygame
+
+from back.replay import Replay, ReplayPlayer
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays back a replay recorded by main.py')
+    parser.add_argument('path')
+    parser.add_argument('--headless', action='store_true',
+                        help='simulate the replay as fast as possible without a window and print the scores')
+    parser.add_argument('--frame', type=int, default=None,
+                        help='with --headless, only seek to this frame (through the closest keyframe)')
+    args = parser.parse_args()
+    replay = Replay.load(args.path)
+
+    if args.headless:
+        # nothing is drawn and a replay has no bots, so the cutscenes can be cut short
+        player = ReplayPlayer(replay, skip_cutscenes=True)
+        start_time = time.perf_counter()
+        if args.frame is not None:
+            player.seek(args.frame)
+            print(f'seeked to frame {player.frame} ({player.game.stage.name}) in {time.perf_counter() - start_time:.3f} s')
+        else:
+            player.play()
+            seconds = time.perf_counter() - start_time
+            game_seconds = replay.frames * replay.time_delta
+            print(f'{replay.frames} frames ({game_seconds:.0f} s of game) in {seconds:.1f} s, {game_seconds / seconds:.0f}x real time')
+        for (key, team, name, _), score in zip(replay.roster, player.game.scores):
+            print(f'{name:<30} {score}')
+        return
+
+    pygame.init()
+    pygame.display.set_caption('Orbits clone')
+    window_surface = pygame.display.set_mode((1200, 600), pygame.RESIZABLE)
+    from screens import ReplayScreen
+    ReplayScreen(window_surface, replay).main()
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-from .screen import Screen, GameScreen, PickColorScreen
\ No newline at end of file
+from .screen import Screen, GameScreen, ReplayScreen, LockstepScreen, StreamScreen, PickColorScreen
\ No newline at end of file
@@ -1,4 +1,7 @@
+from collections import deque
 from typing import Any
+import asyncio
+import time
 
 import pygame
 import pygame.freetype
@@ -7,7 +10,11 @@ import pygame_gui
 from pygame_gui.elements import UIButton, UIDropDownMenu
 
 from back import Game, Team, BotKeys, PlayerSphere
-from front import draw_game, calculate_players_leaderboard_positions, draw_player_leaderboard
+from back.replay import Replay, ReplayRecorder, ReplayPlayer
+from back.lockstep import LockstepClient
+from back.state_stream import StateDecoder
+from back.profiler import Profiler
+from front import draw_game, draw_arena, Interpolator, calculate_players_leaderboard_positions, leaderboard_circle_size, draw_player_leaderboard, render_cache
 from bots import bots
 
 font = pygame.freetype.SysFont('arial', 25)
@@ -23,6 +30,9 @@ class Screen:
         self.force_quit = False
         self.manager = pygame_gui.UIManager(self.window_size)
         self.framerate = 60
+        # True repaints and updates the whole window every frame. Screens that set it
+        # to False keep the window between frames and return the rects they changed from update
+        self.full_redraw = True
 
     def clean_up(self):
         return
@@ -30,11 +40,14 @@ class Screen:
         return
     def update(self, time_delta):
         return
+    def caption(self, fps):
+        return f'Orbits clone | {fps:.1f}'
     def on_window_size_changed(self, size):
         self.window_size = size
         self.manager.set_window_resolution(size)
         self.background = pygame.Surface(size)
         self.background.fill(pygame.Color(self.background_color))
+        self.full_redraw = True
 
     def main(self):
         clock = pygame.time.Clock()
@@ -55,12 +68,17 @@ class Screen:
                         self.is_running = False
                 self.process_events(event)
                 self.manager.process_events(event)
-            self.surface.blit(self.background, (0, 0))
+            full_redraw = self.full_redraw
+            if full_redraw:
+                self.surface.blit(self.background, (0, 0))
             self.manager.update(time_delta)
-            self.update(time_delta)
+            dirty_rects = self.update(time_delta)
             self.manager.draw_ui(self.surface)
-            pygame.display.set_caption(f'Orbits clone | {clock.get_fps():.1f}')
-            pygame.display.update()
+            pygame.display.set_caption(self.caption(clock.get_fps()))
+            if full_redraw or dirty_rects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(dirty_rects)
         self.clean_up()
         return self.return_value
 
@@ -74,8 +92,41 @@ def inscribed_rectangle_dimensions(w, h):
         return vertical_side, 2 * vertical_side
 
 class GameScreen(Screen):
-    def __init__(self, surface: pygame.Surface, colors, seed=None):
+    '''Plays a Game at a fixed TICK rate, whatever the framerate
+
+    Every frame adds its duration to an accumulator and the game is
+    updated once per TICK in it, at most MAX_TICKS_PER_FRAME times (a slower
+    machine slows the game down instead of falling further behind). With
+    interpolate the spheres are drawn between the last two ticks, by the
+    fraction of a tick left in the accumulator. F6 and F7 change the
+    framerate only.
+
+    F9 and F8 double and halve speed, up to MAX_SPEED times faster than
+    real time: speed times more ticks are played per frame and only the
+    last one is drawn. Ticking stops for the frame after TICK_BUDGET
+    seconds, so when the machine can't keep up the game runs as fast as it
+    can while the window stays responsive.
+    '''
+    TICK = 1/60
+    MAX_TICKS_PER_FRAME = 5
+    MAX_SPEED = 128
+    TICK_BUDGET = 1/30
+    # more changed rects than that and the whole game is copied to the window
+    MAX_DIRTY_RECTS = 300
+
+    def __init__(self, surface: pygame.Surface, colors, seed=None, record_to=None, profile_to=None, interpolate=True, **game_kwargs):
         super().__init__(surface)
+        self.init_view(colors, interpolate)
+        self.game = Game(colors, seed, **game_kwargs)
+        # the replay is saved to record_to when the screen is closed
+        self.record_to = record_to
+        self.recorder = ReplayRecorder(self.game) if record_to is not None else None
+        # every frame is written to profile_to (.csv or .jsonl), the summary is printed when the screen is closed
+        if profile_to is not None:
+            self.game.profiler = Profiler.open(profile_to)
+
+    def init_view(self, colors, interpolate):
+        '''Everything but the game, for screens that bring their own'''
         self.colors = colors
         self.window_size = self.surface.get_rect().size
         self.visual_debug = False
@@ -83,19 +134,41 @@ class GameScreen(Screen):
         borderx = (self.window_size[0] - self.game_size[0]) / 2
         bordery = (self.window_size[1] - self.game_size[1]) / 2
         self.game_surface_margin = borderx, bordery
-        # self.game = None
-        self.game = Game(colors, seed)
         self.game_surface = pygame.Surface(self.game_size)
+        # black and the rotators, redrawn when the window or the map changes
+        self.arena = pygame.Surface(self.game_size)
+        self.arena_key = None
+        # rects of game_surface drawn over the arena in the last frame
+        self.dirty = []
         self.draw_debug = False
         self.is_paused = False
         self.by_step = False
         self.restart = False
         self.actions = []
+        # seconds of game time not played yet, less than a TICK after every frame
+        self.accumulator = 0.0
+        self.interpolator = Interpolator() if interpolate else None
+        self.speed = 1
+        # ticks played in the last frame
+        self.ticks_per_frame = 0
+        # set by GameScreen when it records
+        self.recorder = None
+
+    def clean_up(self):
+        if self.recorder is not None:
+            self.recorder.save(self.record_to)
+        self.game.bot_runner.close()
+        if self.game.profiler is not None:
+            self.game.profiler.close()
+            print(self.game.profiler.summary())
 
     def on_window_size_changed(self, size):
         super().on_window_size_changed(size)
         self.game_size = inscribed_rectangle_dimensions(*self.window_size)
         self.game_surface = pygame.Surface(self.game_size)
+        self.arena_key = None
+        # the sprites are for the old scale
+        render_cache.clear()
         borderx = (self.window_size[0] - self.game_size[0]) / 2
         bordery = (self.window_size[1] - self.game_size[1]) / 2
         self.game_surface_margin = borderx, bordery
@@ -120,29 +193,234 @@ class GameScreen(Screen):
                 self.framerate *= 1.2
             elif event.key == pygame.K_F7:
                 self.framerate /= 1.2
+            elif event.key == pygame.K_F8:
+                self.speed = max(self.speed // 2, 1)
+                if self.speed == 1 and self.interpolator is not None:
+                    # recorded before turbo
+                    self.interpolator.clear()
+            elif event.key == pygame.K_F9:
+                self.speed = min(self.speed * 2, self.MAX_SPEED)
+
+    def caption(self, fps):
+        caption = super().caption(fps)
+        if self.speed != 1:
+            caption += f' | speed x{self.speed:g}, {self.ticks_per_frame} ticks per frame'
+        return caption
+
+    def draw_state(self, state, profiler=None):
+        '''Draws the state into the window, returns the window rects that changed or None for all of it
+
+        Only the rects drawn in the last frame are restored from the arena, and
+        only those and the ones drawn now are copied to the window.
+        '''
+        arena_key = self.game_size, [(i.center.x, i.center.y, i.radius) for i in state.rotators]
+        full_redraw = self.full_redraw or self.draw_debug or self.visual_debug
+        if arena_key != self.arena_key:
+            self.arena = pygame.Surface(self.game_size)
+            draw_arena(self.arena, state, self.game_size)
+            self.arena_key = arena_key
+            full_redraw = True
+        if full_redraw or len(self.dirty) > self.MAX_DIRTY_RECTS:
+            self.game_surface.blit(self.arena, (0, 0))
+        else:
+            self.game_surface.blits([(self.arena, rect, rect) for rect in self.dirty], doreturn=False)
+        rects = draw_game(self.game_surface, state, self.game_size, profiler, rotators=False)
+        if self.draw_debug:
+            self.game.draw_debug(self.game_surface)
+        changed = self.dirty + rects
+        self.dirty = rects
+        # the window is kept from now on, see Screen.main
+        self.full_redraw = self.visual_debug
+        if full_redraw or len(changed) > self.MAX_DIRTY_RECTS:
+            self.surface.blit(self.game_surface, self.game_surface_margin)
+            return None
+        margin = int(self.game_surface_margin[0]), int(self.game_surface_margin[1])
+        window_rects = [rect.move(margin) for rect in changed]
+        self.surface.blits([(self.game_surface, window_rect, rect) for window_rect, rect in zip(window_rects, changed)], doreturn=False)
+        return window_rects
+
+    def tick(self):
+        '''Plays one TICK of the game'''
+        if self.interpolator is not None and self.speed == 1:
+            self.interpolator.record(self.game.get_front_state())
+        self.game.process_actions(self.actions)
+        self.game.update(self.TICK)
+        self.actions = []
+
+    def advance(self, time_delta):
+        '''Plays the ticks that fit in the time since the last frame, or one if stepping'''
+        self.ticks_per_frame = 0
+        if self.by_step:
+            self.tick()
+            self.ticks_per_frame = 1
+            self.by_step = False
+        elif not self.is_paused:
+            self.accumulator = min(self.accumulator + time_delta * self.speed, self.MAX_TICKS_PER_FRAME * self.speed * self.TICK)
+            deadline = time.perf_counter() + self.TICK_BUDGET
+            while self.accumulator >= self.TICK:
+                self.tick()
+                self.ticks_per_frame += 1
+                self.accumulator -= self.TICK
+                if time.perf_counter() > deadline:
+                    # the rest is dropped, not caught up with later
+                    self.accumulator %= self.TICK
+                    break
+
+    def get_state_to_draw(self):
+        state = self.game.get_front_state()
+        if self.interpolator is not None and self.speed == 1:
+            state = self.interpolator.state(state, self.accumulator / self.TICK)
+        return state
 
     def update(self, time_delta):
-            self.game_surface.fill(pygame.Color('#000000'))
             if self.game is not None:
                 if self.restart:
-                    self.game.restart_round()
+                    if self.recorder is not None:
+                        self.recorder.restart_round()
+                    else:
+                        self.game.restart_round()
                     self.restart = False
-                if not self.is_paused or self.by_step:
-                    self.game.process_actions(self.actions)
-                    self.game.update(1/60)
-                    self.actions = []
-                    self.by_step = False
-
-                state = self.game.get_front_state()
-                draw_game(self.game_surface, state, self.game_size)
-                if self.draw_debug:
-                    self.game.draw_debug(self.game_surface)
-            self.surface.blit(self.game_surface, self.game_surface_margin)
+                self.advance(time_delta)
+
+                profiler = self.game.profiler
+                if profiler is not None: profiler.start()
+                state = self.get_state_to_draw()
+                if profiler is not None: profiler.lap('get_front_state')
+                return self.draw_state(state, profiler)
     # finally:
     #     if game is not None:
     #         game.exit()
 
 
+class ReplayScreen(GameScreen):
+    '''Shows a Replay, F2 pauses and F3 steps like in GameScreen
+
+    Left and right arrows seek 10 seconds back and forth, page up and page
+    down jump to the previous and next round. The players' keys and F5 do
+    nothing, the presses and restarts come from the replay.
+    '''
+    def __init__(self, surface: pygame.Surface, replay: Replay):
+        Screen.__init__(self, surface)
+        self.init_view(replay.colors(), interpolate=True)
+        self.player = ReplayPlayer(replay)
+        self.game = self.player.game
+        self.TICK = replay.time_delta
+
+    def process_events(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key in self.colors or event.key == pygame.K_F5:
+                # the presses and restarts are in the replay
+                return
+            seconds = round(10 / self.player.replay.time_delta)
+            if event.key == pygame.K_LEFT:
+                self.player.seek(self.player.frame - seconds)
+            elif event.key == pygame.K_RIGHT:
+                self.player.seek(self.player.frame + seconds)
+            elif event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                keyframes = self.player.replay.keyframes
+                current = max((keyframe.round for keyframe in keyframes if keyframe.frame <= self.player.frame), default=0)
+                target = current - 1 if event.key == pygame.K_PAGEUP else current + 1
+                if any(keyframe.round == target for keyframe in keyframes):
+                    self.player.seek_round(target)
+        super().process_events(event)
+
+    def tick(self):
+        if self.player.is_finished():
+            self.is_running = False
+            return
+        if self.interpolator is not None and self.speed == 1:
+            self.interpolator.record(self.game.get_front_state())
+        self.player.step()
+
+    def update(self, time_delta):
+        self.advance(time_delta)
+        return self.draw_state(self.get_state_to_draw())
+
+
+class LockstepScreen(GameScreen):
+    '''Shows the game of a LockstepClient whose network runs on loop in another thread
+
+    keys press for the players of the client, in the order of its seats.
+    The frames are played as they arrive, the server decides about pausing,
+    restarts and speed.
+    '''
+    # frames waiting for more than that are played at once, the game lags behind the server less
+    BUFFER = 2
+
+    def __init__(self, surface: pygame.Surface, client: LockstepClient, loop: asyncio.AbstractEventLoop, keys: list[int], interpolate=True):
+        self.client = client
+        self.loop = loop
+        self.keys = keys
+        Screen.__init__(self, surface)
+        self.init_view(client.player.replay.colors(), interpolate=interpolate)
+        self.game = client.game
+
+    def clean_up(self):
+        super().clean_up()
+        self.loop.call_soon_threadsafe(self.client.writer.close)
+
+    def process_events(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key in self.keys:
+                self.loop.call_soon_threadsafe(self.client.press, self.keys.index(event.key))
+                return
+            if event.key in (pygame.K_F2, pygame.K_F3, pygame.K_F5, pygame.K_F8, pygame.K_F9):
+                return
+        super().process_events(event)
+
+    def caption(self, fps):
+        caption = super().caption(fps)
+        if not self.client.connected:
+            caption += ' | disconnected'
+        return caption
+
+    def tick(self):
+        if not self.client.frames:
+            return
+        if self.interpolator is not None:
+            self.interpolator.record(self.game.get_front_state())
+        self.client.step()
+
+    def update(self, time_delta):
+        self.advance(time_delta)
+        while len(self.client.frames) > self.BUFFER:
+            self.tick()
+        return self.draw_state(self.get_state_to_draw())
+
+
+class StreamScreen(Screen):
+    '''Draws the states of a state stream, messages holds the ones not decoded yet
+
+    Another thread appends the messages (see back/state_stream.py), every
+    frame decodes all of them and draws the last state.
+    '''
+    def __init__(self, surface: pygame.Surface, messages: deque):
+        super().__init__(surface)
+        self.messages = messages
+        self.decoder = StateDecoder()
+        self.state = None
+        self.game_size = inscribed_rectangle_dimensions(*self.window_size)
+        self.game_surface = pygame.Surface(self.game_size)
+
+    def on_window_size_changed(self, size):
+        super().on_window_size_changed(size)
+        self.game_size = inscribed_rectangle_dimensions(*self.window_size)
+        self.game_surface = pygame.Surface(self.game_size)
+        render_cache.clear()
+
+    def update(self, time_delta):
+        while self.messages:
+            state = self.decoder.decode(self.messages.popleft())
+            if state is not None:
+                self.state = state
+        if self.state is None:
+            return
+        draw_arena(self.game_surface, self.state, self.game_size)
+        draw_game(self.game_surface, self.state, self.game_size, rotators=False)
+        margin = (self.window_size[0] - self.game_size[0]) / 2, (self.window_size[1] - self.game_size[1]) / 2
+        self.surface.blit(self.game_surface, margin)
+
+
 class PickColorScreen(Screen):
     MIN_PLAYERS = 1
     def __init__(self, surface: pygame.Surface, draw_bots_buttons=True):
@@ -188,9 +466,10 @@ class PickColorScreen(Screen):
                 self.key_team_iter_map[key] = iter(Team)
 
     def add_bot(self, BotClass):
-        if self.num_bots == 12: return
+        if self.num_bots == len(BotKeys): return
         bot_enum = list(BotKeys)[self.num_bots]
         team = self.find_available_team(bot_enum)
+        if team is None: return
         name = f'{BotClass.__name__} {self.num_bots+1}'
         self.add_player(bot_enum, team, name, BotClass)
         self.num_bots += 1
@@ -236,5 +515,5 @@ class PickColorScreen(Screen):
         self.surface.blit(surf2, (30, size[1] - 30 - textsize2[1]))
         for key, (team, name, BotClass_or_None) in self.key_map.items():
             i = self.order.index(key)
-            pos = calculate_players_leaderboard_positions(size, i)
-            draw_player_leaderboard(self.surface, pos, name, team.value)
+            pos = calculate_players_leaderboard_positions(size, i, len(self.order))
+            draw_player_leaderboard(self.surface, pos, name, team.value, leaderboard_circle_size(size, len(self.order)))
@@ -0,0 +1,158 @@
+'''Spectating a game without simulating it, see back/state_stream.py
+
+    python stream_state.py serve 649766108              # the bots of battle_the_bots play, port 7778
+    python stream_state.py watch localhost              # as many as you like
+    python stream_state.py serve --pipe | python stream_state.py watch -
+    python stream_state.py --check 649766108            # sizes and how close the decoded states are
+'''
+from collections import deque
+import argparse
+import asyncio
+import io
+import os
+import pickle
+import random
+import socket
+import sys
+import threading
+import time
+
+# stdout can be the stream, pygame greets there on import otherwise
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+from back import Game, GameStage
+from back.state_stream import StateEncoder, StateDecoder, StateBroadcaster, write_message, read_message, QUANTUM
+from battle_the_bots import colors
+
+PORT = 7778
+
+def new_game(seed) -> Game:
+    # RandomBot draws from the global random, like in battle_the_bots
+    random.seed(seed)
+    return Game(colors, seed)
+
+async def serve(args):
+    game = new_game(args.seed)
+    broadcaster = StateBroadcaster(StateEncoder(game))
+    listener = await broadcaster.start(args.host, args.port)
+    print(f'streaming on {args.host}:{args.port}')
+    loop = asyncio.get_running_loop()
+    next_time = loop.time()
+    try:
+        while True:
+            game.update(1 / 60)
+            broadcaster.step()
+            next_time += 1 / 60
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+    finally:
+        broadcaster.close()
+        listener.close()
+        game.bot_runner.close()
+
+def serve_pipe(args):
+    game = new_game(args.seed)
+    encoder = StateEncoder(game)
+    out = sys.stdout.buffer
+    next_time = time.perf_counter()
+    try:
+        while True:
+            game.update(1 / 60)
+            write_message(out, encoder.encode())
+            out.flush()
+            next_time += 1 / 60
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+    except BrokenPipeError:
+        pass
+    finally:
+        game.bot_runner.close()
+
+def watch(args):
+    if args.host == '-':
+        file = sys.stdin.buffer
+    else:
+        file = socket.create_connection((args.host, args.port)).makefile('rb')
+    messages = deque()
+
+    def receive():
+        while (data := read_message(file)) is not None:
+            messages.append(data)
+    threading.Thread(target=receive, daemon=True).start()
+
+    pygame.init()
+    pygame.display.set_caption('Orbits clone')
+    window_surface = pygame.display.set_mode((1200, 600), pygame.RESIZABLE)
+    from screens import StreamScreen
+    StreamScreen(window_surface, messages).main()
+
+def check(args):
+    '''Streams a game through a file and compares every decoded state with the game's'''
+    game = new_game(args.seed)
+    encoder = StateEncoder(game)
+    decoder = StateDecoder()
+    stream = io.BytesIO()
+    full_sizes, delta_sizes, pickled = [], [], []
+    error = 0.0
+    frames = 0
+    start_time = time.perf_counter()
+    while game.stage != GameStage.END_SCREEN and frames < args.frames:
+        game.update(1 / 60)
+        frames += 1
+        data = encoder.encode()
+        (full_sizes if data[0] == 0 else delta_sizes).append(len(data))
+        position = stream.tell()
+        write_message(stream, data)
+        stream.seek(position)
+        state = decoder.decode(read_message(stream))
+        expected = game.get_front_state()
+        if frames % 600 == 1:
+            pickled.append(len(pickle.dumps((expected.player_spheres, list(expected.active_spheres), list(expected.inactive_spheres), list(expected.bursts)))))
+
+        def spheres(state):
+            found = []
+            for p in state.player_spheres:
+                found += [p] + p.trail + list(p.queue_to_trail) + list(p.attacking_spheres)
+            return found + list(state.active_spheres) + list(state.inactive_spheres) + list(state.bursts)
+        decoded, original = spheres(state), spheres(expected)
+        assert len(decoded) == len(original), f'frame {frames}: {len(decoded)} spheres instead of {len(original)}'
+        assert [p.alive for p in state.player_spheres] == [p.alive for p in expected.player_spheres]
+        assert (state.stage, state.how_to_win_text, state.someone_won) == (expected.stage, expected.how_to_win_text, expected.someone_won)
+        for a, b in zip(decoded, original):
+            assert a.color == tuple(b.color)[:3], f'frame {frames}: color {a.color} instead of {b.color}'
+            error = max(error, abs(a.center.x - b.center.x), abs(a.center.y - b.center.y), abs(a.radius - b.radius))
+    seconds = time.perf_counter() - start_time
+    game.bot_runner.close()
+    print(f'{frames} frames streamed and decoded in {seconds:.1f} s, largest error {error * QUANTUM:.2f}/{QUANTUM} of a unit')
+    print(f'{sum(delta_sizes) / len(delta_sizes):.0f} bytes per delta, {sum(full_sizes) / len(full_sizes):.0f} per full message '
+          f'({len(full_sizes)}), {stream.tell() / frames:.0f} per frame in total; '
+          f'the pickled spheres are {sum(pickled) / len(pickled):.0f} bytes')
+
+def main():
+    parser = argparse.ArgumentParser(description='Streams what is drawn of a game to spectators')
+    parser.add_argument('mode', nargs='?', choices=['serve', 'watch'])
+    parser.add_argument('target', nargs='?', default=None,
+                        help='serve: the seed, watch: the host or - for stdin')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--pipe', action='store_true', help='serve: write the stream to stdout')
+    parser.add_argument('--check', action='store_true', help='stream a game through memory and compare what is decoded')
+    parser.add_argument('--frames', type=int, default=20000, help='--check: at most that many frames')
+    args = parser.parse_args()
+
+    if args.check or args.mode == 'serve':
+        args.seed = int(args.target) if args.target is not None else 649766108
+        args.host = 'localhost'
+    if args.check:
+        check(args)
+    elif args.mode == 'serve':
+        if args.pipe:
+            serve_pipe(args)
+        else:
+            asyncio.run(serve(args))
+    elif args.mode == 'watch':
+        args.host = args.target or 'localhost'
+        watch(args)
+    else:
+        parser.error('give serve, watch or --check')
+
+if __name__ == '__main__':
+    main()
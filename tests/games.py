@@ -0,0 +1,32 @@
+'''Small seeded games for the tests
+
+The players are humans whose presses come from a seeded random.Random,
+so playing the same frames again presses the same buttons (bots draw from
+the global random, which a restored game doesn't get back).
+'''
+import random
+
+from back import Game, BotKeys, Team
+
+SEED = 787251266
+
+def make_colors(players: int = 4, bots: tuple = ()) -> dict:
+    '''players humans, then a player for every bot class in bots'''
+    colors = {}
+    for i, (key, team) in enumerate(zip(BotKeys, Team)):
+        if i < players:
+            colors[key] = (team, f'Player {i}', None)
+        elif i < players + len(bots):
+            BotClass = bots[i - players]
+            colors[key] = (team, f'{BotClass.__name__} {i}', BotClass)
+    return colors
+
+def make_game(players: int = 4, seed: int = SEED, **game_kwargs) -> Game:
+    return Game(make_colors(players), seed, **game_kwargs)
+
+def play(game: Game, frames: int, presses_seed: int = 0):
+    '''Plays frames frames, every player presses about 3 times a second'''
+    rng = random.Random(presses_seed)
+    for _ in range(frames):
+        game.process_actions([key for key in game.keys_list if rng.random() < 1 / 20])
+        game.update(1 / 60)
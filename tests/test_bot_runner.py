@@ -0,0 +1,40 @@
+# user-012
+import time
+
+from back import Game
+from bots import Bot
+
+from .games import SEED, make_colors
+
+class SlowBot(Bot):
+    '''Presses every frame, but takes longer than the deadline every other frame'''
+    reads_state = False
+
+    def __init__(self, player_sphere):
+        super().__init__(player_sphere)
+        self.calls = 0
+
+    def get_action(self, state, time_delta):
+        self.calls += 1
+        if self.calls % 2 == 0:
+            time.sleep(0.01)
+        return True
+
+def test_answers_after_the_deadline_are_dropped():
+    game = Game(make_colors(1, (SlowBot,)), SEED, bot_deadline=0.005)
+    runner = game.bot_runner
+    bot = game.player_spheres[1].bot
+    pressed = [runner.ask_bots(1 / 60) for _ in range(10)]
+    assert pressed == [[1], []] * 5
+    calls, mean, p99, timeouts = runner.stats[1].summary()
+    assert (calls, timeouts) == (10, 5)
+    assert p99 >= 0.01
+    assert bot.calls == 10
+    # the human isn't timed
+    assert runner.stats[0].calls == 0
+
+def test_no_deadline_keeps_every_answer():
+    game = Game(make_colors(1, (SlowBot,)), SEED)
+    runner = game.bot_runner
+    assert [runner.ask_bots(1 / 60) for _ in range(4)] == [[1]] * 4
+    assert runner.stats[1].timeouts == 0
@@ -0,0 +1,9 @@
+# user-002
+from .games import make_game, play
+
+def test_grid_plays_the_same_game_as_brute_force():
+    for players in 4, 12:
+        games = [make_game(players, broad_phase=broad_phase) for broad_phase in (True, False)]
+        for game in games:
+            play(game, 3000)
+        assert games[0].snapshot().to_bytes() == games[1].snapshot().to_bytes()
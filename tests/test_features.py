@@ -0,0 +1,41 @@
+# user-011
+import math
+
+import numpy as np
+
+from .games import make_game, play
+
+def test_features_match_the_spheres():
+    game = make_game(12)
+    play(game, 1200)
+    state = game.get_state()
+    features = state.features
+    assert state.features is features
+    players = state.player_spheres
+    assert features.alive.tolist() == [p.alive for p in players]
+    assert features.in_rotator.tolist() == [p.is_in_rotator(state.rotators) for p in players]
+
+    lying = list(state.active_spheres) + list(state.inactive_spheres)
+    assert len(lying) > 3
+    indices, distances = features.nearest_spheres(3)
+    assert features.nearest_spheres(3)[0] is indices
+    for i, p in enumerate(players):
+        expected = sorted(math.hypot(p.center.x - s.center.x, p.center.y - s.center.y) for s in lying)[:3]
+        assert np.allclose(distances[i], expected)
+        assert np.allclose([math.dist(p.center, lying[j].center) for j in indices[i]], expected)
+
+    # a player is never threatened by their own trail
+    times = features.threat_times
+    owners = features.threat_owners
+    assert times.shape == (len(players), len(owners))
+    for i in range(len(players)):
+        assert np.isinf(times[i, owners == i]).all()
+    assert np.array_equal(features.time_to_collision, times.min(axis=1, initial=np.inf))
+
+def test_nearest_spheres_is_cut_to_the_spheres_there_are():
+    game = make_game()
+    play(game, 60)
+    features = game.get_state().features
+    indices, distances = features.nearest_spheres(10 ** 6)
+    assert indices.shape == distances.shape == (4, len(features.spheres))
+    assert (np.diff(distances, axis=1) >= 0).all()
@@ -0,0 +1,45 @@
+# user-022
+import asyncio
+import random
+
+from back.lockstep import Link, LockstepServer, LockstepClient
+from back.snapshot import fingerprint
+
+from .games import SEED, make_colors
+
+FRAMES = 300
+
+async def play_over_localhost(latency: float, jitter: float):
+    '''Two clients pressing at random over a slow link, like net_play.py --check'''
+    server = LockstepServer(make_colors(2), SEED, link=Link(latency, jitter, SEED))
+    listener = await server.start('localhost', 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = []
+    for index in range(2):
+        client = LockstepClient(1, Link(latency, jitter, SEED + index + 1))
+        await client.connect('localhost', port)
+        clients.append(client)
+
+    async def play(client: LockstepClient, presses: random.Random):
+        receiving = asyncio.create_task(client.receive())
+        while client.connected or client.frames:
+            while client.step():
+                if presses.random() < 1 / 20:
+                    client.press(0)
+            await asyncio.sleep(1 / 240)
+        await receiving
+
+    playing = [asyncio.create_task(play(client, random.Random(SEED + index))) for index, client in enumerate(clients)]
+    # faster than real time, the link keeps presses late all the same
+    await server.run(FRAMES, speed=4)
+    server.close()
+    listener.close()
+    await asyncio.gather(*playing)
+    return server, clients
+
+def test_clients_end_up_where_the_server_is():
+    server, clients = asyncio.run(play_over_localhost(0.03, 0.01))
+    assert server.bytes_received > 0
+    for client in clients:
+        assert client.player.frame == FRAMES
+        assert fingerprint(client.game) == fingerprint(server.game)
@@ -0,0 +1,19 @@
+# user-001
+from .games import make_game, play
+
+def test_plays_the_same_game_as_the_objects():
+    for players in 4, 12:
+        games = [make_game(players, engine=engine) for engine in ('objects', 'numpy')]
+        for game in games:
+            play(game, 3000)
+        assert games[0].snapshot().to_bytes() == games[1].snapshot().to_bytes()
+
+def test_restore_is_bit_identical():
+    game = make_game(engine='numpy')
+    play(game, 1500)
+    snapshot = game.snapshot()
+    play(game, 600, presses_seed=1)
+    after = game.snapshot().to_bytes()
+    game.restore(snapshot)
+    play(game, 600, presses_seed=1)
+    assert game.snapshot().to_bytes() == after
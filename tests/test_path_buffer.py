@@ -0,0 +1,61 @@
+from collections import deque
+
+from back.core import PathBuffer
+
+def assert_same(path: PathBuffer, expected: deque):
+    assert len(path) == len(expected)
+    assert [tuple(point) for point in path] == list(expected)
+
+def test_appendleft_wraps_around_like_a_deque():
+    path = PathBuffer(5, capacity=5)
+    expected = deque(maxlen=5)
+    for i in range(23):
+        path.appendleft((i, -i))
+        expected.appendleft((i, -i))
+        assert_same(path, expected)
+    assert path.head != 0
+    assert tuple(path[0]) == (22, -22)
+    assert tuple(path[-1]) == (18, -18)
+
+def test_append_wraps_around_like_a_deque():
+    path = PathBuffer(4, capacity=4)
+    expected = deque(maxlen=4)
+    for i in range(11):
+        path.append((i, i))
+        expected.append((i, i))
+        assert_same(path, expected)
+
+def test_grows_when_wrapped():
+    path = PathBuffer(100, capacity=4)
+    expected = deque(maxlen=100)
+    for i in range(3):
+        path.appendleft((i, 0))
+        expected.appendleft((i, 0))
+    # the head has wrapped to the end of the arrays before they grow
+    for i in range(3, 40):
+        path.appendleft((i, 0))
+        expected.appendleft((i, 0))
+        assert_same(path, expected)
+    assert len(path.xs) >= 40
+
+def test_lowering_maxlen_keeps_the_oldest():
+    path = PathBuffer(8, capacity=8)
+    expected = deque(maxlen=8)
+    for i in range(13):
+        path.appendleft((i, 0))
+        expected.appendleft((i, 0))
+    path.maxlen = 3
+    expected = deque(expected, maxlen=3)
+    assert_same(path, expected)
+    path.appendleft((13, 0))
+    expected.appendleft((13, 0))
+    assert_same(path, expected)
+
+def test_copy_is_independent():
+    path = PathBuffer(4, capacity=4)
+    for i in range(6):
+        path.appendleft((i, 0))
+    copy = path.copy()
+    path.appendleft((6, 0))
+    assert [point.x for point in copy] == [5, 4, 3, 2]
+    assert [point.x for point in path] == [6, 5, 4, 3]
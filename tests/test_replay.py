@@ -0,0 +1,53 @@
+import pytest
+
+from back.replay import MAGIC, VERSION, Replay, ReplayRecorder, ReplayPlayer
+from back.snapshot import fingerprint
+
+from .games import make_game, play
+
+FRAMES = 3000
+
+def record():
+    '''A replay of FRAMES frames, with the fingerprints of the game every 250 frames'''
+    game = make_game()
+    recorder = ReplayRecorder(game, keyframe_interval=600)
+    fingerprints = {}
+    for frame in range(250, FRAMES + 1, 250):
+        # the game calls recorder.end_frame()
+        play(game, 250, presses_seed=frame)
+        fingerprints[frame] = fingerprint(game)
+    return recorder.replay, fingerprints
+
+def test_to_bytes_round_trip():
+    replay, _ = record()
+    loaded = Replay.from_bytes(replay.to_bytes())
+    assert (loaded.seed, loaded.time_delta, loaded.roster, loaded.frames, loaded.events) == \
+        (replay.seed, replay.time_delta, replay.roster, replay.frames, replay.events)
+    assert [(k.frame, k.round, k.data) for k in loaded.keyframes] == [(k.frame, k.round, k.data) for k in replay.keyframes]
+    assert loaded.to_bytes() == replay.to_bytes()
+
+def test_playing_back_gives_the_same_game():
+    replay, fingerprints = record()
+    player = ReplayPlayer(Replay.from_bytes(replay.to_bytes()))
+    while not player.is_finished():
+        player.step()
+        if player.frame in fingerprints:
+            assert fingerprint(player.game) == fingerprints[player.frame], player.frame
+
+def test_seek():
+    replay, fingerprints = record()
+    assert len(replay.keyframes) > 1
+    player = ReplayPlayer(Replay.from_bytes(replay.to_bytes()))
+    # backwards through the keyframes, then forwards from the start
+    for frame in sorted(fingerprints, reverse=True) + [0] + sorted(fingerprints):
+        player.seek(frame)
+        assert player.frame == frame
+        if frame:
+            assert fingerprint(player.game) == fingerprints[frame], frame
+
+def test_only_the_current_version_loads():
+    replay, _ = record()
+    data = bytearray(replay.to_bytes())
+    data[len(MAGIC)] = VERSION - 1
+    with pytest.raises(ValueError):
+        Replay.from_bytes(bytes(data))
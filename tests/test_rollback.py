@@ -0,0 +1,52 @@
+# user-024
+import random
+
+import pytest
+
+from back import Game
+from back.rollback import RollbackGame
+from back.snapshot import fingerprint
+from bots import DoNothingBot
+
+from .games import SEED, make_colors, make_game
+
+FRAMES = 1500
+LATE = 8
+
+def presses(players: int):
+    '''frame -> players pressing in it'''
+    rng = random.Random(SEED)
+    return {frame: [index for index in range(players) if rng.random() < 1 / 20] for frame in range(FRAMES)}
+
+def test_late_presses_end_in_the_game_played_in_time():
+    inputs = presses(4)
+    game = make_game()
+    for frame in range(FRAMES):
+        game.process_actions([game.keys_list[index] for index in inputs[frame]])
+        game.update(1 / 60)
+
+    # the presses of players 1-3 arrive up to LATE frames late
+    rollback = RollbackGame(make_game(), LATE + 1)
+    rng = random.Random(SEED)
+    arriving: dict[int, list[tuple[int, int]]] = {}
+    for frame in range(FRAMES):
+        for index in inputs[frame]:
+            late = 0 if index == 0 else rng.randint(0, LATE)
+            arriving.setdefault(frame + late, []).append((frame, index))
+    for frame in range(FRAMES):
+        for made_in, index in arriving.get(frame, []):
+            rollback.add_input(made_in, index)
+        rollback.step()
+    assert rollback.rollbacks > 0
+    assert fingerprint(rollback.game) == fingerprint(game)
+
+def test_inputs_too_late_are_refused():
+    rollback = RollbackGame(make_game(), LATE)
+    for _ in range(3 * LATE):
+        rollback.step()
+    with pytest.raises(ValueError):
+        rollback.add_input(rollback.frame - LATE - 1, 0)
+
+def test_games_with_bots_are_refused():
+    with pytest.raises(ValueError):
+        RollbackGame(Game(make_colors(2, (DoNothingBot,)), SEED))
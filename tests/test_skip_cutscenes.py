@@ -0,0 +1,13 @@
+# user-021
+from back.snapshot import fingerprint
+
+from .games import make_game, play
+
+def test_skipping_cutscenes_gives_the_same_scores():
+    games = [make_game(skip_cutscenes=skip) for skip in (False, True)]
+    for game in games:
+        # a round ends after about 4000 frames
+        play(game, 6000)
+    assert any(games[0].scores)
+    assert games[0].scores == games[1].scores
+    assert fingerprint(games[0]) == fingerprint(games[1])
@@ -0,0 +1,49 @@
+from back import GameSnapshot
+from back.game import RNG_CHECKPOINT_INTERVAL
+
+from .games import make_game, play
+
+def test_snapshot_bytes_round_trip():
+    game = make_game()
+    for _ in range(10):
+        play(game, 397)
+        for random_state in True, False:
+            data = game.snapshot(random_state=random_state).to_bytes()
+            assert GameSnapshot.from_bytes(data).to_bytes() == data
+
+def test_restore_is_bit_identical():
+    game = make_game()
+    play(game, 1500)
+    snapshot = game.snapshot()
+    data = snapshot.to_bytes()
+    play(game, 600, presses_seed=1)
+    after = game.snapshot().to_bytes()
+
+    game.restore(snapshot)
+    assert game.snapshot().to_bytes() == data
+    play(game, 600, presses_seed=1)
+    assert game.snapshot().to_bytes() == after
+
+    # from bytes and without the RNG state, which is replayed from the stream
+    game.restore(GameSnapshot.from_bytes(data))
+    game.restore(GameSnapshot.from_bytes(game.snapshot(random_state=False).to_bytes()))
+    play(game, 600, presses_seed=1)
+    assert game.snapshot().to_bytes() == after
+
+def test_clone_plays_the_same_game():
+    game = make_game()
+    play(game, 900)
+    clone = game.clone()
+    play(game, 600, presses_seed=1)
+    play(clone, 600, presses_seed=1)
+    assert clone.snapshot().to_bytes() == game.snapshot().to_bytes()
+
+def test_clone_has_its_own_rng_checkpoints():
+    game = make_game()
+    play(game, 300)
+    checkpoints = dict(game.rng_checkpoints)
+    clone = game.clone()
+    # going ahead in the stream records checkpoints
+    clone.set_seed(clone.seed, clone.total_uniforms + 3 * RNG_CHECKPOINT_INTERVAL)
+    assert len(clone.rng_checkpoints) > len(checkpoints)
+    assert game.rng_checkpoints == checkpoints
@@ -0,0 +1,69 @@
+import pytest
+from pygame import Vector2
+
+from back import Sphere, SpherePool
+
+def make_spheres(count):
+    return [Sphere(Vector2(i, 0), Vector2(0, 0), 1) for i in range(count)]
+
+def test_remove_keeps_order():
+    spheres = make_spheres(6)
+    pool = SpherePool(spheres)
+    pool.remove(spheres[1])
+    pool.remove(spheres[4])
+    assert list(pool) == [spheres[0], spheres[2], spheres[3], spheres[5]]
+    assert len(pool) == 4
+
+def test_compact_keeps_order_and_slots():
+    spheres = make_spheres(6)
+    pool = SpherePool(spheres)
+    pool.remove(spheres[0])
+    pool.remove(spheres[3])
+    pool.compact()
+    assert pool.slots == [spheres[1], spheres[2], spheres[4], spheres[5]]
+    assert [sphere.slot for sphere in pool] == [0, 1, 2, 3]
+    assert pool.holes == 0
+    # removing after compact() finds the sphere at its new slot
+    pool.remove(spheres[4])
+    pool.append(spheres[3])
+    pool.compact()
+    assert list(pool) == [spheres[1], spheres[2], spheres[5], spheres[3]]
+
+def test_remove_while_iterating():
+    spheres = make_spheres(5)
+    pool = SpherePool(spheres)
+    extra = make_spheres(1)[0]
+    seen = []
+    for sphere in pool:
+        seen.append(sphere)
+        if sphere is spheres[1]:
+            pool.remove(spheres[1])
+            pool.remove(spheres[2])
+            pool.append(extra)
+    assert seen == [spheres[0], spheres[1], spheres[3], spheres[4], extra]
+
+def test_move_to_another_pool():
+    spheres = make_spheres(3)
+    pool = SpherePool(spheres)
+    other = SpherePool(make_spheres(2))
+    pool.remove(spheres[0])
+    assert spheres[0].slot == -1
+    other.append(spheres[0])
+    assert list(pool) == spheres[1:]
+    assert spheres[0].slot == 2
+    other.remove(spheres[0])
+
+def test_remove_what_is_not_in_the_pool():
+    spheres = make_spheres(3)
+    pool = SpherePool(spheres[:2])
+    with pytest.raises(ValueError):
+        pool.remove(spheres[2])
+    pool.remove(spheres[0])
+    with pytest.raises(ValueError):
+        pool.remove(spheres[0])
+
+def test_iterate_only_visits_the_given_spheres_in_order():
+    spheres = make_spheres(6)
+    pool = SpherePool(spheres)
+    pool.remove(spheres[2])
+    assert list(pool.iterate([spheres[4], spheres[2], spheres[0]])) == [spheres[0], spheres[4]]
@@ -0,0 +1,41 @@
+# user-023
+import io
+import random
+
+from back.state_stream import StateEncoder, StateDecoder, write_message, read_message, QUANTUM
+
+from .games import make_game
+
+def spheres(state):
+    found = []
+    for p in state.player_spheres:
+        found += [p] + p.trail + list(p.queue_to_trail) + list(p.attacking_spheres)
+    return found + list(state.active_spheres) + list(state.inactive_spheres) + list(state.bursts)
+
+def test_decoded_states_match_the_game():
+    '''Streams a game through memory like stream_state.py --check'''
+    game = make_game()
+    encoder = StateEncoder(game)
+    decoder = StateDecoder()
+    stream = io.BytesIO()
+    rng = random.Random(0)
+    deltas = 0
+    for frame in range(1500):
+        game.process_actions([key for key in game.keys_list if rng.random() < 1 / 20])
+        game.update(1 / 60)
+        data = encoder.encode()
+        deltas += data[0] != 0
+        position = stream.tell()
+        write_message(stream, data)
+        stream.seek(position)
+        state = decoder.decode(read_message(stream))
+        expected = game.get_front_state()
+        assert (state.stage, state.how_to_win_text, state.someone_won) == (expected.stage, expected.how_to_win_text, expected.someone_won)
+        assert [p.alive for p in state.player_spheres] == [p.alive for p in expected.player_spheres]
+        decoded, original = spheres(state), spheres(expected)
+        assert len(decoded) == len(original), f'frame {frame}'
+        for a, b in zip(decoded, original):
+            assert a.color == tuple(b.color)[:3], f'frame {frame}'
+            error = max(abs(a.center.x - b.center.x), abs(a.center.y - b.center.y), abs(a.radius - b.radius))
+            assert error <= 1 / QUANTUM, f'frame {frame}'
+    assert deltas > 0
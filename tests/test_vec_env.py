@@ -0,0 +1,45 @@
+# user-007
+import numpy as np
+
+from back.vec_env import VecEnv, PLAYER_FEATURES
+
+from .games import make_colors
+
+def test_rewards_add_up_to_the_scores():
+    rosters = [make_colors(4), make_colors(3)]
+    env = VecEnv(rosters, seed=0, max_spheres=8)
+    obs = env.reset()
+    assert obs['players'].shape == (2, 4, PLAYER_FEATURES)
+    assert obs['spheres'].shape == (2, 8, 3)
+    assert obs['player_mask'].tolist() == [[True] * 4, [True] * 3 + [False]]
+    scores = [list(game.scores) for game in env.games]
+    rng = np.random.default_rng(0)
+    rounds = 0
+    credited = np.zeros((2, 4))
+    for _ in range(6000):
+        obs, rewards, dones, infos = env.step(rng.random((2, 4)) < 1 / 20)
+        assert not dones.any()
+        credited += rewards
+        for n, game in enumerate(env.games):
+            if game.scores != scores[n]:
+                change = np.subtract(game.scores, scores[n])
+                assert credited[n, :len(change)].tolist() == change.tolist()
+                assert not credited[n, len(change):].any()
+                scores[n] = list(game.scores)
+                credited[n] = 0
+                rounds += 1
+    assert rounds > 0
+    env.close()
+
+def test_workers_step_the_same_games():
+    rosters = [make_colors(2)] * 3
+    envs = [VecEnv(rosters, seed=0, workers=workers) for workers in (1, 2)]
+    results = []
+    for env in envs:
+        env.reset()
+        rng = np.random.default_rng(0)
+        for _ in range(300):
+            obs, rewards, _, _ = env.step(rng.random((3, 2)) < 1 / 20)
+        results.append(obs['players'])
+        env.close()
+    assert np.array_equal(*results)